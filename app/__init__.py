@@ -2,9 +2,7 @@
 
 import os
 import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime
-import markdown # Jinja2フィルター内で使用するため
 import pytz # datetime.now(pytz.utc) を使用するため
 
 from flask import Flask, render_template, url_for, request, current_app, send_from_directory, g
@@ -17,6 +15,7 @@ import config # config モジュールをインポート
 # app.extensions から拡張機能をインポート
 # security, principals, user_datastore を追加
 from app.extensions import db, migrate,  csrf, babel, mail, security, principals, user_datastore
+from app.utils import render_markdown
 # SQLAlchemyUserDatastore を直接インポート
 from flask_security import SQLAlchemyUserDatastore
 # identity_loaded, RoleNeed, UserNeed を直接インポート
@@ -68,15 +67,27 @@ def create_app(config_class=config.Config):
     def debug_user_loading():
         # ログイン試行後のリダイレクト先や、 subsequent requests で呼ばれる
         # current_user のデバッグ
+        # DEBUG が無効な場合は current_user の読み込み (DB へのクエリ) もしない
+        if not app.logger.isEnabledFor(logging.DEBUG):
+            return
         if current_user.is_authenticated:
-            app.logger.debug(f"DEBUG (before_request): current_user is authenticated. ID: {current_user.id}, Email: {current_user.email}, FS_Uniquifier: {current_user.fs_uniquifier}")
+            app.logger.debug("DEBUG (before_request): current_user is authenticated. ID: %s, Email: %s, FS_Uniquifier: %s",
+                             current_user.id, current_user.email, current_user.fs_uniquifier)
         else:
-            app.logger.debug(f"DEBUG (before_request): current_user is NOT authenticated.")
+            app.logger.debug("DEBUG (before_request): current_user is NOT authenticated.")
 
     
 
     # 拡張機能の初期化
+    # SQLite の接続プールの設定 (SQLITE_ENGINE_PROFILE) はエンジンの生成前に反映する
+    from app import db_engine
+    db_engine.configure_engine_options(app)
+    # 読み取り専用レプリカ (SQLALCHEMY_REPLICA_URI) を SQLALCHEMY_BINDS に加える
+    from app import db_routing
+    db_routing.configure_binds(app)
     db.init_app(app)
+    # SQLite の接続ごとのプラグマ (WAL など) を設定
+    db_engine.init_app(app)
     migrate.init_app(app, db)
     # login_manager.init_app(app)
     csrf.init_app(app)
@@ -130,20 +141,9 @@ def create_app(config_class=config.Config):
     # def load_user(user_id):
     #     return db.session.get(User, user_id)
 
-    # ロギングの設定
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/akiomi_blog.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-
-    # stdout へのロギング設定 (Gunicorn などでコンソール出力を見るため)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(logging.INFO)
-    app.logger.addHandler(stream_handler) 
-    app.logger.setLevel(logging.INFO) 
+    # ロギングの設定 (QueueHandler でキューに入れ、ファイル・コンソールへの書き込みはバックグラウンドで行う)
+    from app import logging_setup
+    logging_setup.init_app(app)
     app.logger.info('Akiomi Blog startup')
 
     # コンテキストプロセッサ: 全てのテンプレートで 'current_year' を利用可能にする
@@ -159,17 +159,8 @@ def create_app(config_class=config.Config):
     #     return 'ja'
 
     # MarkdownをHTMLに変換するJinja2フィルターを登録
-    app.jinja_env.filters['markdown'] = lambda text: markdown.markdown( 
-        text,
-        extensions=[
-            'fenced_code',      
-            'tables',           
-            'nl2br',            
-            'sane_lists',       
-            'codehilite',       
-            'extra',            
-        ]
-    )
+    # 投稿本文は Post.body_html にキャッシュされるため、このフィルターはそれ以外の用途向け
+    app.jinja_env.filters['markdown'] = render_markdown
 
     # 各種ブループリントの登録
     app.register_blueprint(home_bp)
@@ -179,13 +170,9 @@ def create_app(config_class=config.Config):
     
 
     # 静的ファイル配信のためのカスタムエンドポイント (uploadsフォルダ用)
-    @app.route('/uploads/images/<path:filename>')
-    def serve_uploaded_images(filename): 
-        return send_from_directory(current_app.config['UPLOAD_IMAGES_DIR'], filename) 
-
-    @app.route('/uploads/thumbnails/<path:filename>')
-    def serve_uploaded_thumbnails(filename): 
-        return send_from_directory(current_app.config['UPLOAD_THUMBNAILS_DIR'], filename) 
+    # 長期キャッシュ・ETag/304・Range と X-Accel-Redirect / X-Sendfile による転送に対応 (app/media.py)
+    from app import media
+    media.init_app(app)
 
 
     # エラーハンドリング (例: 404 Not Found)
@@ -198,6 +185,37 @@ def create_app(config_class=config.Config):
         db.session.rollback()
         return render_template('errors/500.html'), 500
 
+    # 匿名ユーザー向け公開ページのキャッシュと、コミット時の破棄イベントを設定
+    from app import page_cache
+    page_cache.init_app(app)
+
+    # 全文検索索引 (SQLite FTS5) の作成と Post との同期を設定
+    from app import search
+    search.init_app(app)
+
+    # 削除した画像のファイルをコミット後に削除する
+    from app import uploads
+    uploads.init_app(app)
+
+    # 管理ダッシュボードの集計値 (site_stat) を行の追加・削除に合わせて増減させる
+    from app import stats
+    stats.init_app(app)
+
+    # タグ・カテゴリごとの公開済み投稿数 (post_count) を投稿の変更に合わせて増減させる
+    from app import tag_counts
+    tag_counts.init_app(app)
+
+    # 事前計算した関連記事を投稿詳細テンプレートから読み出せるようにする
+    from app import related
+    related.init_app(app)
+
+    # 書き込んだ利用者の読み込みを一定時間プライマリに固定する (レプリカ使用時)
+    db_routing.init_app(app)
+
+    # リクエストごとの処理時間・SQL・テンプレートの計測と Server-Timing ヘッダー (INSTRUMENTATION_ENABLED の場合)
+    from app import instrumentation
+    instrumentation.init_app(app)
+
     # CLI コマンドの登録
     from app import cli 
     app.cli.add_command(cli.init) 
@@ -1,6 +1,7 @@
 # F:\dev\BrogDev\app\admin\routes.py
 
 import os
+import logging
 import uuid
 import pytz 
 import re
@@ -11,9 +12,17 @@ from werkzeug.security import generate_password_hash
 
 from flask import Blueprint, render_template, redirect, url_for,  request, current_app, jsonify, abort ,flash
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload, selectinload
 from app.models import Post, Comment, Category, Tag, Image, User, Role 
 from app.extensions import db
-from app.forms import PostForm, ImageUploadForm, BulkImageUploadForm, DeleteForm, UserEditForm 
+from app.image_api import images_response, serialize_images
+from app.instrumentation import get_request_log, summarize
+from app.listing import AdminListing, comment_listing
+from app.post_bulk import KEEP_CATEGORY, bulk_edit_posts
+from app.queries import post_load_options
+from app.stats import count_live, get_stats
+from app.uploads import create_image_from_upload, ingest_uploads, release_image_files
+from app.forms import PostForm, PostBulkEditForm, ImageUploadForm, BulkImageUploadForm, DeleteForm, UserEditForm 
 from wtforms.validators import Optional, DataRequired 
 from flask_wtf.file import FileAllowed 
 
@@ -84,18 +93,15 @@ def index():
     print(f"DEBUG (admin.index): current_user.is_authenticated = {current_user.is_authenticated}")
     print(f"DEBUG (admin.index): current_user.email = {current_user.email if current_user.is_authenticated else 'Not authenticated'}")
 
-    # 管理ダッシュボードの概要情報を取得
-    total_posts = Post.query.count()
-    published_posts = Post.query.filter_by(is_published=True).count()
-    total_comments = Comment.query.count()
-    total_users = User.query.count()
+    # 管理ダッシュボードの概要情報を取得 (site_stat に保持した集計値を1クエリで読む)
+    site_stats = get_stats()
     
     return render_template('admin/index.html', 
                         title='管理ダッシュボード',
-                        total_posts=total_posts,
-                        published_posts=published_posts,
-                        total_comments=total_comments,
-                        total_users=total_users)
+                        total_posts=site_stats['posts'],
+                        published_posts=site_stats['published_posts'],
+                        total_comments=site_stats['comments'],
+                        total_users=site_stats['users'])
 
 # ヘルパー関数: 許可されたファイル拡張子かどうかをチェック
 def allowed_file(filename):
@@ -115,73 +121,145 @@ def list_posts():
         flash('アクセス権限がありません。', 'danger')
         abort(403) # または redirect(url_for('home.index')) など
 
-    if current_user.has_role('admin'):
-        posts = Post.query.order_by(Post.created_at.desc()).all()
-    else:
-        posts = Post.query.filter_by(posted_by=current_user).order_by(Post.created_at.desc()).all()
-    
+    posts_query = Post.query.options(*post_load_options('admin_list'))
+    is_admin = current_user.has_role('admin')
+    if not is_admin:
+        posts_query = posts_query.filter_by(posted_by=current_user)
+    listing = AdminListing(
+        posts_query,
+        sorts={
+            'created_at': ('作成日', Post.created_at),
+            'updated_at': ('更新日', Post.updated_at),
+            'title': ('タイトル', Post.title),
+        },
+        default_sort='-created_at',
+        statuses={
+            'published': ('公開', Post.is_published == True),
+            'draft': ('下書き', Post.is_published == False),
+        },
+        author_column=Post.user_id if is_admin else None,  # 管理者以外は自分の投稿のみ
+        date_column=Post.created_at,
+    )
+
     csrf_form = DeleteForm()
-    
-    return render_template('posts/list_posts.html', posts=posts, title='投稿管理', csrf_form=csrf_form)
+    bulk_form = PostBulkEditForm(formdata=None)
+    bulk_form.set_category_choices(db.session.query(Category.id, Category.name).order_by(Category.name))
+
+    return render_template('posts/list_posts.html', posts=listing.items, listing=listing, title='投稿管理',
+                           csrf_form=csrf_form, bulk_form=bulk_form)
+
+
+@bp.route('/posts/bulk', methods=['POST'])
+@login_required
+def bulk_edit():
+    # 手動の権限チェック
+    required_roles = ['admin', 'editor', 'poster']
+    if not any(Permission(RoleNeed(role_name)).can() for role_name in required_roles):
+        flash('アクセス権限がありません。', 'danger')
+        abort(403) # または redirect(url_for('home.index')) など
+
+    list_url = url_for('blog_admin_bp.list_posts')
+    next_url = request.form.get('next', '')
+    if not next_url.startswith(list_url):  # 一覧の絞り込み条件を保ったまま戻る (他のサイトには戻さない)
+        next_url = list_url
+
+    form = PostBulkEditForm()
+    form.set_category_choices(db.session.query(Category.id, Category.name).order_by(Category.name))
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'danger')
+        return redirect(next_url)
+
+    if form.category.data == form.KEEP_CATEGORY:
+        category_id = KEEP_CATEGORY
+    elif form.category.data == form.NO_CATEGORY:
+        category_id = None
+    else:
+        category_id = uuid.UUID(form.category.data)
+
+    try:
+        # 選択した投稿への変更は全て1つのトランザクションで反映する (管理者以外は自分の投稿のみ)
+        result = bulk_edit_posts(
+            form.post_ids.data,
+            add_tag_ids=[tag.id for tag in form.add_tags.data],
+            remove_tag_ids=[tag.id for tag in form.remove_tags.data],
+            category_id=category_id,
+            user_id=None if current_user.has_role('admin') else current_user.id,
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"投稿の一括編集中にエラーが発生しました: {e}", exc_info=True)
+        flash('投稿の一括編集中にエラーが発生しました。', 'danger')
+        return redirect(next_url)
+
+    flash(f'{result.posts} 件の投稿を更新しました (タグの追加: {result.tags_added} 件、'
+          f'タグの削除: {result.tags_removed} 件、カテゴリの変更: {result.categories_changed} 件)。', 'success')
+    return redirect(next_url)
 
 
 @bp.route('/posts/new', methods=['GET', 'POST'])
 @login_required
 def new_post():
     form = PostForm()
-    gallery_images = Image.query.all()  # 必要に応じてフィルタを追加
 
     # カテゴリの選択肢を動的に設定
     form.category.choices = [(str(c.id), c.name) for c in Category.query.all()]
 
     if request.method == 'POST':
         # デバッグログの出力 (current_app.logger を使用)
-        current_app.logger.debug("\n--- DEBUG: POST Request Received ---")
-        current_app.logger.debug(f"DEBUG: request.files: {request.files}")
+        # DEBUG が無効な場合は引数の文字列化 (request.files・request.form の repr など) を行わない
+        logger = current_app.logger
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            logger.debug("\n--- DEBUG: POST Request Received ---")
+            logger.debug("DEBUG: request.files: %s", request.files)
 
         # main_image_file がリクエストに含まれているかチェック
         if 'main_image_file' in request.files:
             file_storage = request.files['main_image_file']
-            current_app.logger.debug(f"DEBUG: main_image_file from request.files:")
-            current_app.logger.debug(f" Filename: {file_storage.filename}")
-            current_app.logger.debug(f" MIME Type: {file_storage.mimetype}")
-            current_app.logger.debug(f" Content Length (from header): {file_storage.content_length} bytes")
+            if debug_enabled:
+                logger.debug("DEBUG: main_image_file from request.files:")
+                logger.debug(" Filename: %s", file_storage.filename)
+                logger.debug(" MIME Type: %s", file_storage.mimetype)
+                logger.debug(" Content Length (from header): %s bytes", file_storage.content_length)
 
             # ★★★最も重要な修正点: FileStorageストリームのポインタを先頭に戻す★★★
             # これをしないと、WTFormsがform.main_image_file.dataをバインドする際に
             # ストリームが既に読み尽くされているため、Noneになってしまう可能性があります。
             try:
                 # Werkzeug の FileStorage オブジェクトの stream を使ってポインタを戻す
-                file_storage.stream.seek(0) 
-                current_app.logger.debug("DEBUG: file_storage.stream.seek(0) called.")
-                # デバッグのために実際のサイズを再確認する (メモリ消費に注意)
-                actual_stream_length = len(file_storage.stream.read())
+                # 実際のサイズは内容を読み込まずに末尾へのシークで確認する
+                actual_stream_length = file_storage.stream.seek(0, os.SEEK_END)
                 file_storage.stream.seek(0) # 再度先頭に戻す for WTForms
-                current_app.logger.debug(f"DEBUG: Actual file content length (stream read): {actual_stream_length} bytes")
+                logger.debug("DEBUG: Actual file content length (stream size): %s bytes", actual_stream_length)
                 
                 if actual_stream_length == 0 and file_storage.filename: # ファイルが選択されているのに内容が0の場合
-                    current_app.logger.error("ERROR: File content is empty after stream read, but filename exists.")
+                    logger.error("ERROR: File content is empty after stream read, but filename exists.")
                     flash('アップロードされたファイルが空です。再度お試しください。', 'danger')
                     return render_template('posts/new_post.html', form=form, title='新規投稿', is_edit=False)
 
             except Exception as e:
-                current_app.logger.error(f"Error seeking/reading file stream for debug: {e}", exc_info=True)
+                logger.error("Error seeking/reading file stream for debug: %s", e, exc_info=True)
                 flash('ファイルの読み取り中にエラーが発生しました。', 'danger')
                 return render_template('posts/new_post.html', form=form, title='新規投稿', is_edit=False)
         else:
-            current_app.logger.debug("DEBUG: 'main_image_file' not in request.files (no file uploaded).")
+            logger.debug("DEBUG: 'main_image_file' not in request.files (no file uploaded).")
 
-        current_app.logger.debug(f"DEBUG: request.form: {request.form}")
-        current_app.logger.debug(f"--- DEBUG End ---")
+        if debug_enabled:
+            logger.debug("DEBUG: request.form: %s", request.form)
+            logger.debug("--- DEBUG End ---")
         
         # form.validate_on_submit() は、request.form と request.files を使ってフォームをバリデート
         # 上記で file_storage.stream.seek(0) を行っていれば、form.main_image_file.data は適切にバインドされるはず
         if form.validate_on_submit():
-            current_app.logger.debug(f"DEBUG: Form validation successful.")
-            current_app.logger.debug(f"DEBUG: form.main_image_file.data type: {type(form.main_image_file.data)}")
-            if form.main_image_file.data:
-                current_app.logger.debug(f"DEBUG: form.main_image_file.data.filename: {form.main_image_file.data.filename}")
-            current_app.logger.debug(f"DEBUG: form.main_image.data: {form.main_image.data}") # QuerySelectFieldのデータ (ImageオブジェクトまたはNone)
+            if debug_enabled:
+                logger.debug("DEBUG: Form validation successful.")
+                logger.debug("DEBUG: form.main_image_file.data type: %s", type(form.main_image_file.data))
+                if form.main_image_file.data:
+                    logger.debug("DEBUG: form.main_image_file.data.filename: %s", form.main_image_file.data.filename)
+                logger.debug("DEBUG: form.main_image.data: %s", form.main_image.data) # QuerySelectFieldのデータ (ImageオブジェクトまたはNone)
 
             main_image_obj = None
 
@@ -193,40 +271,16 @@ def new_post():
                     flash('許可されていないファイル形式です。', 'danger')
                     return render_template('posts/new_post.html', form=form, title='新規投稿', is_edit=False)
 
-                original_filename = secure_filename(main_image_file.filename)
-                unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1]
-                thumbnail_filename = 'thumb_' + unique_filename
-                
-                filepath_abs = os.path.join(current_app.config['UPLOAD_IMAGES_DIR'], unique_filename)
-                thumbnail_filepath_abs = os.path.join(current_app.config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename)
-                
-                filepath_rel = os.path.join(current_app.config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename).replace('\\', '/')
-                thumbnail_filepath_rel = os.path.join(current_app.config['THUMBNAIL_FOLDER_RELATIVE_PATH'], thumbnail_filename).replace('\\', '/')
-
                 try:
                     # ここでファイルの保存が行われます。
                     # form.main_image_file.data (FileStorageオブジェクト) は、
                     # 既にストリームが先頭に戻されているため、正しく保存できるはずです。
-                    main_image_file.save(filepath_abs) 
-                    
-                    # サムネイル生成
-                    img = PilImage.open(filepath_abs)
-                    img.thumbnail(current_app.config['THUMBNAIL_SIZE'])
-                    img.save(thumbnail_filepath_abs)
-                    
-                    main_image_obj = Image(
-                        original_filename=original_filename,
-                        unique_filename=unique_filename,
-                        thumbnail_filename=thumbnail_filename,
-                        mimetype=main_image_file.mimetype,
-                        filepath=filepath_rel,
-                        thumbnail_filepath=thumbnail_filepath_rel,
-                        user_id=current_user.id,
-                        alt_text=form.main_image_alt_text.data
+                    # 同じ内容の画像が既にあればファイルとサムネイルを共有し、なければワーカーでの生成を予約する
+                    main_image_obj = create_image_from_upload(
+                        main_image_file, current_user.id, alt_text=form.main_image_alt_text.data
                     )
-                    db.session.add(main_image_obj)
                     db.session.flush() # IDを取得するためにflush
-                    current_app.logger.info(f"New image uploaded and saved: {unique_filename}")
+                    current_app.logger.info(f"New image uploaded and saved: {main_image_obj.unique_filename}")
                 except Exception as e:
                     current_app.logger.error(f"Image processing error: {e}", exc_info=True)
                     flash('画像の処理中にエラーが発生しました。', 'danger')
@@ -258,7 +312,8 @@ def new_post():
             # 投稿作成処理
             category = None
             if form.category.data:
-                category = db.session.get(Category, form.category.data) # QuerySelectFieldではないため、IDで取得
+                # 選択肢の読み込みで identity map に入っているため、UUID で引けば追加のクエリは発生しない
+                category = db.session.get(Category, uuid.UUID(form.category.data))
 
             new_post = Post(
                 title=form.title.data,
@@ -276,20 +331,23 @@ def new_post():
             if form.additional_images.data: # QuerySelectMultipleFieldなので、Imageオブジェクトのリストが返る
                 new_post.additional_images = form.additional_images.data
 
+            # 本文の Markdown を保存時に変換してキャッシュ (閲覧時に変換しないため)
+            new_post.render_body_html()
+
             db.session.commit()
             flash('新しい投稿が作成されました。', 'success')
             return redirect(url_for('blog_admin_bp.list_posts'))
         
         # バリデーション失敗時 (POSTメソッドの場合)
         else: 
-            current_app.logger.warning(f"Post form validation failed: {form.errors}")
-            current_app.logger.debug(f"Form validation errors: {form.errors}")
-            current_app.logger.debug(f"form.main_image_file.data (on validation failure): {form.main_image_file.data}")
-            current_app.logger.debug(f"form.main_image.data (on validation failure): {form.main_image.data}")
+            logger.warning("Post form validation failed: %s", form.errors)
+            if debug_enabled:
+                logger.debug("form.main_image_file.data (on validation failure): %s", form.main_image_file.data)
+                logger.debug("form.main_image.data (on validation failure): %s", form.main_image.data)
     
     # GETリクエストの場合、またはPOSTリクエストでバリデーション失敗した場合
-    # 例: ギャラリー画像取得
-    return render_template('posts/new_post.html', form=form, gallery_images=gallery_images, title='新規投稿', is_edit=False)
+    # ギャラリーの画像は画像ピッカーが get_images_json から必要な分だけ読み込む
+    return render_template('posts/new_post.html', form=form, title='新規投稿', is_edit=False)
 
 
 @bp.route('/posts/edit/<uuid:post_id>', methods=['GET', 'POST'])
@@ -312,15 +370,12 @@ def edit_post(post_id):
 
     form = PostForm(obj=post) 
 
+    # タグの選択肢は描画時にだけ読み込み、選ばれたタグは検証時に1回の IN クエリで取得する (TagSelectMultipleField)
     form.category.choices = [(str(c.id), c.name) for c in Category.query.all()]
-    form.tags.choices = [(str(t.id), t.name) for t in Tag.query.order_by(Tag.name).all()]
 
     if request.method == 'GET':
         if post.main_image:
-            form.main_image.data = post.main_image.id 
             form.main_image_alt_text.data = post.main_image.alt_text
-        if post.additional_images:
-            form.additional_images.data = post.additional_images
 
     if form.validate_on_submit(): # ここで不完全なif文を修正
         post.title = form.title.data
@@ -329,18 +384,13 @@ def edit_post(post_id):
         post.updated_at = datetime.now(pytz.utc)
 
         if form.category.data:
-            # カテゴリIDからCategoryオブジェクトを取得
-            category_obj = db.session.get(Category, form.category.data)
+            # 選択肢の読み込みで identity map に入っているため、UUID で引けば追加のクエリは発生しない
+            category_obj = db.session.get(Category, uuid.UUID(form.category.data))
             post.category = category_obj
         else:
             post.category = None
 
-        selected_tags = []
-        if form.tags.data:
-            # Tagオブジェクトのリストからidリストに変換
-            tag_ids = [tag.id for tag in form.tags.data]
-            selected_tags = Tag.query.filter(Tag.id.in_(tag_ids)).all()
-        post.tags = selected_tags
+        post.tags = form.tags.data
 
         main_image_file = form.main_image_file.data
         selected_main_image_id = form.main_image.data 
@@ -349,45 +399,20 @@ def edit_post(post_id):
         upload_successful = False
 
         if main_image_file and main_image_file.filename and allowed_file(main_image_file.filename):
-            original_filename = secure_filename(main_image_file.filename)
-            unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1]
-            
-            thumbnail_filename = 'thumb_' + unique_filename
-            filepath_abs = os.path.join(current_app.config['UPLOAD_IMAGES_DIR'], unique_filename)
-            thumbnail_filepath_abs = os.path.join(current_app.config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename)
-
-            filepath_rel = os.path.join(current_app.config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename).replace('\\', '/')
-            thumbnail_filepath_rel = os.path.join(current_app.config['THUMBNAIL_FOLDER_RELATIVE_PATH'], thumbnail_filename).replace('\\', '/')
-
             try:
                 # ここでファイルの保存が行われます。
                 # form.main_image_file.data (FileStorageオブジェクト) は、
                 # 既にストリームが先頭に戻されているため、正しく保存できるはずです。
-                main_image_file.save(filepath_abs) 
-                
-                # サムネイル生成
-                img = PilImage.open(filepath_abs)
-                img.thumbnail(current_app.config['THUMBNAIL_SIZE'])
-                img.save(thumbnail_filepath_abs)
+                new_main_image_obj = create_image_from_upload(
+                    main_image_file, current_user.id, alt_text=form.main_image_alt_text.data
+                )
                 upload_successful = True
             except Exception as e:
                 current_app.logger.error(f"投稿編集での画像アップロードエラー: {e}", exc_info=True)
                 flash('新しいメイン画像のアップロード中にエラーが発生しました。', 'danger')
-                thumbnail_filename = None
                 upload_successful = False
 
             if upload_successful:
-                new_main_image_obj = Image(
-                    original_filename=original_filename,
-                    unique_filename=unique_filename,
-                    thumbnail_filename=thumbnail_filename,
-                    mimetype=main_image_file.mimetype,
-                    filepath=filepath_rel,
-                    thumbnail_filepath=thumbnail_filepath_rel,
-                    user_id=current_user.id,
-                    alt_text=form.main_image_alt_text.data
-                )
-                db.session.add(new_main_image_obj)
                 db.session.flush() 
                 post.main_image = new_main_image_obj 
 
@@ -421,22 +446,11 @@ def edit_post(post_id):
                 if old_main_image:
                     old_main_image.alt_text = None
 
-        selected_additional_images = []
-        if form.additional_images.data:
-            for item in form.additional_images.data:
-                if isinstance(item, uuid.UUID): 
-                    img_obj = db.session.get(Image, item)
-                    if img_obj:
-                        selected_additional_images.append(img_obj)
-                else: 
-                    try:
-                        img_obj = db.session.get(Image, str(item)) 
-                        if img_obj:
-                            selected_additional_images.append(img_obj)
-                    except ValueError:
-                        current_app.logger.warning(f"不正なUUID文字列が追加画像の選択に渡されました: {item}")
-            
-        post.additional_images = selected_additional_images
+        # 追加画像はフォームの検証時に1回の IN クエリで Image に変換済み
+        post.additional_images = form.additional_images.data
+
+        # 本文が変更されていれば HTML キャッシュを更新
+        post.render_body_html()
         
         db.session.commit()
         flash('投稿が正常に更新されました。', 'success')
@@ -487,9 +501,19 @@ def list_categories():
         flash('アクセス権限がありません。', 'danger')
         abort(403) # または redirect(url_for('home.index')) など
 
-    categories = Category.query.order_by(Category.name).all()
+    listing = AdminListing(
+        Category.query,
+        sorts={
+            'name': ('名前', Category.name),
+            'post_count': ('公開記事数', Category.post_count),
+            'created_at': ('作成日', Category.created_at),
+        },
+        default_sort='name',
+        author_column=Category.user_id,
+        date_column=Category.created_at,
+    )
     csrf_form = DeleteForm()
-    return render_template('categories/list_categories.html', categories=categories, title='カテゴリ管理', csrf_form=csrf_form)
+    return render_template('categories/list_categories.html', categories=listing.items, listing=listing, title='カテゴリ管理', csrf_form=csrf_form)
 
 @bp.route('/categories/add', methods=['GET', 'POST'])
 @login_required
@@ -572,9 +596,19 @@ def list_tags():
         flash('アクセス権限がありません。', 'danger')
         abort(403) # または redirect(url_for('home.index')) など
 
-    tags = Tag.query.order_by(Tag.name).all()
+    listing = AdminListing(
+        Tag.query,
+        sorts={
+            'name': ('名前', Tag.name),
+            'post_count': ('公開記事数', Tag.post_count),
+            'created_at': ('作成日', Tag.created_at),
+        },
+        default_sort='name',
+        author_column=Tag.user_id,
+        date_column=Tag.created_at,
+    )
     csrf_form = DeleteForm()
-    return render_template('tags/list_tags.html', tags=tags, title='タグ管理', csrf_form=csrf_form)
+    return render_template('tags/list_tags.html', tags=listing.items, listing=listing, title='タグ管理', csrf_form=csrf_form)
 
 @bp.route('/tags/add', methods=['GET', 'POST'])
 @login_required
@@ -655,19 +689,48 @@ def delete_tag(tag_id):
 @bp.route('/uploads/images/json') 
 @login_required 
 def get_images_json():
-    images = Image.query.order_by(Image.uploaded_at.desc()).all()
-    image_list = []
-    for img in images:
-        image_list.append({
-            'id': str(img.id), 
-            'original_filename': img.original_filename,
-            'unique_filename': img.unique_filename,
-            'thumbnail_filename': img.thumbnail_filename,
-            'alt_text': img.alt_text,
-            'url': img.url, 
-            'thumbnail_url': img.thumbnail_url 
-        })
-    return jsonify({"images": image_list})
+    """
+    画像ピッカー用の画像一覧 (新しい順)。全件ではなく1ページ分だけ返します。
+    ?q= でファイル名の部分一致検索、?page= / ?per_page= でページを指定します。
+    次のページの有無は per_page + 1 件を取得して判定し、COUNT(*) は発行しません。
+    """
+    per_page = min(max(request.args.get('per_page', current_app.config.get('IMAGE_PICKER_PER_PAGE', 24), type=int), 1),
+                   current_app.config.get('IMAGE_PICKER_MAX_PER_PAGE', 100))
+    page = max(request.args.get('page', 1, type=int), 1)
+    query = request.args.get('q', '').strip()
+
+    images_query = Image.query
+    if query:
+        images_query = images_query.filter(Image.original_filename.contains(query, autoescape=True))
+    images = (images_query.order_by(Image.uploaded_at.desc(), Image.id.desc())
+              .offset((page - 1) * per_page).limit(per_page + 1).all())
+    has_next = len(images) > per_page
+
+    fields = ('id', 'original_filename', 'unique_filename', 'thumbnail_filename', 'thumbnail_status',
+              'alt_text', 'url', 'thumbnail_url')
+    image_list = serialize_images(images[:per_page], fields)
+    return jsonify({
+        "images": image_list,
+        "page": page,
+        "per_page": per_page,
+        "has_next": has_next,
+        "next_page": page + 1 if has_next else None,
+    })
+
+# バージョン付きの画像一覧 API (カーソルページネーション・項目選択・ETag による 304 応答)
+@bp.route('/api/v1/images')
+@login_required
+def api_images_v1():
+    # 手動の権限チェック
+    required_roles = ['admin', 'editor', 'poster']
+    if not any(Permission(RoleNeed(role_name)).can() for role_name in required_roles):
+        abort(403)
+
+    # 管理者以外は自分がアップロードした画像のみ (画像管理の一覧と同じ範囲)
+    images_query = Image.query
+    if not current_user.has_role('admin'):
+        images_query = images_query.filter_by(user_id=current_user.id)
+    return images_response(images_query)
 
 @bp.route('/images')
 @login_required
@@ -678,11 +741,26 @@ def list_images():
         flash('アクセス権限がありません。', 'danger')
         abort(403) # または redirect(url_for('home.index')) など
 
-    if current_user.has_role('admin'):
-        images = Image.query.order_by(Image.uploaded_at.desc()).all()
-    else:
-        images = Image.query.filter_by(user_id=current_user.id).order_by(Image.uploaded_at.desc()).all()
-    return render_template('images/list_images.html', images=images, title='画像管理') 
+    images_query = Image.query.options(joinedload(Image.uploader))
+    is_admin = current_user.has_role('admin')
+    if not is_admin:
+        images_query = images_query.filter_by(user_id=current_user.id)
+    listing = AdminListing(
+        images_query,
+        sorts={
+            'uploaded_at': ('アップロード日', Image.uploaded_at),
+            'original_filename': ('ファイル名', Image.original_filename),
+        },
+        default_sort='-uploaded_at',
+        statuses={
+            'ready': ('サムネイル作成済み', Image.thumbnail_status == 'ready'),
+            'pending': ('サムネイル作成待ち', Image.thumbnail_status == 'pending'),
+            'failed': ('サムネイル作成失敗', Image.thumbnail_status == 'failed'),
+        },
+        author_column=Image.user_id if is_admin else None,  # 管理者以外は自分の画像のみ
+        date_column=Image.uploaded_at,
+    )
+    return render_template('images/list_images.html', images=listing.items, listing=listing, title='画像管理')
 
 @bp.route('/images/upload', methods=['GET', 'POST'])
 @login_required
@@ -697,39 +775,12 @@ def upload_image():
     if form.validate_on_submit():
         image_file = form.image.data
         if image_file and allowed_file(image_file.filename):
-            original_filename = secure_filename(image_file.filename)
-            unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1] # 拡張子を取得
-            
-            filepath_abs = os.path.join(current_app.config['UPLOAD_IMAGES_DIR'], unique_filename)
-            
             try:
-                image_file.save(filepath_abs)
-
-                thumbnail_filename = 'thumb_' + unique_filename
-                thumbnail_filepath_abs = os.path.join(current_app.config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename)
-                img_pil = PilImage.open(filepath_abs)
-                img_pil.thumbnail(current_app.config['THUMBNAIL_SIZE'])
-                img_pil.save(thumbnail_filepath_abs)
-                
-                filepath_rel = os.path.join(current_app.config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename).replace('', '/')
-                thumbnail_filepath_rel = os.path.join(current_app.config['THUMBNAIL_FOLDER_RELATIVE_PATH'], thumbnail_filename).replace('', '/')
-                
+                create_image_from_upload(image_file, current_user.id, alt_text=form.alt_text.data)
             except Exception as e:
-                current_app.logger.error(f"サムネイル生成中にエラーが発生しました: {e}")
-                thumbnail_filename = None
-                filepath_rel = None 
-                thumbnail_filepath_rel = None 
-            
-            new_image = Image(
-                original_filename=original_filename,
-                unique_filename=unique_filename,
-                thumbnail_filename=thumbnail_filename,
-                filepath=filepath_rel, 
-                thumbnail_filepath=thumbnail_filepath_rel if thumbnail_filename else None, 
-                user_id=current_user.id,
-                alt_text=form.alt_text.data
-            )
-            db.session.add(new_image)
+                current_app.logger.error(f"画像の保存中にエラーが発生しました: {e}")
+                flash('画像の保存中にエラーが発生しました。', 'danger')
+                return render_template('images/upload_image.html', form=form, title='画像アップロード')
             db.session.commit()
             flash('画像が正常にアップロードされました。', 'success')
             return redirect(url_for('blog_admin_bp.list_images'))
@@ -748,54 +799,16 @@ def bulk_upload_images():
 
     form = BulkImageUploadForm()
     if form.validate_on_submit():
-        uploaded_count = 0
-        failed_count = 0
-        for image_file in form.images.data:
-            if image_file and allowed_file(image_file.filename):
-                original_filename = secure_filename(image_file.filename)
-                unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1] # 拡張子を取得
-                
-                filepath_abs = os.path.join(current_app.config['UPLOAD_IMAGES_DIR'], unique_filename)
-                
-                try:
-                    image_file.save(filepath_abs)
-
-                    thumbnail_filename = 'thumb_' + unique_filename
-                    thumbnail_filepath_abs = os.path.join(current_app.config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename)
-                    try:
-                        img_pil = PilImage.open(filepath_abs)
-                        img_pil.thumbnail(current_app.config['THUMBNAIL_SIZE'])
-                        img_pil.save(thumbnail_filepath_abs)
-                    except Exception as e:
-                        current_app.logger.error(f"バルクアップロード中にサムネイル生成エラー: {original_filename} - {e}")
-                        thumbnail_filename = None
-                        thumbnail_filepath_abs = None 
-
-                    filepath_rel = os.path.join(current_app.config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename).replace('\\', '/')
-                    thumbnail_filepath_rel = os.path.join(current_app.config['THUMBNAIL_FOLDER_RELATIVE_PATH'], thumbnail_filename).replace('\\', '/') if thumbnail_filename else None
-
-                    new_image = Image(
-                        original_filename=original_filename,
-                        unique_filename=unique_filename,
-                        thumbnail_filename=thumbnail_filename,
-                        filepath=filepath_rel, 
-                        thumbnail_filepath=thumbnail_filepath_rel, 
-                        user_id=current_user.id,
-                        alt_text="" 
-                    )
-                    db.session.add(new_image)
-                    uploaded_count += 1
-                except Exception as e:
-                    current_app.logger.error(f"バルクアップロード中にファイル保存エラー: {original_filename} - {e}")
-                    failed_count += 1
-            else:
-                failed_count += 1
-        
+        # 保存・検証をまとめて行い、成功分の Image を1回の INSERT で登録する
+        results = ingest_uploads(form.images.data, current_user.id)
+        uploaded_count = sum(1 for result in results if result.ok)
+        failed = [result for result in results if not result.ok]
+
         if uploaded_count > 0:
-            db.session.commit()
             flash(f'{uploaded_count}個の画像を正常にアップロードしました。', 'success')
-        if failed_count > 0:
-            flash(f'{failed_count}個の画像のアップロードに失敗しました（無効なファイル形式またはエラー）。', 'danger')
+        if failed:
+            details = '、'.join(f'{result.filename} ({result.error})' for result in failed)
+            flash(f'{len(failed)}個の画像のアップロードに失敗しました: {details}', 'danger')
         
         return redirect(url_for('blog_admin_bp.list_images'))
     return render_template('images/bulk_upload_images.html', form=form, title='一括画像アップロード')
@@ -861,20 +874,8 @@ def delete_image(image_id):
         return redirect(url_for('blog_admin_bp.list_images'))
 
     try:
-        abs_filepath = os.path.join(current_app.static_folder, image_to_delete.filepath) 
-        abs_thumbnail_filepath = os.path.join(current_app.static_folder, image_to_delete.thumbnail_filepath) if image_to_delete.thumbnail_filepath else None 
-
-        if image_to_delete.filepath and os.path.exists(abs_filepath):
-            os.remove(abs_filepath)
-            current_app.logger.info(f"Deleted physical file: {abs_filepath}")
-        else:
-            current_app.logger.warning(f"File not found for deletion (main image): {abs_filepath}")
-
-        if image_to_delete.thumbnail_filepath and os.path.exists(abs_thumbnail_filepath):
-            os.remove(abs_thumbnail_filepath)
-            current_app.logger.info(f"Deleted physical thumbnail file: {abs_thumbnail_filepath}")
-        else:
-            current_app.logger.warning(f"File not found for deletion (thumbnail): {abs_thumbnail_filepath}")
+        # 同じ内容のファイルを他の画像が参照している場合はファイルを残す
+        release_image_files(image_to_delete)
 
         db.session.delete(image_to_delete)
         db.session.commit()
@@ -895,9 +896,22 @@ def list_users():
         flash('アクセス権限がありません。', 'danger')
         abort(403) # または redirect(url_for('home.index')) など
 
-    users = User.query.order_by(User.username).all()
+    listing = AdminListing(
+        User.query.options(selectinload(User.roles)),
+        sorts={
+            'username': ('ユーザー名', User.username),
+            'created_at': ('登録日', User.created_at),
+            'last_login_at': ('最終ログイン', User.last_login_at),
+        },
+        default_sort='username',
+        statuses={
+            'active': ('有効', User.active == True),
+            'inactive': ('無効', User.active == False),
+        },
+        date_column=User.created_at,
+    )
     csrf_form = DeleteForm() # 削除用フォーム
-    return render_template('users/list_users.html', users=users, title='ユーザー管理', csrf_form=csrf_form)
+    return render_template('users/list_users.html', users=listing.items, listing=listing, title='ユーザー管理', csrf_form=csrf_form)
 
 # ユーザー編集ルート
 @bp.route('/users/edit/<uuid:user_id>', methods=['GET', 'POST'])
@@ -960,12 +974,10 @@ def delete_user(user_id):
         flash('自分自身を削除することはできません。', 'warning')
         return redirect(url_for('blog_admin_bp.list_users'))
 
-    admin_roles = Role.query.filter_by(name='admin').all()
-    if admin_roles:
-        admin_role_ids = [role.id for role in admin_roles]
-        if user_to_delete.has_role('admin') and User.query.filter(User.roles.any(Role.id.in_(admin_role_ids))).count() <= 1:
-            flash('最後の管理者ユーザーは削除できません。', 'warning')
-            return redirect(url_for('blog_admin_bp.list_users'))
+    # 安全性に関わるため、ずれる可能性のある site_stat ではなく実際の件数で確認する
+    if user_to_delete.has_role('admin') and count_live('admins') <= 1:
+        flash('最後の管理者ユーザーは削除できません。', 'warning')
+        return redirect(url_for('blog_admin_bp.list_users'))
 
     try:
         db.session.delete(user_to_delete)
@@ -988,9 +1000,9 @@ def list_comments():
         abort(403) # または redirect(url_for('home.index')) など
 
     # コメント一覧を取得してテンプレートに渡す
-    comments = Comment.query.all()
+    listing = comment_listing(Comment.query.options(joinedload(Comment.post), joinedload(Comment.comment_author)))
     delete_form = DeleteForm()
-    return render_template('admin/comments.html', comments=comments, delete_form=delete_form)
+    return render_template('admin/comments.html', comments=listing.items, listing=listing, delete_form=delete_form)
 
 @bp.route('/comments/approve/<uuid:comment_id>', methods=['POST'])
 @login_required
@@ -1189,3 +1201,17 @@ def add_user():
     return render_template('users/edit_user.html', form=form, title='ユーザー追加')
 
 
+# --- リクエストの計測 (app/instrumentation.py) ---
+
+@bp.route('/instrumentation')
+@login_required
+@roles_required('admin')
+def instrumentation():
+    """サンプリングしたリクエストの計測値 (?format=json で JSON) を表示する"""
+    request_log = get_request_log()
+    records = request_log.records() if request_log is not None else []
+    summary = summarize(records)
+    if request.args.get('format') == 'json':
+        return jsonify({'enabled': request_log is not None, 'summary': summary, 'records': records})
+    return render_template('admin/instrumentation.html', title='リクエストの計測',
+                           enabled=request_log is not None, summary=summary, records=records[:100])
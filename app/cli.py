@@ -1,12 +1,13 @@
 # app/cli.py
 
 import click
+from flask import current_app
 from flask.cli import with_appcontext
 import os
 
 from flask_security.utils import hash_password
 from app.extensions import db, security
-from app.models import User, Role
+from app.models import User, Role, Post
 
 
 
@@ -137,4 +138,194 @@ def assign_admin_role(email):
 
     user.roles.append(admin_role)
     db.session.commit()
-    click.echo(f"Successfully assigned admin role to '{email}'.")
\ No newline at end of file
+    click.echo(f"Successfully assigned admin role to '{email}'.")
+
+
+@init.command("render-markdown")
+@click.option('--force', is_flag=True, help='キャッシュが最新の投稿も含めて全て再変換します。')
+@click.option('--batch-size', default=200, show_default=True, help='1回のコミットで処理する投稿数.')
+@with_appcontext
+def render_markdown_cache(force, batch_size):
+    """全投稿の本文 HTML キャッシュ (Post.body_html) を作成・更新します。"""
+    post_ids = [row.id for row in db.session.query(Post.id).order_by(Post.created_at)]
+    updated = 0
+    for start in range(0, len(post_ids), batch_size):
+        chunk = post_ids[start:start + batch_size]
+        for post in Post.query.filter(Post.id.in_(chunk)):
+            if post.render_body_html(force=force):
+                updated += 1
+        db.session.commit()
+    click.echo(f"{len(post_ids)} 件の投稿を確認し、{updated} 件の HTML キャッシュを更新しました。")
+
+
+
+@init.command("reindex-search")
+@with_appcontext
+def reindex_search():
+    """全文検索索引 (post_search) を作り直し、全投稿を再登録します。"""
+    from app.search import rebuild_search_index
+
+    if db.engine.dialect.name != 'sqlite':
+        click.echo("全文検索索引は SQLite (FTS5) でのみ利用できます。", err=True)
+        return
+    with db.engine.begin() as connection:
+        indexed = rebuild_search_index(connection)
+    click.echo(f"{indexed} 件の投稿を検索索引に登録しました。")
+
+
+@init.command("thumbnail-worker")
+@click.option('--workers', default=None, type=int, help='サムネイル生成に使うプロセス数 (既定: CPU コア数).')
+@click.option('--once', is_flag=True, help='未処理のジョブを全て処理したら終了します。')
+@click.option('--poll-interval', default=2.0, show_default=True, help='ジョブがない時の待機秒数.')
+@click.option('--batch-size', default=None, type=int, help='1回に取り出すジョブ数 (既定: プロセス数 x 4).')
+@with_appcontext
+def thumbnail_worker(workers, once, poll_interval, batch_size):
+    """image_job テーブルのサムネイル生成ジョブをプロセスプールで処理します。"""
+    from app.thumbnails import run_worker
+
+    click.echo("サムネイル生成ワーカーを開始します。" + ("" if once else " (Ctrl+C で停止)"))
+    try:
+        succeeded, failed = run_worker(workers=workers, once=once,
+                                       poll_interval=poll_interval, batch_size=batch_size)
+    except KeyboardInterrupt:
+        click.echo("サムネイル生成ワーカーを停止しました。")
+        return
+    click.echo(f"{succeeded} 件のサムネイルを生成しました (失敗: {failed} 件)。")
+
+
+@init.command("generate-variants")
+@click.option('--all', 'regenerate_all', is_flag=True, help='派生画像が作成済みの画像も含めて全て再生成します。')
+@with_appcontext
+def generate_variants_command(regenerate_all):
+    """既存の画像にレスポンシブ用の派生画像 (WebP/AVIF) の生成ジョブを登録します。"""
+    from app.models import Image, ImageJob
+    from app.thumbnails import STATUS_PENDING, STATUS_RUNNING
+    from app.variants import JOB_KIND_VARIANTS
+
+    if not current_app.config.get('IMAGE_VARIANT_WIDTHS'):
+        click.echo("IMAGE_VARIANT_WIDTHS が空のため、派生画像は生成されません。", err=True)
+        return
+    query = db.session.query(Image.id).filter(~Image.jobs.any(
+        (ImageJob.kind == JOB_KIND_VARIANTS) & ImageJob.status.in_([STATUS_PENDING, STATUS_RUNNING])
+    ))
+    if not regenerate_all:
+        query = query.filter(~Image.variants.any())
+    image_ids = [row.id for row in query]
+    if image_ids:
+        db.session.execute(ImageJob.__table__.insert(), [
+            {'image_id': image_id, 'kind': JOB_KIND_VARIANTS, 'status': STATUS_PENDING, 'attempts': 0}
+            for image_id in image_ids
+        ])
+        db.session.commit()
+    click.echo(f"{len(image_ids)} 件の画像に派生画像の生成ジョブを登録しました。"
+               "`flask init thumbnail-worker` で処理してください。")
+
+
+@init.command("hash-images")
+@click.option('--batch-size', default=200, show_default=True, help='1回のコミットで処理する画像数.')
+@with_appcontext
+def hash_images(batch_size):
+    """content_hash が未設定の既存画像のハッシュを計算し、重複排除の対象にします (ファイル名は変更しません)。"""
+    from app.models import Image
+    from app.utils import file_sha256
+
+    image_ids = [row.id for row in db.session.query(Image.id).filter(Image.content_hash.is_(None))]
+    hashed = missing = 0
+    for start in range(0, len(image_ids), batch_size):
+        chunk = image_ids[start:start + batch_size]
+        for image in Image.query.filter(Image.id.in_(chunk)):
+            path = os.path.join(current_app.config['UPLOAD_IMAGES_DIR'], image.unique_filename)
+            if not os.path.exists(path):
+                missing += 1
+                continue
+            image.content_hash = file_sha256(path)
+            hashed += 1
+        db.session.commit()
+    click.echo(f"{hashed} 件の画像のハッシュを登録しました (ファイルなし: {missing} 件)。")
+
+
+@init.command("export-static")
+@click.option('--output', default=None, type=click.Path(file_okay=False),
+              help='出力先ディレクトリ (既定: STATIC_EXPORT_DIR).')
+@click.option('--workers', default=None, type=int, help='描画に使うプロセス数 (既定: CPU コア数、1 でプロセス内描画).')
+@click.option('--force', is_flag=True, help='前回から変更のないページも含めて全て再描画します。')
+@click.option('--chunk-size', default=200, show_default=True, help='1ワーカーに一度に渡すページ数.')
+@with_appcontext
+def export_static(output, workers, force, chunk_size):
+    """公開サイト (トップ・投稿詳細・カテゴリ別・タグ別) を静的 HTML に書き出します。"""
+    from app.static_export import export_site
+
+    output = output or current_app.config['STATIC_EXPORT_DIR']
+    click.echo(f"静的サイトを {output} に書き出します...")
+    result = export_site(output, workers=workers, force=force, chunk_size=chunk_size)
+    click.echo(f"{result.rendered} ページを描画しました (変更なし: {result.skipped} ページ、"
+               f"削除: {result.removed} ページ、失敗: {result.failed} ページ)。")
+    click.echo(f"{result.copied_files} 件の静的ファイル・画像をコピーしました。")
+
+
+@init.command("recount")
+@with_appcontext
+def recount():
+    """管理ダッシュボードの集計値 (site_stat) を実際の件数で作り直します。"""
+    from app.stats import recount_stats
+
+    with db.engine.begin() as connection:
+        counts = recount_stats(connection)
+    for name, value in counts.items():
+        click.echo(f"  {name}: {value}")
+    click.echo("集計値を更新しました。")
+
+
+@init.command("recount-tags")
+@with_appcontext
+def recount_tags():
+    """タグ・カテゴリの公開済み投稿数 (post_count) を実際の件数で作り直します。"""
+    from app.tag_counts import recount_post_counts
+
+    with db.engine.begin() as connection:
+        counts = recount_post_counts(connection)
+    click.echo(f"タグ {counts['tags']} 件、カテゴリ {counts['categories']} 件の投稿数を修正しました。")
+
+
+@init.command("related-posts")
+@click.option("--full", is_flag=True, help="変更の有無にかかわらず全ての投稿の関連記事を計算し直します。")
+@with_appcontext
+def related_posts(full):
+    """公開済み投稿の関連記事 (タグ・カテゴリの一致度の上位) を計算して保存します。"""
+    from app.related import refresh_related_posts
+
+    result = refresh_related_posts(full=full)
+    db.session.commit()
+    click.echo(f"{result['recomputed']} 件の投稿の関連記事を計算しました"
+               f" (非公開・削除された投稿の一覧の削除: {result['removed']} 件)。")
+
+
+@init.command("sync-replica")
+@with_appcontext
+def sync_replica():
+    """プライマリの SQLite データベースを読み取り専用レプリカのファイルにコピーします。"""
+    from app.db_routing import sync_replica as copy_to_replica
+
+    try:
+        copy_to_replica()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo("レプリカをプライマリと同期しました。")
+
+
+@init.command("copy-database")
+@click.argument("target_uri")
+@click.option("--batch-size", default=1000, show_default=True, help="一度に INSERT する行数。")
+@with_appcontext
+def copy_database_command(target_uri, batch_size):
+    """現在のデータベースの内容を TARGET_URI のデータベース (PostgreSQL など) にコピーします。"""
+    from app.db_copy import copy_database
+
+    try:
+        counts = copy_database(target_uri, batch_size=batch_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for name, count in counts.items():
+        click.echo(f"  {name}: {count} 行")
+    click.echo("コピーが完了しました。コピー先を DATABASE_URL に指定して `flask db stamp head` を実行してください"
+               " (SQLite の場合は `flask init reindex-search` も実行してください)。")
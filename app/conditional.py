@@ -0,0 +1,93 @@
+# F:\dev\BrogDev\app\conditional.py
+"""
+投稿詳細・一覧ページの条件付き GET (ETag / 304 Not Modified)。
+
+ページごとに「検証用の値」(投稿の updated_at の最大値や件数など) を小さな集計クエリで求め、
+そこから ETag を作成します。リクエストの If-None-Match と一致すれば
+テンプレートを描画せずに 304 を返すため、再訪問者やクローラーへの応答は索引を使う1クエリで済みます。
+
+Last-Modified は付けません。updated_at の最大値は最新の投稿やコメントを削除・非公開にすると過去に戻り、
+サムネイルの生成状態のように日時を持たない値もあるため、If-Modified-Since だけでは変更を見落とします。
+
+ログイン状態によって表示が変わるため、ETag には利用者の識別子を含め、Vary: Cookie を付けます。
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+from werkzeug.http import is_resource_modified
+
+from app.models import Category, Image, Post, Tag
+
+
+def listing_state(query):
+    """
+    投稿一覧のクエリから検証用の値のタプルを返します。
+    投稿の追加・削除・非公開化でページ構成が変わるため、updated_at の最大値に加えて件数も含めます。
+    カードに表示するメイン画像のサムネイルは投稿を更新せずに生成されるため、生成済みの件数も含めます。
+    カードのタグ名・カテゴリ名は投稿を更新せずに変更できるため、タグ・カテゴリの updated_at の最大値と件数も含めます。
+    """
+    return tuple(query.order_by(None)
+                 .outerjoin(Image, Image.id == Post.main_image_id)
+                 .with_entities(func.max(Post.updated_at), func.count(Post.id),
+                                func.count(Image.id).filter(Image.thumbnail_status == 'ready'),
+                                *name_state())
+                 .one())
+
+
+def name_state():
+    """タグ・カテゴリの updated_at の最大値と件数を返すスカラーサブクエリのタプル (名前の変更・削除の検知用)。"""
+    return tuple(select(aggregate).correlate(None).scalar_subquery() for aggregate in (
+        func.max(Tag.updated_at), func.count(Tag.id), func.max(Category.updated_at), func.count(Category.id)))
+
+
+def _make_etag(parts):
+    user_marker = current_user.get_id() if current_user.is_authenticated else 'anonymous'
+    args = sorted(request.args.items(multi=True))
+    raw = repr((request.endpoint, args, user_marker, parts)).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _set_validators(response, etag):
+    response.set_etag(etag, weak=True)
+    # 描画内容がログイン状態に依存するため、ブラウザには毎回再検証させる
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+
+
+def conditional_page(validators):
+    """
+    ビュー関数を条件付き GET に対応させるデコレータ。
+    validators はビューと同じキーワード引数を受け取り、検証用の値のタプルを返す関数です。
+    対象が見つからないなどビュー側で処理させたい場合は None を返してください。
+    cached_page と併用する場合は cached_page の下に指定します。
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or '_flashes' in session
+                    or not current_app.config.get('CONDITIONAL_GET', True)):
+                return view(*args, **kwargs)
+
+            parts = validators(**kwargs)
+            if parts is None:
+                return view(*args, **kwargs)
+            etag = _make_etag(parts)
+
+            if not is_resource_modified(request.environ, etag=etag):
+                response = current_app.response_class(status=304)
+                _set_validators(response, etag)
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,110 @@
+# F:\dev\BrogDev\app\db_copy.py
+"""
+現在のデータベースの内容を別のデータベース (PostgreSQL への移行など) にコピーします。
+
+`flask init copy-database <URI>` から使います。コピー先に現在のモデルのスキーマを作成し、
+全てのテーブルの行を外部キーの依存順に batch_size 件ずつ INSERT します。
+値は各列の型で読み書きするため、UUID は SQLite の BLOB / 文字列から PostgreSQL のネイティブの uuid に変換されます。
+
+post.main_image_id と image.post_id のように循環する外部キーの列は、まず NULL で INSERT し、
+全テーブルのコピー後に UPDATE で設定します。
+集計値 (site_stat) はコピーせずにコピー先で数え直し、
+PostgreSQL では整数の主キーのシーケンスをコピーした最大値に合わせます。
+"""
+
+from sqlalchemy import Integer, and_, bindparam, create_engine, func, or_, select
+from sqlalchemy.schema import sort_tables_and_constraints
+
+from app.extensions import db
+from app.stats import recount_stats
+
+# コピーせず、コピー後に数え直す集計用のテーブル (create_all の時点で行が作成される)
+_DERIVED_TABLES = frozenset({'site_stat'})
+
+
+def _copy_order(tables):
+    """
+    外部キーの依存順に並べたテーブルのリストと、後から UPDATE する (循環する) 外部キーの列
+    {テーブル名: {列名}} を返します。
+    循環に含まれるテーブル間の NULL を許す外部キーを後回しにして順序を決めます。
+    """
+    cycles = next((remaining for table, remaining in sort_tables_and_constraints(tables) if table is None), [])
+    cycle_tables = {constraint.table for constraint in cycles}
+    postponed = {constraint for constraint in cycles
+                 if constraint.referred_table in cycle_tables and all(column.nullable for column in constraint.columns)}
+
+    order, deferred = [], {}
+    for table, remaining in sort_tables_and_constraints(tables, filter_fn=lambda c: True if c in postponed else None):
+        if table is not None:
+            order.append(table)
+            continue
+        for constraint in remaining:
+            if constraint not in postponed:
+                raise ValueError(f'Cannot order tables for copying: {constraint.table.name} -> {constraint.referred_table.name}')
+            deferred.setdefault(constraint.table.name, set()).update(constraint.column_keys)
+    return order, deferred
+
+
+def _reset_sequences(connection, tables):
+    """PostgreSQL の整数の主キーのシーケンスを、コピーした最大値の次から採番するようにします。"""
+    quote = connection.dialect.identifier_preparer.quote
+    for table in tables:
+        columns = list(table.primary_key.columns)
+        if len(columns) != 1 or not isinstance(columns[0].type, Integer) or columns[0].autoincrement is False:
+            continue
+        max_id = connection.execute(select(func.max(columns[0]))).scalar()
+        if max_id is not None:
+            sequence = func.pg_get_serial_sequence(quote(table.name), columns[0].name)
+            connection.execute(select(func.setval(sequence, max_id)))
+
+
+def copy_database(target_uri, batch_size=1000):
+    """
+    現在のデータベースの全テーブルを target_uri のデータベースにコピーし、{テーブル名: 行数} を返します。
+    コピー先のテーブルに行がある場合は何もせずに ValueError を送出します。
+    """
+    metadata = db.metadata
+    tables, deferred = _copy_order([table for table in metadata.tables.values()
+                                    if table.name not in _DERIVED_TABLES])
+    target = create_engine(target_uri)
+    counts = {}
+    try:
+        metadata.create_all(target)
+        with target.begin() as destination:
+            for table in tables:
+                if destination.execute(select(func.count()).select_from(table)).scalar():
+                    raise ValueError(f'Target table {table.name} is not empty')
+
+            source = db.session.connection()
+            for table in tables:
+                postponed = deferred.get(table.name, set())
+                counts[table.name] = 0
+                result = source.execution_options(yield_per=batch_size).execute(select(table))
+                for rows in result.partitions():
+                    values = [{key: (None if key in postponed else value) for key, value in row._mapping.items()}
+                              for row in rows]
+                    destination.execute(table.insert(), values)
+                    counts[table.name] += len(values)
+
+            # 循環する外部キーの列を主キーで UPDATE する
+            for table in tables:
+                postponed = sorted(deferred.get(table.name, ()))
+                if not postponed:
+                    continue
+                keys = [column.name for column in table.primary_key.columns]
+                statement = (table.update()
+                             .where(and_(*(table.c[key] == bindparam(f'b_{key}') for key in keys)))
+                             .values({name: bindparam(f'b_{name}') for name in postponed}))
+                columns = [table.c[name] for name in keys + postponed]
+                rows = source.execute(select(*columns).where(
+                    or_(*(table.c[name].isnot(None) for name in postponed)))).all()
+                if rows:
+                    destination.execute(statement, [{f'b_{name}': value for name, value in zip(keys + postponed, row)}
+                                                    for row in rows])
+
+            recount_stats(destination)
+            if target.dialect.name == 'postgresql':
+                _reset_sequences(destination, tables)
+    finally:
+        target.dispose()
+    return counts
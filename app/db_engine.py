@@ -0,0 +1,112 @@
+# F:\dev\BrogDev\app\db_engine.py
+"""
+SQLite のエンジン設定 (接続ごとのプラグマと接続プール)。
+
+SQLAlchemy の既定のままではロールバックジャーナルモードで動作するため、コメントの書き込み中は
+読み取りの接続が待たされます。SQLITE_ENGINE_PROFILE で選んだプロファイルに従い、
+- 新しい接続を開くたびに connect イベントでプラグマ (WAL・synchronous=NORMAL など) を実行し、
+- ファイルのデータベースでは QueuePool の大きさ (pool_size / max_overflow / pool_timeout) を設定します。
+
+プロファイル:
+    'production' : WAL・synchronous=NORMAL・mmap・キャッシュ・busy_timeout・temp_store=MEMORY と接続プール
+    'default'    : SQLAlchemy の既定のまま (プラグマを実行しない)
+
+SQLITE_PRAGMAS でプロファイルのプラグマを個別に上書き・追加でき、値を None にするとそのプラグマは実行しません。
+SQLITE_POOL で接続プールの設定を上書きできます。
+create_app では db.init_app() の前に configure_engine_options()、後に init_app() を呼びます。
+"""
+
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app.extensions import db
+
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'pool': {},
+    },
+    'production': {
+        # busy_timeout を先に設定し、journal_mode の切り替えが他の接続のロックで失敗しないようにする
+        'pragmas': {
+            'busy_timeout': 5000,              # ロックの解放を待つ時間 (ミリ秒)
+            'journal_mode': 'WAL',             # 書き込み中も読み取りをブロックしない
+            'synchronous': 'NORMAL',           # WAL ではコミットごとの fsync を省いても破損しない
+            'cache_size': -16000,              # ページキャッシュ (負の値は KiB 単位、約 16MB)
+            'mmap_size': 128 * 1024 * 1024,    # 読み取りにメモリマップを使う大きさ (バイト)
+            'temp_store': 'MEMORY',            # 一時テーブル・ソート用の領域をメモリに置く
+        },
+        'pool': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 30,
+        },
+    },
+}
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == 'sqlite'
+
+
+def _is_memory(url):
+    return url.database in (None, '', ':memory:')
+
+
+def get_profile(app):
+    """設定から {'pragmas': {...}, 'pool': {...}} を組み立てて返します。"""
+    name = app.config.get('SQLITE_ENGINE_PROFILE') or 'default'
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown SQLITE_ENGINE_PROFILE: {name!r} (choose from {", ".join(SQLITE_PROFILES)})')
+    profile = SQLITE_PROFILES[name]
+    pragmas = {**profile['pragmas'], **(app.config.get('SQLITE_PRAGMAS') or {})}
+    pragmas = {key: value for key, value in pragmas.items() if value is not None}
+    for key, value in pragmas.items():
+        if not _PRAGMA_NAME.match(key) or not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f'Invalid SQLite pragma: {key}={value!r}')
+    pool = {**profile['pool'], **(app.config.get('SQLITE_POOL') or {})}
+    return {'pragmas': pragmas, 'pool': pool}
+
+
+def configure_engine_options(app):
+    """
+    ファイルの SQLite データベースの場合、プロファイルの接続プールの設定を SQLALCHEMY_ENGINE_OPTIONS に加えます。
+    db.init_app() の前に呼んでください (明示的に設定された値は上書きしません)。
+    インメモリのデータベースは Flask-SQLAlchemy が StaticPool を使うため変更しません。
+    """
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if not _is_sqlite(url) or _is_memory(url):
+        return
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    for key, value in get_profile(app)['pool'].items():
+        options.setdefault(key, value)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas.items():
+                cursor.execute(f'PRAGMA {key}={value}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def init_app(app):
+    """アプリケーションの SQLite エンジン (バインドを含む) に、接続ごとにプラグマを実行するイベントを登録します。"""
+    pragmas = get_profile(app)['pragmas']
+    if not pragmas:
+        return
+    listener = _pragma_listener(pragmas)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if _is_sqlite(engine.url):
+            event.listen(engine, 'connect', listener)
@@ -0,0 +1,143 @@
+# F:\dev\BrogDev\app\db_routing.py
+"""
+読み取り専用レプリカへのクエリの振り分け。
+
+SQLALCHEMY_REPLICA_URI を設定すると、SQLALCHEMY_BINDS の 'replica' としてエンジンを作成し、
+公開ページ (home / posts ブループリント) の GET / HEAD の読み込みをレプリカに送ります。
+それ以外 (管理画面・POST・CLI) は全て従来どおりプライマリを使います。
+
+書き込んだ直後の利用者が古いデータを見ないよう、次の場合はプライマリを使います (スティッキー):
+- 同じリクエスト内でフラッシュ (INSERT / UPDATE / DELETE) した後の読み込み
+- コミットしてから REPLICA_STICKY_SECONDS 秒の間の、同じ利用者 (Flask のセッション) のリクエスト
+  (コメント投稿や記事の保存の後のリダイレクト先など)
+
+レプリカには SQLite のファイル (`flask init sync-replica` でプライマリからコピー) か、
+ストリーミングレプリケーションされた PostgreSQL などの URI を指定できます。
+レプリカの遅れの分だけ公開ページの内容が遅れる場合があります。
+
+ページキャッシュ (app/page_cache.py) に保存するページはプライマリから描画します。
+コミットでキャッシュを破棄した直後にまだ同期されていないレプリカから描画すると、
+古い内容が次の破棄 (または PAGE_CACHE_TTL) まで全ての利用者に返されるためです。
+"""
+
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import UpdateBase
+
+REPLICA_BIND = 'replica'
+
+# コミットした利用者がプライマリを読む期限 (UNIX 時刻) を保存するセッションのキー
+_STICKY_KEY = '_db_primary_until'
+# このセッションでフラッシュ・一括変更を行ったことを示す Session.info のキー
+_WROTE_KEY = 'db_routing_wrote'
+
+
+class RoutingSession(FlaskSession):
+    """replica_reads() が有効なリクエストの読み込みをレプリカのエンジンに振り分けるセッション。"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if self._flushing or self.info.get(_WROTE_KEY) or isinstance(clause, UpdateBase):
+            return False
+        return has_request_context() and g.get('db_read_replica', False)
+
+
+def replica_enabled():
+    return bool(current_app.config.get('SQLALCHEMY_REPLICA_URI'))
+
+
+def replica_reads():
+    """
+    ブループリントの before_request に登録し、GET / HEAD の読み込みをレプリカに振り分けます。
+    直前にコミットした利用者 (スティッキーの期間内) はプライマリを使います。
+    """
+    if not replica_enabled() or request.method not in ('GET', 'HEAD'):
+        return
+    if session.get(_STICKY_KEY, 0) > time.time():
+        return
+    g.db_read_replica = True
+
+
+def read_from_primary():
+    """このリクエストの以降の読み込みをプライマリから行います (ページキャッシュに保存するページの描画など)。"""
+    if has_request_context():
+        g.db_read_replica = False
+
+
+def configure_binds(app):
+    """SQLALCHEMY_REPLICA_URI を SQLALCHEMY_BINDS に加えます。db.init_app() の前に呼んでください。"""
+    uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if uri:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, uri)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def sync_replica():
+    """
+    SQLite のプライマリの内容をレプリカのファイルに、SQLite のオンラインバックアップでコピーします。
+    コピー中もプライマリ・レプリカの読み込みは続けられます。
+    """
+    from app.extensions import db
+
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is None:
+        raise RuntimeError('SQLALCHEMY_REPLICA_URI is not set')
+    primary = db.engines[None]
+    if primary.url.get_backend_name() != 'sqlite' or replica.url.get_backend_name() != 'sqlite':
+        raise RuntimeError('Only SQLite replicas can be synced; use the database replication for other backends')
+    source, target = primary.raw_connection(), replica.raw_connection()
+    try:
+        source.driver_connection.backup(target.driver_connection)
+    finally:
+        target.close()
+        source.close()
+    # 同期前に描画したページを破棄し、同期後の最初のアクセスで描画し直す
+    # (filesystem のキャッシュは世代を共有するため、他のワーカープロセスにも反映される)
+    from app.page_cache import clear_page_cache
+    clear_page_cache()
+
+
+# --- スティッキー ---
+
+def _mark_after_flush(db_session, flush_context):
+    db_session.info[_WROTE_KEY] = True
+
+
+def _mark_bulk_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+
+def _stick_after_commit(db_session):
+    if db_session.info.pop(_WROTE_KEY, False) and has_request_context() and replica_enabled():
+        # このリクエストの残りと、期間内の同じ利用者のリクエストはプライマリから読む
+        g.db_read_replica = False
+        session[_STICKY_KEY] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+
+
+def _reset_after_rollback(db_session):
+    db_session.info.pop(_WROTE_KEY, None)
+
+
+_listeners = (
+    ('after_flush', _mark_after_flush),
+    ('do_orm_execute', _mark_bulk_statement),
+    ('after_commit', _stick_after_commit),
+    ('after_rollback', _reset_after_rollback),
+)
+
+
+def init_app(app):
+    """書き込んだ利用者をプライマリに固定するイベントを登録します。"""
+    for name, listener in _listeners:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -8,8 +8,11 @@ from flask_mail import Mail
 from flask_security import Security, SQLAlchemyUserDatastore
 from flask_principal import Principal
 
+from app.db_routing import RoutingSession
+
 # 各拡張機能のインスタンスを生成
-db = SQLAlchemy()
+# 公開ページの読み込みをレプリカに振り分けるセッション (app/db_routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 csrf = CSRFProtect()
 moment = Moment()
@@ -4,6 +4,8 @@ from flask_security.forms import LoginForm as SecurityLoginForm, RegisterForm as
 from flask_wtf import FlaskForm
 from flask_wtf.file import  MultipleFileField, FileAllowed, FileRequired, FileField
 from wtforms import StringField, TextAreaField, BooleanField, SubmitField, PasswordField, SelectField, SelectMultipleField,HiddenField
+from wtforms.fields import Field
+from wtforms.widgets import HiddenInput, Select
 from wtforms.fields import EmailField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Optional
 from app.extensions import db
@@ -13,6 +15,143 @@ import os
 import uuid
 from app.models import Category, Tag, Image, User, Role
 
+def load_by_id(model, ids, message):
+    """
+    ID のリストに対応する行を1回の IN クエリで取得し、ID の順に並べて返します。
+    存在しない ID が含まれる場合は message の ValidationError を送出します。
+    """
+    if not ids:
+        return []
+    found = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    if len(found) != len(ids):
+        raise ValidationError(message)
+    return [found[obj_id] for obj_id in ids]
+
+
+class IdListField(Field):
+    """
+    UUID の ID をカンマ区切りまたは同じ名前の複数の値で受け取るフィールド。data は UUID のリストです。
+    UUID でない値が含まれる場合は invalid_message のエラーになります。
+    """
+    invalid_message = '無効なIDです。'
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self.ids = []
+
+    def process_data(self, value):
+        self.ids = list(value or [])
+        self.data = self.ids
+
+    def process_formdata(self, valuelist):
+        # フィールド自体が送信されなかった場合は obj の値をそのまま使う (空文字の送信で選択解除)
+        if not valuelist:
+            return
+        ids = []
+        for value in valuelist:
+            for part in value.split(','):
+                part = part.strip()
+                if not part:
+                    continue
+                try:
+                    obj_id = uuid.UUID(part)
+                except ValueError:
+                    raise ValueError(self.invalid_message)
+                if obj_id not in ids:
+                    ids.append(obj_id)
+        self.ids = ids
+        self.data = ids
+
+
+class ModelSelectMultipleField(IdListField):
+    """
+    送信された ID を検証時に1回の IN クエリでモデルのインスタンスに変換するフィールド。
+    QuerySelectMultipleField と違い、検証のために全件を読み込みません。data はインスタンスのリストです。
+    サブクラスで model と各メッセージを指定します。
+    """
+    model = None
+    not_found_message = '選択された項目が見つかりません。'
+
+    def process_data(self, value):
+        objs = [obj for obj in self._as_list(value) if obj is not None]
+        self.data = self._wrap(objs)
+        self.ids = [obj.id for obj in objs]
+
+    def process_formdata(self, valuelist):
+        # data は検証時 (pre_validate) に ID をインスタンスに変換するまで obj の値のままにする
+        data = self.data
+        super().process_formdata(valuelist)
+        self.data = data
+
+    def pre_validate(self, form):
+        # フォームデータから受け取った ID をインスタンスに置き換える (obj からの値はそのまま)
+        if self.raw_data:
+            self.data = self._wrap(load_by_id(self.model, self.ids, self.not_found_message))
+
+    def _as_list(self, value):
+        return list(value or [])
+
+    def _wrap(self, objs):
+        return objs
+
+
+class ImageSelectMultipleField(ModelSelectMultipleField):
+    """
+    画像ピッカーで選んだ既存画像の ID を受け取るフィールド (hidden input に カンマ区切りで ID を設定)。
+    選択肢として全画像を読み込まず、送信された ID だけを検証時に1回の IN クエリで検索します。
+    data は Image のリストです。
+    """
+    widget = HiddenInput()
+    model = Image
+    not_found_message = '選択された画像が見つかりません。'
+    invalid_message = '無効な画像IDです。'
+
+    def _value(self):
+        return ','.join(str(image_id) for image_id in self.ids)
+
+
+class ImageSelectField(ImageSelectMultipleField):
+    """ImageSelectMultipleField の単一選択版。data は Image または None です。"""
+
+    def process_formdata(self, valuelist):
+        super().process_formdata(valuelist[:1])
+        self.ids = self.ids[:1]
+
+    def _as_list(self, value):
+        return [value]
+
+    def _wrap(self, images):
+        return images[0] if images else None
+
+
+class TagSelectMultipleField(ModelSelectMultipleField):
+    """
+    タグの複数選択 (<select multiple>)。選択肢の全タグは描画する時にだけ読み込み、
+    送信されたタグは検証時に1回の IN クエリで Tag に変換します。data は Tag のリストです。
+    """
+    widget = Select(multiple=True)
+    model = Tag
+    not_found_message = '選択されたタグが見つかりません。'
+    invalid_message = '無効なタグIDです。'
+
+    def process_formdata(self, valuelist):
+        # <select multiple> は何も選ばれていないと送信されないため、送信されなければ選択なしとする
+        self.ids = []
+        super().process_formdata(valuelist)
+
+    def pre_validate(self, form):
+        if getattr(self, 'raw_data', None) is not None:
+            self.data = load_by_id(Tag, self.ids, self.not_found_message)
+
+    def has_groups(self):
+        return False
+
+    def iter_choices(self):
+        selected = set(self.ids)
+        for tag in Tag.query.order_by(Tag.name):
+            yield str(tag.id), tag.name, tag.id in selected, {}
+
+
 class DeleteForm(FlaskForm):
     """汎用的な削除確認フォーム（CSRFトークンのみ）"""
     submit = SubmitField('削除')
@@ -86,28 +225,13 @@ class PostForm(FlaskForm):
     selected_image_id = HiddenField('選択画像ID')
     
     
-    # 既存のメイン画像を選択するためのフィールド (IDをhiddenで送る想定)
-    main_image = QuerySelectField(
-        'または既存のメイン画像を選択',
-        query_factory=lambda: Image.query.order_by(Image.original_filename).all(),
-        get_pk=lambda a: str(a.id), 
-        get_label=lambda a: a.original_filename, 
-        allow_blank=True, 
-        blank_text='--- 選択してください ---',
-        validators=[Optional()] 
-    )
+    # 既存のメイン画像を選択するためのフィールド (画像ピッカーが ID を hidden で送る)
+    main_image = ImageSelectField('または既存のメイン画像を選択', validators=[Optional()])
     
     main_image_alt_text = StringField('メイン画像の代替テキスト (Alt Text)', validators=[Optional(), Length(max=255)])
 
     # 複数の追加画像を選択するためのフィールド
-    additional_images = QuerySelectMultipleField(
-        '追加画像を選択 (複数選択可)',
-        query_factory=lambda: Image.query.order_by(Image.original_filename).all(),
-        get_pk=lambda a: str(a.id),
-        get_label=lambda a: a.original_filename,
-        allow_blank=True,
-        validators=[Optional()]
-    )
+    additional_images = ImageSelectMultipleField('追加画像を選択 (複数選択可)', validators=[Optional()])
 
     # カテゴリ選択フィールド
     category = SelectField(
@@ -116,15 +240,8 @@ class PostForm(FlaskForm):
         validators=[Optional()]
     )
     
-    # タグ選択フィールド（複数選択可）
-    tags = QuerySelectMultipleField(
-        'タグ',
-        query_factory=lambda: Tag.query.order_by(Tag.name).all(),
-        get_pk=lambda a: str(a.id),
-        get_label=lambda a: a.name,
-        allow_blank=True,
-        validators=[Optional()]
-    )
+    # タグ選択フィールド（複数選択可、選ばれたタグは1回の IN クエリで取得）
+    tags = TagSelectMultipleField('タグ', validators=[Optional()])
 
     is_published = BooleanField('公開する')
     submit = SubmitField('投稿を作成')
@@ -161,6 +278,30 @@ class PostForm(FlaskForm):
                 return False
         return True
 
+class PostBulkEditForm(FlaskForm):
+    """投稿管理の一括編集フォーム (選択した投稿にタグを追加・削除し、カテゴリを変更)"""
+    # カテゴリを変更しない / 未分類にする場合の選択肢の値
+    KEEP_CATEGORY = ''
+    NO_CATEGORY = 'none'
+
+    post_ids = IdListField('投稿', validators=[DataRequired(message='投稿を選択してください。')])
+    add_tags = TagSelectMultipleField('追加するタグ', validators=[Optional()])
+    remove_tags = TagSelectMultipleField('外すタグ', validators=[Optional()])
+    category = SelectField('カテゴリ', coerce=str, default=KEEP_CATEGORY, validators=[Optional()])
+    submit = SubmitField('選択した投稿に適用')
+
+    def set_category_choices(self, categories):
+        self.category.choices = ([(self.KEEP_CATEGORY, '変更しない'), (self.NO_CATEGORY, '未分類にする')]
+                                 + [(str(c.id), c.name) for c in categories])
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators=extra_validators):
+            return False
+        if not (self.add_tags.data or self.remove_tags.data or self.category.data != self.KEEP_CATEGORY):
+            self.submit.errors.append('追加・削除するタグか、変更後のカテゴリを選択してください。')
+            return False
+        return True
+
 class ImageUploadForm(FlaskForm):
     """単一画像アップロードフォーム（Alt Text付き）"""
     image = FileField('画像ファイル', validators=[
@@ -0,0 +1,170 @@
+# F:\dev\BrogDev\app\image_api.py
+"""
+画像一覧の JSON API (/admin/api/v1/images)。
+
+- (uploaded_at, id) の降順のカーソルページネーション (?cursor= / ?limit=)。OFFSET も COUNT(*) も使いません。
+- ?fields=id,thumbnail_url のように返す項目を選べます (既定は DEFAULT_FIELDS)。
+- 画像の追加・削除・サムネイル生成で変わる集計値 (uploaded_at の最大値・件数・サムネイル作成済み件数) から
+  ETag を作り、If-None-Match が一致すれば一覧を読まずに 304 を返します。
+  (集計値に現れない代替テキストなどの編集だけでは ETag は変わりません。)
+- 画像の URL は配信エンドポイントの接頭辞をリクエストごとに1回だけ url_for で求め、
+  各行ではファイル名を連結するだけにします (Image.url / thumbnail_url は1行ごとに URL マップを引くため)。
+
+レスポンスの形式を変える場合は API_VERSION を上げ、新しいバージョンのエンドポイントを追加してください。
+"""
+
+import hashlib
+from urllib.parse import quote
+
+from flask import current_app, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import and_, case, func, or_
+
+from app.models import Image
+from app.pagination import decode_cursor, make_cursor
+
+API_VERSION = 1
+
+# 返せる項目と既定の項目
+FIELDS = ('id', 'original_filename', 'unique_filename', 'thumbnail_filename', 'thumbnail_status',
+          'alt_text', 'mimetype', 'uploaded_at', 'user_id', 'url', 'thumbnail_url')
+DEFAULT_FIELDS = ('id', 'original_filename', 'alt_text', 'thumbnail_status', 'url', 'thumbnail_url')
+
+# werkzeug の path コンバーターが URL を組み立てる時と同じ、エスケープしない文字
+_PATH_SAFE = "!$&'()*+,/:;=@"
+_PLACEHOLDER = '__filename__'
+
+
+class ApiError(Exception):
+    """API のリクエストが不正な場合に送出し、400 の JSON で応答します。"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ImageUrlBuilder:
+    """
+    画像の URL を組み立てます。配信エンドポイントの接頭辞を最初に1回だけ求め、
+    以降は quote したファイル名を連結するだけなので、1行ごとに url_for を呼びません。
+    Image.url / Image.thumbnail_url と同じ URL を返します。
+    """
+
+    def __init__(self):
+        self.images_prefix = self._prefix('serve_uploaded_images')
+        self.thumbnails_prefix = self._prefix('serve_uploaded_thumbnails')
+        self.default_thumbnail = url_for('static', filename='images/default_thumbnail.png')
+
+    @staticmethod
+    def _prefix(endpoint):
+        url = url_for(endpoint, filename=_PLACEHOLDER)
+        return url[:url.rindex(_PLACEHOLDER)]
+
+    def url(self, image):
+        if not image.unique_filename:
+            return None
+        return self.images_prefix + quote(image.unique_filename, safe=_PATH_SAFE)
+
+    def thumbnail_url(self, image):
+        if image.thumbnail_filename:
+            return self.thumbnails_prefix + quote(image.thumbnail_filename, safe=_PATH_SAFE)
+        return self.url(image) if image.unique_filename else self.default_thumbnail
+
+
+def parse_fields(value):
+    """?fields= の値を項目名のタプルにします。未知の項目があれば ApiError を送出します。"""
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown or not fields:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}" if unknown else 'No fields requested')
+    return fields
+
+
+def serialize_images(images, fields=FIELDS, urls=None):
+    """画像のリストを、指定した項目だけを持つ辞書のリストに変換します。"""
+    urls = urls or ImageUrlBuilder()
+    getters = {
+        'id': lambda image: str(image.id),
+        'user_id': lambda image: str(image.user_id),
+        'uploaded_at': lambda image: image.uploaded_at.isoformat() if image.uploaded_at else None,
+        'url': urls.url,
+        'thumbnail_url': urls.thumbnail_url,
+    }
+    selected = [(name, getters.get(name) or (lambda image, name=name: getattr(image, name))) for name in fields]
+    return [{name: getter(image) for name, getter in selected} for image in images]
+
+
+def collection_etag(query, *parts):
+    """
+    一覧の集計値 (uploaded_at の最大値・件数・サムネイル作成済み件数) とリクエストの条件から ETag を作ります。
+    集計は1クエリで、一覧そのものは読み込みません。
+    """
+    state = (query.order_by(None)
+             .with_entities(func.max(Image.uploaded_at), func.count(Image.id),
+                            func.sum(case((Image.thumbnail_status == 'ready', 1), else_=0)))
+             .one())
+    raw = repr((API_VERSION, tuple(state), parts)).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def parse_cursor(value):
+    """?cursor= の値を (uploaded_at, id) にします。指定がなければ None、不正なら ApiError を送出します。"""
+    if not value:
+        return None
+    key = decode_cursor(value)
+    if key is None:
+        raise ApiError('Invalid cursor')
+    return key
+
+
+def images_page(query, key, limit):
+    """(uploaded_at, id) の降順で key より後の最大 limit 件と、次のページのカーソルを返します。"""
+    page_query = query.order_by(None).order_by(Image.uploaded_at.desc(), Image.id.desc())
+    if key is not None:
+        uploaded_at, image_id = key
+        page_query = page_query.filter(or_(Image.uploaded_at < uploaded_at,
+                                           and_(Image.uploaded_at == uploaded_at, Image.id < image_id)))
+    rows = page_query.limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = make_cursor(items[-1].uploaded_at, items[-1].id) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def images_response(query):
+    """
+    画像一覧 API のレスポンスを返します。query は閲覧できる画像に絞り込んだ Image のクエリです。
+    ETag が一致すれば 304、パラメーターが不正なら 400 を返します。
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        max_limit = current_app.config.get('IMAGE_API_MAX_LIMIT', 200)
+        limit = request.args.get('limit', current_app.config.get('IMAGE_API_DEFAULT_LIMIT', 50), type=int)
+        if not 1 <= limit <= max_limit:
+            raise ApiError(f'limit must be between 1 and {max_limit}')
+        cursor = request.args.get('cursor')
+        key = parse_cursor(cursor)
+
+        etag = collection_etag(query, current_user.get_id(), fields, limit, cursor)
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            items, next_cursor = images_page(query, key, limit)
+            response = jsonify({
+                'version': API_VERSION,
+                'images': serialize_images(items, fields),
+                'next_cursor': next_cursor,
+            })
+    except ApiError as e:
+        response = jsonify({'version': API_VERSION, 'error': e.message})
+        response.status_code = e.status
+        return response
+
+    response.set_etag(etag, weak=True)
+    # 利用者ごとに閲覧できる画像が異なるため共有キャッシュには保存させず、毎回 ETag で再検証させる
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
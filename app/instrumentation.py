@@ -0,0 +1,261 @@
+# F:\dev\BrogDev\app\instrumentation.py
+"""
+リクエストごとの処理時間の計測 (INSTRUMENTATION_ENABLED で有効にします。既定は無効)。
+
+有効にすると、リクエストごとに次の値を計測します:
+    total : リクエスト全体の経過時間 (最初の before_request から最後の after_request まで)
+    db    : SQL の実行回数と合計時間 (Engine の before_cursor_execute / after_cursor_execute)
+    tpl   : render_template の描画時間 (before_render_template / template_rendered シグナル)
+    md    : Markdown の変換時間 (app.utils.render_markdown)
+tpl には描画中の遅延読み込みの SQL や markdown フィルターの時間も含まれます (各値は重なります)。
+
+計測値は Server-Timing ヘッダーでブラウザの開発者ツールに表示され、
+INSTRUMENTATION_SAMPLE_RATE の割合のリクエストはリングバッファ (最新 INSTRUMENTATION_BUFFER_SIZE 件) に記録して
+管理画面 (/admin/instrumentation) で確認できます。
+
+INSTRUMENTATION_PROFILE_THRESHOLD_MS を設定すると全てのリクエストを cProfile で計測し、
+しきい値を超えたリクエストのプロファイルを INSTRUMENTATION_PROFILE_DIR に .prof ファイルとして保存します
+(`python -m pstats <ファイル>` や snakeviz で確認できます)。プロファイル中はリクエストが数倍遅くなります。
+"""
+
+import cProfile
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 接続ごとの実行中の SQL の開始時刻を保存する Connection.info のキー
+_CURSOR_KEY = 'instrumentation_cursor_start'
+
+
+class RequestLog:
+    """サンプリングしたリクエストの計測値を最新 maxlen 件だけ保持するリングバッファ (スレッドセーフ)。"""
+
+    def __init__(self, maxlen):
+        self._records = deque(maxlen=maxlen)
+        self._lock = Lock()
+
+    def append(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self):
+        """新しい順の計測値のリストを返します。"""
+        with self._lock:
+            return list(reversed(self._records))
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+
+class RequestStats:
+    """1リクエストの計測値。"""
+
+    __slots__ = ('start', 'sql_count', 'sql_time', 'template_time', 'markdown_time', '_template_starts', 'profiler')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.markdown_time = 0.0
+        self._template_starts = []
+        self.profiler = None
+
+    def server_timing(self, total):
+        """Server-Timing ヘッダーの値を返します (時間はミリ秒)。"""
+        return ', '.join([
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={self.sql_time * 1000:.1f};desc="SQL x{self.sql_count}"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'md;dur={self.markdown_time * 1000:.1f}',
+        ])
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('instrumentation')
+
+
+def get_request_log():
+    """現在のアプリケーションのリングバッファを返します (計測が無効な場合は None)。"""
+    return current_app.extensions.get('instrumentation')
+
+
+def summarize(records):
+    """計測値をエンドポイントごとに集計し、合計時間の長い順のリストを返します。"""
+    groups = {}
+    for record in records:
+        groups.setdefault(record['endpoint'] or '-', []).append(record)
+    summary = []
+    for endpoint, items in groups.items():
+        durations = sorted(item['duration_ms'] for item in items)
+        summary.append({
+            'endpoint': endpoint,
+            'count': len(items),
+            'avg_ms': round(sum(durations) / len(durations), 2),
+            'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            'max_ms': durations[-1],
+            'avg_sql_count': round(sum(item['sql_count'] for item in items) / len(items), 1),
+            'avg_sql_ms': round(sum(item['sql_ms'] for item in items) / len(items), 2),
+            'avg_template_ms': round(sum(item['template_ms'] for item in items) / len(items), 2),
+        })
+    summary.sort(key=lambda row: row['avg_ms'] * row['count'], reverse=True)
+    return summary
+
+
+@contextmanager
+def timed_markdown():
+    """with ブロックの時間をこのリクエストの Markdown の変換時間に加えます (計測中でなければ何もしません)。"""
+    stats = _current_stats()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.markdown_time += time.perf_counter() - start
+
+
+# --- リクエストの開始・終了 ---
+
+def _start_request():
+    stats = RequestStats()
+    g.instrumentation = stats
+    if current_app.config.get('INSTRUMENTATION_PROFILE_THRESHOLD_MS') is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 別のプロファイラが動作中 (デバッガなど) の場合はプロファイルしない
+            pass
+        else:
+            stats.profiler = profiler
+
+
+def _slug(path):
+    return re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_')[:80] or 'root'
+
+
+def _dump_profile(profiler, elapsed_ms, now):
+    directory = current_app.config['INSTRUMENTATION_PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    filename = f'{now:%Y%m%dT%H%M%S%f}_{request.method}_{_slug(request.path)}_{elapsed_ms:.0f}ms.prof'
+    profiler.dump_stats(os.path.join(directory, filename))
+    current_app.logger.warning('Slow request %s %s took %.1f ms; profile saved to %s',
+                               request.method, request.path, elapsed_ms, filename)
+    return filename
+
+
+def _finish_request(response):
+    stats = g.pop('instrumentation', None)
+    if stats is None:
+        return response
+    if stats.profiler is not None:
+        stats.profiler.disable()
+    total = time.perf_counter() - stats.start
+    elapsed_ms = total * 1000
+    config = current_app.config
+
+    if config.get('INSTRUMENTATION_SERVER_TIMING', True):
+        response.headers['Server-Timing'] = stats.server_timing(total)
+
+    now = datetime.now(timezone.utc)
+    profile = None
+    threshold = config.get('INSTRUMENTATION_PROFILE_THRESHOLD_MS')
+    if stats.profiler is not None and elapsed_ms >= threshold:
+        profile = _dump_profile(stats.profiler, elapsed_ms, now)
+
+    request_log = get_request_log()
+    if profile is not None or random.random() < config.get('INSTRUMENTATION_SAMPLE_RATE', 1.0):
+        request_log.append({
+            'time': now.isoformat(timespec='milliseconds'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 2),
+            'sql_count': stats.sql_count,
+            'sql_ms': round(stats.sql_time * 1000, 2),
+            'template_ms': round(stats.template_time * 1000, 2),
+            'markdown_ms': round(stats.markdown_time * 1000, 2),
+            'profile': profile,
+        })
+    return response
+
+
+def _teardown_request(exc):
+    # 例外で after_request が呼ばれなかった場合もプロファイラを止める
+    stats = g.pop('instrumentation', None)
+    if stats is not None and stats.profiler is not None:
+        stats.profiler.disable()
+
+
+# --- SQL・テンプレート ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault(_CURSOR_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_CURSOR_KEY)
+    stats = _current_stats()
+    if not starts or stats is None:
+        return
+    stats.sql_time += time.perf_counter() - starts.pop()
+    stats.sql_count += 1
+
+
+def _before_render_template(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats._template_starts.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None and stats._template_starts:
+        start = stats._template_starts.pop()
+        # 入れ子の render_template (テンプレート内から呼ばれた場合) は二重に数えない
+        if not stats._template_starts:
+            stats.template_time += time.perf_counter() - start
+
+
+_listeners = (
+    ('before_cursor_execute', _before_cursor_execute),
+    ('after_cursor_execute', _after_cursor_execute),
+)
+
+
+def init_app(app):
+    """INSTRUMENTATION_ENABLED が True の場合、計測のフックとリングバッファを登録します。"""
+    if not app.config.get('INSTRUMENTATION_ENABLED'):
+        return
+    app.extensions['instrumentation'] = RequestLog(app.config.get('INSTRUMENTATION_BUFFER_SIZE', 500))
+
+    # 他のフックを含めて計測するため、before_request は最初に、after_request は最後に実行されるようにする
+    # (after_request は登録と逆の順に実行される)
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request_funcs.setdefault(None, []).insert(0, _finish_request)
+    app.teardown_request(_teardown_request)
+
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    for name, listener in _listeners:
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
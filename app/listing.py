@@ -0,0 +1,165 @@
+# F:\dev\BrogDev\app\listing.py
+"""
+管理画面の一覧ページ共通のページネーション・並べ替え・絞り込み。
+
+各一覧ビューは並べ替え可能な列と絞り込み条件を宣言して AdminListing を作るだけで、
+?page= / ?per_page= / ?sort= / ?status= / ?author= / ?date_from= / ?date_to= の解釈、
+SQL への変換 (ORDER BY / WHERE / LIMIT / OFFSET)、URL の組み立てを共通化します。
+テンプレート側は macros/listing.html のマクロで絞り込みフォーム・列見出し・ページ送りを表示します。
+
+使い方:
+    listing = AdminListing(
+        Comment.query,
+        sorts={'created_at': ('作成日', Comment.created_at)},
+        default_sort='-created_at',
+        statuses={'approved': ('承認済み', Comment.is_approved == True)},
+        author_column=Comment.user_id,
+        date_column=Comment.created_at,
+    )
+    render_template('admin/comments.html', comments=listing.items, listing=listing)
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app, request, url_for
+from sqlalchemy import inspect, select
+
+from app.models import Comment, User
+
+
+def parse_date(value):
+    """YYYY-MM-DD 形式の文字列を datetime に変換します。不正な場合は None を返します。"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+class AdminListing:
+    """
+    管理画面の一覧1ページ分を表します。
+
+    sorts は {キー: (見出し, 列)}、statuses は {値: (表示名, 条件式)} の辞書です。
+    author_column を指定すると ?author=<ユーザー名> で、date_column を指定すると
+    ?date_from= / ?date_to= (両端を含む日付) で絞り込めます。
+    並び順が同じ行の順序が安定するよう、最後に主キーで並べます。
+    """
+
+    def __init__(self, query, sorts, default_sort, statuses=None, author_column=None, date_column=None,
+                 per_page=None):
+        self.sorts = sorts
+        self.statuses = statuses or {}
+        self.author_column = author_column
+        self.date_column = date_column
+        self.default_sort = default_sort
+
+        args = request.args
+        self.sort_key, self.descending = self._parse_sort(args.get('sort', ''))
+        self.status = args.get('status', '') if args.get('status') in self.statuses else ''
+        self.author = args.get('author', '').strip() if author_column is not None else ''
+        self.date_from = parse_date(args.get('date_from')) if date_column is not None else None
+        self.date_to = parse_date(args.get('date_to')) if date_column is not None else None
+
+        max_per_page = current_app.config.get('ADMIN_MAX_PER_PAGE', 200)
+        default_per_page = per_page or current_app.config.get('ADMIN_PER_PAGE', 50)
+        self.per_page = min(max(args.get('per_page', default_per_page, type=int), 1), max_per_page)
+        self.per_page_arg = self.per_page if 'per_page' in args else ''
+
+        self.pagination = self._filtered(query).order_by(*self._order_by(query)).paginate(
+            page=args.get('page', 1, type=int), per_page=self.per_page, error_out=False)
+
+    def _parse_sort(self, value):
+        descending = value.startswith('-')
+        key = value.lstrip('-')
+        if key not in self.sorts:
+            descending = self.default_sort.startswith('-')
+            key = self.default_sort.lstrip('-')
+        return key, descending
+
+    def _filtered(self, query):
+        if self.status:
+            query = query.filter(self.statuses[self.status][1])
+        if self.author:
+            # ユーザー名の一意インデックスで ID を引き、絞り込む列のインデックスで検索する
+            author_id = select(User.id).where(User.username == self.author).scalar_subquery()
+            query = query.filter(self.author_column == author_id)
+        if self.date_from:
+            query = query.filter(self.date_column >= self.date_from)
+        if self.date_to:
+            query = query.filter(self.date_column < self.date_to + timedelta(days=1))
+        return query
+
+    def _order_by(self, query):
+        column = self.sorts[self.sort_key][1]
+        entity = query.column_descriptions[0]['entity']
+        primary_key = inspect(entity).primary_key
+        if self.descending:
+            return [column.desc()] + [c.desc() for c in primary_key]
+        return [column.asc()] + [c.asc() for c in primary_key]
+
+    @property
+    def items(self):
+        return self.pagination.items
+
+    @property
+    def sort(self):
+        """現在の並び順を ?sort= の形式 (降順は先頭に '-') で返します。"""
+        return f"{'-' if self.descending else ''}{self.sort_key}"
+
+    @property
+    def is_filtered(self):
+        return bool(self.status or self.author or self.date_from or self.date_to)
+
+    @property
+    def base_url(self):
+        """絞り込み・並び順を含まない一覧の URL。"""
+        return url_for(request.endpoint, **(request.view_args or {}))
+
+    def url(self, **changes):
+        """現在の絞り込み・並び順を引き継いだ URL を返します。page 以外を変更した場合は1ページ目に戻ります。"""
+        params = {
+            'sort': self.sort,
+            'status': self.status,
+            'author': self.author,
+            'date_from': self.date_from.strftime('%Y-%m-%d') if self.date_from else '',
+            'date_to': self.date_to.strftime('%Y-%m-%d') if self.date_to else '',
+            'per_page': self.per_page_arg,
+            'page': self.pagination.page,
+        }
+        if 'page' not in changes:
+            changes['page'] = 1
+        params.update(changes)
+        if params['sort'] == self.default_sort:
+            params['sort'] = ''
+        if params['page'] == 1:
+            params['page'] = ''
+        params = {key: value for key, value in params.items() if value not in ('', None)}
+        return url_for(request.endpoint, **(request.view_args or {}), **params)
+
+    def sort_url(self, key):
+        """列見出しのリンク先。現在の並び替え列なら昇順・降順を入れ替えます。"""
+        if key == self.sort_key:
+            return self.url(sort=key if self.descending else f'-{key}')
+        return self.url(sort=key)
+
+    def page_url(self, page):
+        return self.url(page=page)
+
+
+def comment_listing(query):
+    """コメント管理の一覧 (blog_admin_bp.list_comments / comments.list_comments 共通)。"""
+    return AdminListing(
+        query,
+        sorts={
+            'created_at': ('作成日', Comment.created_at),
+        },
+        default_sort='-created_at',
+        statuses={
+            'approved': ('承認済み', Comment.is_approved == True),
+            'pending': ('未承認', Comment.is_approved == False),
+        },
+        author_column=Comment.user_id,
+        date_column=Comment.created_at,
+    )
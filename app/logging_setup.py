@@ -0,0 +1,155 @@
+# F:\dev\BrogDev\app\logging_setup.py
+"""
+アプリケーションのロギングの設定 (QueueHandler / QueueListener)。
+
+app.logger には QueueHandler だけを付け、リクエストのスレッドではログレコードをキューに入れるだけにします。
+ファイル (RotatingFileHandler) とコンソール (標準エラー出力の StreamHandler) への書き込みは QueueListener の
+バックグラウンドスレッドで行うため、ディスクの I/O でリクエストが待たされません。
+
+出力は LOG_FORMAT が 'json' の場合、1行に1つの JSON オブジェクト (JSON Lines) です:
+    {"time": "...", "level": "INFO", "logger": "app", "message": "...", "module": "...", "line": 12,
+     "method": "GET", "path": "/posts/..."}
+メッセージの組み立て (% 形式の引数の展開) と例外のトレースバックの文字列化は、
+記録時のリクエストの情報と合わせてキューに入れる前に行います。
+
+設定: LOG_LEVEL・LOG_FORMAT・LOG_DIR・LOG_FILE・LOG_MAX_BYTES・LOG_BACKUP_COUNT・LOG_TO_CONSOLE (config.py)。
+create_app を複数回呼んでも (テストなど)、前のリスナーを止めてハンドラを付け替えます。
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import has_request_context, request
+from flask.logging import default_handler
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# logger の名前ごとの (QueueHandler, QueueListener)
+_pipelines = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行の JSON にします。"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        for key in ('method', 'path', 'remote_addr'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    """
+    キューに入れる前にメッセージと例外を文字列にし、リクエストの情報 (メソッド・パス・接続元) を付ける QueueHandler。
+    標準の QueueHandler.prepare() はフォーマット済みの文字列で msg を置き換えるため、
+    JSON の各フィールドをリスナー側で組み立てられるよう、メッセージの展開だけを行います。
+    """
+
+    def prepare(self, record):
+        # 他のハンドラ (ルートロガーへの伝播など) に渡るレコードは変更しない
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.remote_addr = request.remote_addr
+        # 引数・例外オブジェクト (トレースバックのフレーム) をリスナーのスレッドに渡さない
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def _make_formatter(app):
+    log_format = app.config.get('LOG_FORMAT') or 'json'
+    if log_format == 'json':
+        return JsonFormatter()
+    if log_format == 'text':
+        return logging.Formatter(TEXT_FORMAT)
+    raise ValueError(f"Unknown LOG_FORMAT: {log_format!r} (choose from 'json', 'text')")
+
+
+def _make_handlers(app):
+    formatter = _make_formatter(app)
+    handlers = []
+    log_dir = app.config.get('LOG_DIR')
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = RotatingFileHandler(
+            os.path.join(log_dir, app.config.get('LOG_FILE', 'akiomi_blog.log')),
+            maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=app.config.get('LOG_BACKUP_COUNT', 10),
+            encoding='utf-8', delay=True)
+        handlers.append(file_handler)
+    if app.config.get('LOG_TO_CONSOLE', True):
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _log_level(app):
+    level = app.config.get('LOG_LEVEL')
+    if level is None:
+        return logging.DEBUG if app.debug else logging.INFO
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown LOG_LEVEL: {app.config.get('LOG_LEVEL')!r}")
+    return level
+
+
+def stop_logging(logger_name=None):
+    """リスナーを止め、キューに残ったレコードを書き出します (logger_name を省略すると全て)。"""
+    names = [logger_name] if logger_name else list(_pipelines)
+    for name in names:
+        pipeline = _pipelines.pop(name, None)
+        if pipeline is None:
+            continue
+        queue_handler, listener = pipeline
+        logging.getLogger(name).removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def init_app(app):
+    """app.logger に QueueHandler を付け、ファイル・コンソールに書き込む QueueListener を開始します。"""
+    stop_logging(app.logger.name)
+    # Flask が付ける標準エラー出力のハンドラはコンソールの StreamHandler と重複するため外す
+    app.logger.removeHandler(default_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RequestQueueHandler(log_queue)
+    listener = QueueListener(log_queue, *_make_handlers(app), respect_handler_level=True)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(_log_level(app))
+    listener.start()
+    _pipelines[app.logger.name] = (queue_handler, listener)
+
+
+atexit.register(stop_logging)
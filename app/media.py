@@ -0,0 +1,105 @@
+# F:\dev\BrogDev\app\media.py
+"""
+アップロード画像 (元画像・サムネイル・派生画像) の配信。
+
+アップロードされたファイル名は内容のハッシュ (または UUID) で、同じ URL の内容が変わることはないため、
+長期間の Cache-Control: public, max-age=..., immutable を付けてブラウザや CDN の再検証を省きます。
+ETag (ファイル名から作成) / Last-Modified による 304 応答と、大きな元画像向けの Range リクエスト (206) にも対応します。
+
+UPLOAD_SEND_FILE_MODE を設定すると、ファイル本体の転送をフロントのプロキシに任せます。
+    'x-accel'    : nginx の X-Accel-Redirect (UPLOAD_ACCEL_REDIRECT_PREFIX 以下の internal location に転送)
+    'x-sendfile' : Apache mod_xsendfile / lighttpd の X-Sendfile (ファイルの絶対パスを通知)
+
+nginx の設定例 (UPLOAD_ACCEL_REDIRECT_PREFIX = '/_uploads' の場合):
+    location /_uploads/ {
+        internal;
+        alias /path/to/BrogDev/static/uploads/;
+    }
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+# UPLOAD_SEND_FILE_MODE の値
+SEND_FILE_MODES = (None, 'x-accel', 'x-sendfile')
+
+
+def _etag(filename):
+    """
+    ファイル名から強い ETag を作成します。
+    ファイル名は内容のハッシュ (と派生画像の幅・形式) で同じ名前の内容は変わらないため、
+    更新時刻やサイズと違い、同じ秒の書き直しやホスト・コピー間でも一致します。
+    """
+    return hashlib.sha1(filename.encode('utf-8')).hexdigest()
+
+
+def _set_cache_headers(response, max_age):
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+
+
+def send_upload(directory, filename, accel_subdir):
+    """
+    directory 内の filename を配信するレスポンスを返します。
+    accel_subdir は X-Accel-Redirect で使う UPLOAD_ACCEL_REDIRECT_PREFIX 以下のサブディレクトリ名です。
+    """
+    config = current_app.config
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mode = config.get('UPLOAD_SEND_FILE_MODE')
+    if mode not in SEND_FILE_MODES:
+        raise ValueError(f"Unknown UPLOAD_SEND_FILE_MODE: {mode}")
+    max_age = config.get('UPLOAD_CACHE_MAX_AGE', 31536000)
+    stat = os.stat(path)
+
+    if mode == 'x-accel':
+        # 本体は nginx が送るため、ここでは検証用のヘッダーと 304 判定のみ行う (Range も nginx が処理する)
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        prefix = config.get('UPLOAD_ACCEL_REDIRECT_PREFIX', '/_uploads').rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{accel_subdir}/{filename}"
+        response.set_etag(_etag(filename))
+        response.last_modified = stat.st_mtime
+        _set_cache_headers(response, max_age)
+        return response.make_conditional(request)
+
+    response = send_file(
+        path,
+        request.environ,
+        conditional=True,
+        etag=_etag(filename),
+        last_modified=stat.st_mtime,
+        max_age=max_age,
+        use_x_sendfile=(mode == 'x-sendfile'),
+        response_class=current_app.response_class,
+    )
+    if mode is None:
+        # Range に対応していることを最初の応答で伝える (大きな元画像の分割取得用)
+        response.accept_ranges = 'bytes'
+    _set_cache_headers(response, max_age)
+    return response
+
+
+def init_app(app):
+    """アップロード画像の配信エンドポイントを登録します。"""
+
+    @app.route('/uploads/images/<path:filename>')
+    def serve_uploaded_images(filename):
+        return send_upload(current_app.config['UPLOAD_IMAGES_DIR'], filename, 'images')
+
+    @app.route('/uploads/thumbnails/<path:filename>')
+    def serve_uploaded_thumbnails(filename):
+        return send_upload(current_app.config['UPLOAD_THUMBNAILS_DIR'], filename, 'thumbnails')
+
+    @app.route('/uploads/variants/<path:filename>')
+    def serve_uploaded_variants(filename):
+        return send_upload(current_app.config['UPLOAD_VARIANTS_DIR'], filename, 'variants')
@@ -9,24 +9,31 @@ from sqlalchemy.schema import PrimaryKeyConstraint, UniqueConstraint
 import pytz
 from app.extensions import db
 
+# UUID の列は PostgreSQL ではネイティブの uuid 型、SQLite では 16 バイトの BLOB (BINARY(16)) で保存する
+# (32 文字の16進文字列より索引・結合が小さく速い)
 from sqlalchemy_utils import UUIDType
 from sqlalchemy.orm import relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import url_for, current_app
+from app.utils import render_markdown, body_hash
 
 
 # 多対多のリレーションシップ用ヘルパーテーブル
 post_tags = db.Table(
     'post_tags',
-    db.Column('post_id', UUIDType(binary=False), db.ForeignKey('post.id'), primary_key=True),
-    db.Column('tag_id', UUIDType(binary=False), db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('post_id', UUIDType(binary=True), db.ForeignKey('post.id'), primary_key=True),
+    db.Column('tag_id', UUIDType(binary=True), db.ForeignKey('tag.id'), primary_key=True),
+    # 主キー (post_id, tag_id) では tag_id からの逆引きができないため、タグ別一覧用に索引を追加
+    db.Index('ix_post_tags_tag_id', 'tag_id')
 )
 
 # Post と Additional_Images の多対多リレーションシップのための結合テーブル
 post_additional_images = db.Table(
     'post_additional_images', # 結合テーブルの名前
-    db.Column('post_id', UUIDType(binary=False), db.ForeignKey('post.id'), primary_key=True),
-    db.Column('image_id', UUIDType(binary=False), db.ForeignKey('image.id'), primary_key=True)
+    db.Column('post_id', UUIDType(binary=True), db.ForeignKey('post.id'), primary_key=True),
+    db.Column('image_id', UUIDType(binary=True), db.ForeignKey('image.id'), primary_key=True),
+    # 主キー (post_id, image_id) では image_id からの逆引き (画像を使っている投稿) ができないため索引を追加
+    db.Index('ix_post_additional_images_image_id', 'image_id')
 )
 
 
@@ -45,8 +52,10 @@ class Role(db.Model, RoleMixin):
 
 roles_users = db.Table(
     'roles_users',
-    db.Column('user_id', UUIDType(binary=False), db.ForeignKey('user.id'), primary_key=True),
-    db.Column('role_id', db.Integer, db.ForeignKey('role.id'), primary_key=True)
+    db.Column('user_id', UUIDType(binary=True), db.ForeignKey('user.id'), primary_key=True),
+    db.Column('role_id', db.Integer, db.ForeignKey('role.id'), primary_key=True),
+    # ロールに属する利用者の逆引き用 (PostgreSQL は外部キーに索引を自動では作らない)
+    db.Index('ix_roles_users_role_id', 'role_id')
 )
 class User(UserMixin, db.Model):
     """
@@ -54,7 +63,7 @@ class User(UserMixin, db.Model):
     （投稿、カテゴリ、タグ、画像、コメント）との関係を処理します。
     """
     __tablename__ = 'user'
-    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid.uuid4)
+    id = db.Column(UUIDType(binary=True), primary_key=True, default=uuid.uuid4)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
@@ -130,17 +139,20 @@ class Category(db.Model):
     ユーザーごとにカテゴリ名とスラッグの一意性を保証します。
     """
     __tablename__ = 'category'
-    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid.uuid4)
+    id = db.Column(UUIDType(binary=True), primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(128), nullable=False)
     slug = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc), nullable=False)
     
-    user_id = db.Column(UUIDType(binary=False), db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(UUIDType(binary=True), db.ForeignKey('user.id'), nullable=False)
+    # 公開済み投稿の件数 (app/tag_counts.py のイベントで増減します)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     __table_args__ = (UniqueConstraint('name', 'user_id', name='_category_name_user_id_uc'),
-                    UniqueConstraint('slug', 'user_id', name='_category_slug_user_id_uc'))
+                    UniqueConstraint('slug', 'user_id', name='_category_slug_user_id_uc'),
+                    db.Index('ix_category_post_count', 'post_count'))
     
     posts = relationship('Post', back_populates='category', lazy='dynamic')
 
@@ -154,50 +166,73 @@ class Tag(db.Model):
     """
     __tablename__ = 'tag'
     
-    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid.uuid4)
+    id = db.Column(UUIDType(binary=True), primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(64), nullable=False)
     slug = db.Column(db.String(64), nullable=False)
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc), nullable=False)
 
-    user_id = db.Column(UUIDType(binary=False), db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(UUIDType(binary=True), db.ForeignKey('user.id'), nullable=False)
+    # 公開済み投稿の件数 (app/tag_counts.py のイベントで増減します)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     __table_args__ = (UniqueConstraint('name', 'user_id', name='_tag_name_user_id_uc'),
-                    UniqueConstraint('slug', 'user_id', name='_tag_slug_user_id_uc'))
+                    UniqueConstraint('slug', 'user_id', name='_tag_slug_user_id_uc'),
+                    # タグクラウド (home.tag_cloud) を件数の多い順に読む用
+                    db.Index('ix_tag_post_count', 'post_count'))
 
     def __repr__(self):
         return f'<Tag {self.name}>'
 
 class Image(db.Model):
     __tablename__ = 'image' 
-    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid.uuid4) 
+    id = db.Column(UUIDType(binary=True), primary_key=True, default=uuid.uuid4) 
     original_filename = db.Column(db.String(255), nullable=False)
-    unique_filename = db.Column(db.String(255), unique=True, nullable=False)
+    # 保存ファイル名 (<sha256><拡張子>)。同じ内容の画像は同じファイルを共有するため一意ではない
+    unique_filename = db.Column(db.String(255), nullable=False)
+    # ファイル内容の SHA-256 (重複排除と参照数の判定に使用)。導入前の画像は NULL
+    content_hash = db.Column(db.String(64), nullable=True)
     thumbnail_filename = db.Column(db.String(255), nullable=True) 
     filepath = db.Column(db.String(500), nullable=False)
     thumbnail_filepath = db.Column(db.String(500), nullable=True)
+    # サムネイルの生成状態 ('pending': ワーカー待ち, 'ready': 生成済み, 'failed': 生成失敗)
+    thumbnail_status = db.Column(db.String(16), nullable=False, default='ready', server_default='ready')
     
     mimetype = db.Column(db.String(100), nullable=True)
 
     uploaded_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc))
-    user_id = db.Column(UUIDType(binary=False), db.ForeignKey('user.id'), nullable=False) 
+    user_id = db.Column(UUIDType(binary=True), db.ForeignKey('user.id'), nullable=False) 
     is_main_image = db.Column(db.Boolean, default=False) 
     alt_text = db.Column(db.String(255), nullable=True) 
 
-    post_id = db.Column(UUIDType(binary=False), db.ForeignKey('post.id'), nullable=True) 
+    post_id = db.Column(UUIDType(binary=True), db.ForeignKey('post.id'), nullable=True) 
 
     uploader = relationship('User', back_populates='uploaded_images') 
     post = relationship('Post', back_populates='images', foreign_keys=[post_id]) 
 
     main_image_for_post = relationship('Post', back_populates='main_image', uselist=False, foreign_keys='Post.main_image_id', overlaps="post_as_main_image")
 
+    jobs = relationship('ImageJob', back_populates='image', cascade='all, delete-orphan')
+    variants = relationship('ImageVariant', back_populates='image', cascade='all, delete-orphan',
+                            order_by='ImageVariant.width')
+
+    __table_args__ = (
+        # ユーザー別の画像一覧 (uploaded_at 降順) 用
+        db.Index('ix_image_user_id_uploaded_at', 'user_id', 'uploaded_at'),
+        # 管理画面の画像一覧 (全ユーザー分、uploaded_at 順) 用
+        db.Index('ix_image_uploaded_at', 'uploaded_at'),
+        # アップロード時の重複検出・削除時の参照数確認用
+        db.Index('ix_image_content_hash', 'content_hash'),
+    )
+
 
     @property
     def url(self):
         # インデントを揃える
         if self.unique_filename:
-            return url_for('static', filename=os.path.join(current_app.config['UPLOAD_FOLDER_RELATIVE_PATH'], self.unique_filename).replace('\\', '/'))
+            # 長期キャッシュ付きで配信する専用エンドポイント (app/media.py) を使用
+            return url_for('serve_uploaded_images', filename=self.unique_filename)
         # else に続くか、if ブロックと同じインデントレベルにする
         return None # unique_filename がない場合はURLを返さない
 
@@ -206,29 +241,97 @@ class Image(db.Model):
     def thumbnail_url(self):
         # インデントを揃える
         if self.thumbnail_filename:
-            return url_for('static', filename=os.path.join(current_app.config['THUMBNAIL_FOLDER_RELATIVE_PATH'], self.thumbnail_filename).replace('\\', '/'))
+            return url_for('serve_uploaded_thumbnails', filename=self.thumbnail_filename)
         # else に続くか、if ブロックと同じインデントレベルにする
         return self.url if self.unique_filename else url_for('static', filename='images/default_thumbnail.png')
 
+    @property
+    def variant_formats(self):
+        """派生画像が存在する形式を優先順 (AVIF, WebP) で返します。"""
+        formats = {v.format for v in self.variants}
+        return [fmt for fmt in ('avif', 'webp') if fmt in formats]
+
+    def srcset(self, fmt='webp'):
+        """指定形式の派生画像を '<URL> <幅>w, ...' 形式で返します (<source srcset> 用)。派生画像がなければ空文字列を返します。"""
+        return ', '.join(f'{v.url} {v.width}w' for v in self.variants if v.format == fmt)
+
     def __repr__(self):
         return f"<Image '{self.original_filename}' ({self.unique_filename})>"
 
+
+class ImageVariant(db.Model):
+    """
+    Image から生成した幅・形式別の派生画像 (レスポンシブ画像の srcset 用)。
+    """
+    __tablename__ = 'image_variant'
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(UUIDType(binary=True), db.ForeignKey('image.id'), nullable=False)
+    format = db.Column(db.String(16), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    bytes = db.Column(db.Integer, nullable=True)
+
+    image = relationship('Image', back_populates='variants')
+
+    __table_args__ = (
+        UniqueConstraint('image_id', 'format', 'width', name='uq_image_variant_image_id_format_width'),
+    )
+
+    @property
+    def url(self):
+        return url_for('serve_uploaded_variants', filename=self.filename)
+
+    def __repr__(self):
+        return f"<ImageVariant {self.filename} {self.width}w>"
+
+
+class ImageJob(db.Model):
+    """
+    画像の派生ファイル (サムネイルなど) を生成するバックグラウンドジョブ。
+    `flask init thumbnail-worker` が status='pending' の行を取り出して処理します。
+    """
+    __tablename__ = 'image_job'
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(UUIDType(binary=True), db.ForeignKey('image.id'), nullable=False)
+    kind = db.Column(db.String(32), nullable=False, default='thumbnail')
+    # 'pending' / 'running' / 'done' / 'failed'
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc))
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    image = relationship('Image', back_populates='jobs')
+
+    __table_args__ = (
+        # ワーカーが未処理ジョブを古い順に取り出す用
+        db.Index('ix_image_job_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<ImageJob {self.id} {self.kind} {self.status}>"
+
 class Post(db.Model):
     """
     ブログ投稿を表し、そのコンテンツ、公開ステータス、
     および作成者、カテゴリ、タグ、画像との関係を含みます。
     """
     __tablename__ = 'post'
-    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid.uuid4)
+    id = db.Column(UUIDType(binary=True), primary_key=True, default=uuid.uuid4)
     title = db.Column(db.String(256), nullable=False)
     body = db.Column(db.Text, nullable=False) 
+    # Markdown 変換済み HTML のキャッシュ。body_hash が現在の body と一致する場合のみ有効
+    body_html = db.Column(db.Text, nullable=True)
+    body_hash = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc), nullable=False)
     is_published = db.Column(db.Boolean, default=False, nullable=False)
 
-    user_id = db.Column(UUIDType(binary=False), db.ForeignKey('user.id'), nullable=False)
-    category_id = db.Column(UUIDType(binary=False), db.ForeignKey('category.id'), nullable=True)
-    main_image_id = db.Column(UUIDType(binary=False), db.ForeignKey('image.id'), unique=True, nullable=True) 
+    user_id = db.Column(UUIDType(binary=True), db.ForeignKey('user.id'), nullable=False)
+    category_id = db.Column(UUIDType(binary=True), db.ForeignKey('category.id'), nullable=True)
+    main_image_id = db.Column(UUIDType(binary=True), db.ForeignKey('image.id'), unique=True, nullable=True) 
 
     # リレーションシップ
     posted_by = relationship('User', back_populates='posts')
@@ -258,6 +361,38 @@ class Post(db.Model):
     # back_populates を追加し、Comment.post との双方向関係を明示
     comments = relationship('Comment', back_populates='post', lazy='dynamic', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # 公開済み投稿の新着順一覧 (home.index, public_posts.list_posts など) 用
+        db.Index('ix_post_is_published_created_at', 'is_published', 'created_at'),
+        # カテゴリ別の公開済み投稿一覧 (home.posts_by_category) 用
+        db.Index('ix_post_category_id_is_published_created_at', 'category_id', 'is_published', 'created_at'),
+        # 管理画面の投稿一覧 (全件 / 作成者で絞り込み、created_at 順) 用
+        db.Index('ix_post_created_at', 'created_at'),
+        db.Index('ix_post_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    def render_body_html(self, force=False):
+        """
+        本文が変更されていれば Markdown を変換して body_html / body_hash を更新します。
+        更新した場合は True を返します。投稿の保存時に呼び出してください。
+        """
+        current_hash = body_hash(self.body)
+        if not force and self.body_html is not None and self.body_hash == current_hash:
+            return False
+        self.body_html = render_markdown(self.body)
+        self.body_hash = current_hash
+        return True
+
+    @property
+    def body_rendered(self):
+        """
+        テンプレート表示用の本文 HTML。キャッシュが有効ならそれを返し、
+        未作成または古い場合のみその場で変換します (キャッシュは更新しません)。
+        """
+        if self.body_html is not None and self.body_hash == body_hash(self.body):
+            return self.body_html
+        return render_markdown(self.body)
+
     def __repr__(self):
         return f'<Post {self.title}>'
         
@@ -266,15 +401,15 @@ class Comment(db.Model):
     ユーザーがブログ投稿に対して行ったコメントを表します。
     """
     __tablename__ = 'comment'
-    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid.uuid4)
+    id = db.Column(UUIDType(binary=True), primary_key=True, default=uuid.uuid4)
     body = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), nullable=False)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc), nullable=False)
     is_approved = db.Column(db.Boolean, default=False, nullable=False)
 
-    user_id = db.Column(UUIDType(binary=False), db.ForeignKey('user.id'), nullable=False) 
-    post_id = db.Column(UUIDType(binary=False), db.ForeignKey('post.id'), nullable=False) 
+    user_id = db.Column(UUIDType(binary=True), db.ForeignKey('user.id'), nullable=False) 
+    post_id = db.Column(UUIDType(binary=True), db.ForeignKey('post.id'), nullable=False) 
     author_name = db.Column(db.String(64), nullable=False)  # ←この行を追加
 
     # ★★★ 修正点 3 ★★★
@@ -282,10 +417,70 @@ class Comment(db.Model):
     # back_populates を設定して双方向関係を確立
     comment_author = relationship('User', back_populates='comments')
     post = relationship('Post', back_populates='comments')
+
+    __table_args__ = (
+        # 投稿詳細ページの承認済みコメント一覧用
+        db.Index('ix_comment_post_id_is_approved_created_at', 'post_id', 'is_approved', 'created_at'),
+        # 管理画面のコメント一覧 (全件 / 承認状態 / 作成者で絞り込み、created_at 順) 用
+        db.Index('ix_comment_created_at', 'created_at'),
+        db.Index('ix_comment_is_approved_created_at', 'is_approved', 'created_at'),
+        db.Index('ix_comment_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<Comment {self.id} on Post {self.post_id}>'
     
+class SiteStat(db.Model):
+    """
+    管理ダッシュボード用の集計値 (投稿数・コメント数など)。
+    app/stats.py が行の追加・削除に合わせて増減させるため、表示時に COUNT(*) を実行する必要がありません。
+    """
+    __tablename__ = 'site_stat'
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SiteStat {self.name}={self.value}>"
+
+
+class RelatedPost(db.Model):
+    """
+    投稿ごとの関連記事 (上位 N 件) の事前計算結果。
+    app/related.py がタグの Jaccard 係数とカテゴリの一致から求めたスコアの順に rank を付けて保存します。
+    """
+    __tablename__ = 'related_post'
+    post_id = db.Column(UUIDType(binary=True), db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    related_post_id = db.Column(UUIDType(binary=True), db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    related_post = relationship('Post', foreign_keys=[related_post_id])
+
+    __table_args__ = (
+        # 投稿詳細ページで rank 順に読む用
+        db.Index('ix_related_post_post_id_rank', 'post_id', 'rank'),
+        # 関連先の投稿が変更・削除された時に、それを含む一覧を探す用
+        db.Index('ix_related_post_related_post_id', 'related_post_id'),
+    )
+
+    def __repr__(self):
+        return f"<RelatedPost {self.post_id} -> {self.related_post_id} #{self.rank}>"
+
+
+class RelatedPostState(db.Model):
+    """
+    関連記事を最後に計算した時の投稿のタグ・カテゴリの署名と日時 (投稿ごと)。
+    現在のタグ・カテゴリの署名と異なる投稿 (とその影響を受ける投稿) だけが次回の計算の対象になります。
+    """
+    __tablename__ = 'related_post_state'
+    post_id = db.Column(UUIDType(binary=True), db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    signature = db.Column(db.String(40), nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RelatedPostState {self.post_id} {self.computed_at}>"
+
+
 class QR(db.Model):
     __tablename__ = 'qr_codes' # テーブル名を指定する
     id = db.Column(db.Integer, primary_key=True)
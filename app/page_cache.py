@@ -0,0 +1,296 @@
+# F:\dev\BrogDev\app\page_cache.py
+"""
+匿名ユーザー向け公開ページのレスポンス全体のキャッシュ。
+
+公開ページ (トップ・記事詳細・カテゴリ別・タグ別・記事一覧) の内容が変わるのは
+記事やコメントが保存されたときだけのため、未ログインのアクセスには描画済みの HTML をそのまま返します。
+キャッシュのキーはパスとクエリ文字列で、ログイン中のユーザーやフラッシュメッセージが残っている場合は使用しません。
+読み取り専用レプリカ (app/db_routing.py) を使う場合も、キャッシュに保存するページはプライマリから描画します。
+
+バックエンド (PAGE_CACHE_BACKEND):
+    'filesystem' : PAGE_CACHE_DIR 以下のファイル (複数のワーカープロセスで共有。既定)
+    'memory'     : プロセス内の LRU (PAGE_CACHE_MAX_BYTES を超えると古いものから破棄)
+                   破棄はコミットしたプロセス内でしか行われないため、ワーカーが1プロセスの場合専用です
+    None         : キャッシュしない
+
+Post / Comment / Tag / Category / Image (と派生画像)・関連記事の行や投稿者名を変更したトランザクションがコミットされると、
+SQLAlchemy の after_commit イベントでキャッシュ全体を破棄します。
+破棄は「世代」を進めることで行い (filesystem では GENERATION ファイルを全プロセスで共有)、
+古い世代で描画中だったリクエストの結果は新しい世代では参照されません。
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, has_app_context, request, session
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.db_routing import read_from_primary
+
+# 変更されたら公開ページのキャッシュを破棄するテーブル
+WATCHED_TABLES = frozenset({
+    'post', 'comment', 'tag', 'category', 'image', 'image_variant',
+    'post_tags', 'post_additional_images', 'related_post', 'user',
+})
+# 公開ページに表示する列の更新でだけキャッシュを破棄するテーブル
+# (user はログインのたびに last_login_at などが更新されるため、投稿者名 (username) の変更だけを見る。
+#  利用者の追加では表示は変わらず、投稿のある利用者の削除は post の変更として検知される)
+WATCHED_COLUMNS = {
+    'user': frozenset({'username'}),
+}
+
+_SESSION_FLAG = 'page_cache_invalidate'
+
+
+class MemoryPageCache:
+    """プロセス内の LRU キャッシュ。保存する本文の合計が max_bytes を超えると古いものから破棄します。"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generation = 0
+        self._lock = Lock()
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] is not None and entry['expires'] <= now:
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key)
+        self._size -= len(entry['body'])
+
+
+class FileSystemPageCache:
+    """
+    directory 以下にエントリを1件1ファイルで保存するキャッシュ。
+    世代番号も同じディレクトリのファイルに保存するため、どのプロセスで破棄しても全プロセスに反映されます。
+    """
+
+    GENERATION_FILE = 'GENERATION'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def generation(self):
+        try:
+            with open(os.path.join(self.directory, self.GENERATION_FILE), encoding='ascii') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('key') != key:
+            return None
+        if entry['expires'] is not None and entry['expires'] <= time.time():
+            return None
+        return entry
+
+    def set(self, key, entry):
+        # 書き込み途中のファイルを他のプロセスが読まないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(dict(entry, key=key), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self):
+        generation = self.generation() + 1
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='ascii') as f:
+            f.write(str(generation))
+        os.replace(tmp_path, os.path.join(self.directory, self.GENERATION_FILE))
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def create_page_cache(config):
+    """設定からキャッシュのバックエンドを作成します。PAGE_CACHE_BACKEND が None の場合は None を返します。"""
+    backend = config.get('PAGE_CACHE_BACKEND')
+    if backend is None:
+        return None
+    if backend == 'memory':
+        return MemoryPageCache(config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    if backend == 'filesystem':
+        return FileSystemPageCache(config['PAGE_CACHE_DIR'])
+    raise ValueError(f"Unknown PAGE_CACHE_BACKEND: {backend}")
+
+
+def get_page_cache():
+    """現在のアプリケーションのページキャッシュを返します (無効な場合は None)。"""
+    return current_app.extensions.get('page_cache')
+
+
+def clear_page_cache():
+    """現在のアプリケーションのページキャッシュを全て破棄します。"""
+    cache = get_page_cache()
+    if cache is not None:
+        cache.clear()
+
+
+def _request_cacheable():
+    if request.method != 'GET' or current_user.is_authenticated:
+        return False
+    # 表示待ちのフラッシュメッセージがある場合はその場で描画する
+    return '_flashes' not in session
+
+
+def _response_cacheable(response):
+    if response.status_code != 200 or response.direct_passthrough:
+        return False
+    if response.mimetype != 'text/html':
+        return False
+    # CSRF トークンの発行などでセッションが変更された応答は他の利用者と共有できない
+    return not session.modified and 'Set-Cookie' not in response.headers
+
+
+def _cache_key(generation):
+    query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    return f'{generation}:{request.path}?{query}'
+
+
+def cached_page(view):
+    """
+    ビュー関数の応答を匿名ユーザー向けにキャッシュするデコレータ。
+    ルートのデコレータの下 (ビュー関数側) に指定してください。
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = get_page_cache()
+        if cache is None or not _request_cacheable():
+            return view(*args, **kwargs)
+
+        key = _cache_key(cache.generation())
+        entry = cache.get(key)
+        if entry is not None:
+            response = current_app.response_class(entry['body'], status=entry['status'], headers=entry['headers'])
+            response.headers['X-Page-Cache'] = 'HIT'
+            # 保存時の ETag (conditional_page) で、クエリなしで 304 を返せる
+            return response.make_conditional(request)
+
+        # 他の利用者と共有するため、遅れている可能性のあるレプリカではなくプライマリから描画する
+        read_from_primary()
+        response = current_app.make_response(view(*args, **kwargs))
+        if _response_cacheable(response):
+            ttl = current_app.config.get('PAGE_CACHE_TTL')
+            cache.set(key, {
+                'status': response.status_code,
+                'headers': [(k, v) for k, v in response.headers.items() if k.lower() != 'content-length'],
+                'body': response.get_data(),
+                'expires': time.time() + ttl if ttl else None,
+            })
+            response.headers['X-Page-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def _changes_watched_columns(obj, columns):
+    state = inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in columns)
+
+
+def _touches_watched_tables(db_session):
+    for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is None or table.name not in WATCHED_TABLES:
+            continue
+        columns = WATCHED_COLUMNS.get(table.name)
+        if columns is None:
+            return True
+        if obj in db_session.dirty and _changes_watched_columns(obj, columns):
+            return True
+    return False
+
+
+def _mark_after_flush(db_session, flush_context):
+    if _touches_watched_tables(db_session):
+        db_session.info[_SESSION_FLAG] = True
+
+
+def _mark_bulk_statement(orm_execute_state):
+    """Query.update() や insert(Image) などフラッシュを経由しない変更も検知します。"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and getattr(table, 'name', None) in WATCHED_TABLES:
+        orm_execute_state.session.info[_SESSION_FLAG] = True
+
+
+def _invalidate_after_commit(db_session):
+    if db_session.info.pop(_SESSION_FLAG, False) and has_app_context():
+        clear_page_cache()
+
+
+def _reset_after_rollback(db_session):
+    db_session.info.pop(_SESSION_FLAG, None)
+
+
+_listeners = (
+    ('after_flush', _mark_after_flush),
+    ('do_orm_execute', _mark_bulk_statement),
+    ('after_commit', _invalidate_after_commit),
+    ('after_rollback', _reset_after_rollback),
+)
+
+
+def init_app(app):
+    """ページキャッシュを作成し、コミット時の破棄イベントを登録します。"""
+    app.extensions['page_cache'] = create_page_cache(app.config)
+    for name, listener in _listeners:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -0,0 +1,171 @@
+# F:\dev\BrogDev\app\pagination.py
+"""
+投稿一覧用のページネーションヘルパー。
+
+通常は Flask-SQLAlchemy の OFFSET ページネーション (?page=N) を使用しますが、
+KEYSET_PAGINATION が有効な場合、またはリクエストに ?after= / ?before= が含まれる場合は
+(created_at, id) をカーソルとするキーセットページネーションを使用します。
+キーセット方式では OFFSET も COUNT(*) も発行しないため、深いページでも一定の速度で応答します。
+"""
+
+import base64
+import binascii
+import time
+import uuid
+from datetime import datetime
+from threading import Lock
+
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_
+
+from app.models import Post
+
+# cached_count 用のプロセス内キャッシュ {キー: (件数, 有効期限)}
+_count_cache = {}
+_count_cache_lock = Lock()
+
+
+def make_cursor(timestamp, row_id):
+    """(日時, UUID) を URL に載せられる不透明なトークンに変換します。decode_cursor で元に戻せます。"""
+    raw = f"{timestamp.isoformat()}|{row_id.hex}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def encode_cursor(post):
+    """投稿の (created_at, id) を URL に載せられる不透明なトークンに変換します。"""
+    return make_cursor(post.created_at, post.id)
+
+
+def decode_cursor(token):
+    """make_cursor / encode_cursor で作成したトークンを (日時, id) に戻します。不正な場合は None を返します。"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at_str, id_hex = base64.urlsafe_b64decode(padded).decode('ascii').split('|', 1)
+        return datetime.fromisoformat(created_at_str), uuid.UUID(hex=id_hex)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def cached_count(query, key, ttl=None):
+    """
+    query の件数をプロセス内に ttl 秒キャッシュして返します。
+    一覧の総件数表示など、厳密な値が不要な用途でリクエストごとの COUNT(*) を避けるために使用します。
+    """
+    if ttl is None:
+        ttl = current_app.config.get('PAGINATION_COUNT_CACHE_SECONDS', 60)
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        _count_cache[key] = (total, now + ttl)
+    return total
+
+
+def clear_count_cache():
+    """cached_count のキャッシュを全て破棄します。"""
+    with _count_cache_lock:
+        _count_cache.clear()
+
+
+class KeysetPage:
+    """
+    キーセットページネーションの結果。
+    テンプレートやビューからは Flask-SQLAlchemy の Pagination と同じく items / has_next / has_prev で扱えます。
+    """
+
+    def __init__(self, query, items, per_page, next_cursor, prev_cursor, count_key=None):
+        self.query = query
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.count_key = count_key
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total(self):
+        """総件数 (cached_count によるキャッシュ値)。参照された場合のみ COUNT を実行します。"""
+        if self.count_key is None:
+            return None
+        return cached_count(self.query, self.count_key)
+
+
+def keyset_paginate(query, per_page, after=None, before=None, count_key=None):
+    """
+    Post のクエリを (created_at, id) の降順でキーセットページネーションします。
+    after を指定するとそれより古い投稿、before を指定するとそれより新しい投稿のページを返します。
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+
+    if before_key is not None:
+        created_at, post_id = before_key
+        rows = (query.filter(or_(Post.created_at > created_at,
+                                 and_(Post.created_at == created_at, Post.id > post_id)))
+                .order_by(None).order_by(Post.created_at.asc(), Post.id.asc())
+                .limit(per_page + 1).all())
+        has_more_newer = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        next_cursor = encode_cursor(items[-1]) if items else before
+        prev_cursor = encode_cursor(items[0]) if items and has_more_newer else None
+    else:
+        page_query = query.order_by(None).order_by(Post.created_at.desc(), Post.id.desc())
+        if after_key is not None:
+            created_at, post_id = after_key
+            page_query = page_query.filter(or_(Post.created_at < created_at,
+                                               and_(Post.created_at == created_at, Post.id < post_id)))
+        rows = page_query.limit(per_page + 1).all()
+        items = rows[:per_page]
+        next_cursor = encode_cursor(items[-1]) if len(rows) > per_page else None
+        prev_cursor = encode_cursor(items[0]) if after_key is not None and items else None
+
+    return KeysetPage(query, items, per_page, next_cursor, prev_cursor, count_key=count_key)
+
+
+def use_keyset():
+    """現在のリクエストでキーセットページネーションを使用するかどうかを返します。"""
+    return (current_app.config.get('KEYSET_PAGINATION', False)
+            or 'after' in request.args or 'before' in request.args)
+
+
+def paginate_posts(posts_query, endpoint, count_key=None, keyset=True, **url_kwargs):
+    """
+    投稿一覧のクエリをページネーションし、(pagination, next_url, prev_url) を返します。
+    キーセット方式では ?after= / ?before=、OFFSET 方式では ?page= の URL を生成します。
+    関連度順など created_at 以外で並べるクエリでは keyset=False を指定してください。
+    """
+    per_page = current_app.config.get('POSTS_PER_PAGE', 10)
+
+    if keyset and use_keyset():
+        pagination = keyset_paginate(
+            posts_query, per_page,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            count_key=count_key,
+        )
+        next_url = url_for(endpoint, after=pagination.next_cursor, **url_kwargs) if pagination.has_next else None
+        prev_url = url_for(endpoint, before=pagination.prev_cursor, **url_kwargs) if pagination.has_prev else None
+        return pagination, next_url, prev_url
+
+    page = request.args.get('page', 1, type=int)
+    if count_key is not None and current_app.config.get('PAGINATION_CACHED_COUNT', False):
+        # リクエストごとの COUNT(*) を省略し、キャッシュした総件数でページ数を計算する
+        pagination = posts_query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+        pagination.total = cached_count(posts_query, count_key)
+    else:
+        pagination = posts_query.paginate(page=page, per_page=per_page, error_out=False)
+    next_url = url_for(endpoint, page=pagination.next_num, **url_kwargs) if pagination.has_next else None
+    prev_url = url_for(endpoint, page=pagination.prev_num, **url_kwargs) if pagination.has_prev else None
+    return pagination, next_url, prev_url
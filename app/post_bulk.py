@@ -0,0 +1,138 @@
+# F:\dev\BrogDev\app\post_bulk.py
+"""
+複数の投稿へのタグの追加・削除とカテゴリの変更をまとめて行う一括編集。
+
+投稿ごとに Post を読み込んで tags コレクションを書き換える代わりに、
+- 対象の投稿の公開状態・カテゴリと、既存の (投稿, タグ) の組をそれぞれ1回の IN クエリで読み込み、
+- post_tags への追加・削除を1回の executemany の INSERT / DELETE で、
+- カテゴリの変更と updated_at の更新を IN を使う1回の UPDATE で行います。
+
+タグ・カテゴリの post_count (app/tag_counts.py) はここで求めた増減量で更新し、全件の数え直しは行いません。
+コミットは呼び出し側で行ってください (全ての変更が同じトランザクションになります)。
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytz
+from sqlalchemy import bindparam, select
+
+from app.extensions import db
+from app.models import Category, Post, Tag, post_tags
+from app.tag_counts import COUNTS_MAINTAINED, apply_count_deltas
+
+# bulk_edit_posts() の category_id にこれを渡すとカテゴリを変更しない
+KEEP_CATEGORY = object()
+
+
+@dataclass
+class BulkEditResult:
+    """一括編集の結果の件数"""
+    posts: int = 0              # 変更された投稿の数
+    tags_added: int = 0         # 追加した (投稿, タグ) の組の数
+    tags_removed: int = 0       # 削除した (投稿, タグ) の組の数
+    categories_changed: int = 0 # カテゴリが変わった投稿の数
+
+
+def _execute(statement, params=None):
+    # 実行オプションにより、ページキャッシュの破棄は行い、post_count / site_stat の数え直しは行わない
+    return db.session.execute(statement.execution_options(**COUNTS_MAINTAINED), params)
+
+
+def _existing_pairs(post_ids, tag_ids):
+    rows = _execute(select(post_tags.c.post_id, post_tags.c.tag_id)
+                    .where(post_tags.c.post_id.in_(post_ids), post_tags.c.tag_id.in_(tag_ids)))
+    return {(row.post_id, row.tag_id) for row in rows}
+
+
+def add_post_tags(posts, tag_ids):
+    """
+    posts ({投稿 ID: 公開済みか}) の全ての投稿に tag_ids のタグを付けます (付いていないものだけを追加)。
+    追加した (投稿 ID, タグ ID) の組のリストを返します。
+    """
+    if not posts or not tag_ids:
+        return []
+    existing = _existing_pairs(list(posts), tag_ids)
+    pairs = [(post_id, tag_id) for post_id in posts for tag_id in tag_ids if (post_id, tag_id) not in existing]
+    if pairs:
+        _execute(post_tags.insert(), [{'post_id': post_id, 'tag_id': tag_id} for post_id, tag_id in pairs])
+        apply_count_deltas(db.session.connection(), Tag.__table__,
+                           Counter(tag_id for post_id, tag_id in pairs if posts[post_id]))
+    return pairs
+
+
+def remove_post_tags(posts, tag_ids):
+    """
+    posts ({投稿 ID: 公開済みか}) の全ての投稿から tag_ids のタグを外します。
+    削除した (投稿 ID, タグ ID) の組のリストを返します。
+    """
+    if not posts or not tag_ids:
+        return []
+    pairs = sorted(_existing_pairs(list(posts), tag_ids))
+    if pairs:
+        _execute(post_tags.delete().where(post_tags.c.post_id == bindparam('b_post_id'),
+                                          post_tags.c.tag_id == bindparam('b_tag_id')),
+                 [{'b_post_id': post_id, 'b_tag_id': tag_id} for post_id, tag_id in pairs])
+        deltas = Counter()
+        deltas.subtract(tag_id for post_id, tag_id in pairs if posts[post_id])
+        apply_count_deltas(db.session.connection(), Tag.__table__, deltas)
+    return pairs
+
+
+def set_post_category(posts, category_id):
+    """
+    posts ({投稿 ID: (公開済みか, 現在のカテゴリ ID)}) のカテゴリを category_id (None で未分類) にします。
+    カテゴリが変わった投稿の ID のリストを返します。
+    """
+    changed = [post_id for post_id, (_, old_category_id) in posts.items() if old_category_id != category_id]
+    if changed:
+        post = Post.__table__
+        _execute(post.update().where(post.c.id.in_(changed)).values(category_id=category_id))
+        deltas = Counter()
+        for post_id in changed:
+            is_published, old_category_id = posts[post_id]
+            if is_published:
+                deltas[category_id] += 1
+                deltas[old_category_id] -= 1
+        apply_count_deltas(db.session.connection(), Category.__table__, deltas)
+    return changed
+
+
+def bulk_edit_posts(post_ids, add_tag_ids=(), remove_tag_ids=(), category_id=KEEP_CATEGORY, user_id=None):
+    """
+    post_ids の投稿に add_tag_ids のタグを付け、remove_tag_ids のタグを外し、
+    category_id が KEEP_CATEGORY 以外ならカテゴリを変更します。BulkEditResult を返します。
+    存在しない投稿の ID は無視し、user_id を指定した場合はその利用者の投稿だけを変更します。
+    変更された投稿は updated_at も更新します。
+    """
+    # 未フラッシュの変更を先に書き込み、最後にセッション内のオブジェクトを読み直させる
+    db.session.flush()
+    post = Post.__table__
+    query = select(post.c.id, post.c.is_published, post.c.category_id).where(post.c.id.in_(list(post_ids)))
+    if user_id is not None:
+        query = query.where(post.c.user_id == user_id)
+    rows = _execute(query)
+    posts = {row.id: (bool(row.is_published), row.category_id) for row in rows}
+    published = {post_id: is_published for post_id, (is_published, _) in posts.items()}
+
+    result = BulkEditResult()
+    changed = set()
+    added = add_post_tags(published, list(add_tag_ids))
+    removed = remove_post_tags(published, [tag_id for tag_id in remove_tag_ids if tag_id not in add_tag_ids])
+    result.tags_added, result.tags_removed = len(added), len(removed)
+    changed.update(post_id for post_id, _ in added + removed)
+    recategorized = []
+    if category_id is not KEEP_CATEGORY:
+        recategorized = set_post_category(posts, category_id)
+        result.categories_changed = len(recategorized)
+
+    # カテゴリを変更した行は UPDATE の onupdate で updated_at も更新済み
+    retagged = changed - set(recategorized)
+    if retagged:
+        _execute(post.update().where(post.c.id.in_(retagged)).values(updated_at=datetime.now(pytz.utc)))
+    changed.update(recategorized)
+    if changed:
+        db.session.expire_all()
+    result.posts = len(changed)
+    return result
@@ -0,0 +1,61 @@
+# F:\dev\BrogDev\app\queries.py
+"""
+投稿クエリ用のリレーションシップ読み込みプロファイル。
+
+一覧カードなどで post.main_image / post.tags / post.posted_by を投稿ごとに遅延読み込みすると
+1ページで数十回の SELECT (N+1) が発生するため、用途ごとに必要な関連をまとめて先読みします。
+
+使い方:
+    Post.query.options(*post_load_options('card'))
+    db.session.get(Post, post_id, options=post_load_options('detail'))
+"""
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import Image, Post
+
+
+# 用途ごとの先読み対象。多対一は JOIN (joinedload)、コレクションは IN 句の追加クエリ (selectinload) で読み込む
+# (戦略, 属性, *子の (戦略, 属性)) の形式で、関連先のさらに先の関連も指定できる
+POST_LOAD_PROFILES = {
+    # 公開側の一覧カード (home/index.html, posts_by_category.html, posts_by_tag.html など)
+    'card': (
+        ('joined', Post.main_image),
+        ('joined', Post.posted_by),
+        ('selectin', Post.tags),
+    ),
+    # 公開側の投稿詳細ページ
+    'detail': (
+        ('joined', Post.main_image, ('selectin', Image.variants)),
+        ('joined', Post.posted_by),
+        ('joined', Post.category),
+        ('selectin', Post.tags),
+    ),
+    # 管理画面の投稿一覧 (posts/list_posts.html)
+    'admin_list': (
+        ('joined', Post.main_image),
+        ('joined', Post.category),
+        ('selectin', Post.tags),
+    ),
+}
+
+_LOADERS = {
+    'joined': joinedload,
+    'selectin': selectinload,
+}
+
+
+def _build_option(strategy, attr, *children):
+    option = _LOADERS[strategy](attr)
+    if children:
+        option = option.options(*(_build_option(*child) for child in children))
+    return option
+
+
+def post_load_options(profile='card'):
+    """指定したプロファイルの読み込みオプションをリストで返します。"""
+    try:
+        relations = POST_LOAD_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown post load profile: {profile}")
+    return [_build_option(*relation) for relation in relations]
@@ -0,0 +1,172 @@
+# F:\dev\BrogDev\app\related.py
+"""
+関連記事の事前計算 (related_post テーブル) と、投稿詳細ページ用の読み出し。
+
+閲覧のたびに post_tags を結合して関連記事を求めると重いため、`flask init related-posts` で
+公開済み投稿ごとに上位 RELATED_POSTS_LIMIT 件を計算して保存しておきます。
+
+スコア = タグの Jaccard 係数 |A ∩ B| / |A ∪ B| + (同じカテゴリなら RELATED_POSTS_CATEGORY_WEIGHT)
+同点の場合は新しい投稿を優先します。
+
+再計算の対象 (2回目以降):
+- タグ・カテゴリの署名が前回の計算時と異なる投稿 (新規公開を含む)
+- それらの投稿とタグ・カテゴリを共有する投稿 (一覧に新たに入る可能性がある)
+- 保存済みの一覧に、変更された投稿・非公開または削除された投稿を含む投稿
+非公開・削除された投稿の一覧は削除します。--full を指定すると全件を計算し直します。
+
+投稿詳細ページは related_posts(post_id) (テンプレートのグローバル関数) で読み出します。
+プロセス内にはキャッシュしません (匿名ユーザーへの繰り返しの表示はページキャッシュが吸収し、
+再計算でページキャッシュが破棄された後は全てのワーカーが新しい一覧を描画します)。
+"""
+
+import hashlib
+import heapq
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+import pytz
+from flask import current_app
+
+from app.extensions import db
+from app.models import Post, RelatedPost, RelatedPostState, post_tags
+
+# IN 句に一度に渡す ID の数 (SQLite のパラメーター数の上限より小さくする)
+_CHUNK_SIZE = 500
+
+# 関連記事の表示に使う値 (キャッシュに ORM のオブジェクトを保持しないため)
+RelatedEntry = namedtuple('RelatedEntry', 'id title created_at score')
+
+_PostInfo = namedtuple('_PostInfo', 'category_id created_at tags')
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        yield ids[start:start + _CHUNK_SIZE]
+
+
+def _signature(info):
+    raw = repr((info.category_id.hex if info.category_id else '', sorted(tag.hex for tag in info.tags)))
+    return hashlib.sha1(raw.encode('ascii')).hexdigest()
+
+
+def load_published_posts():
+    """公開済み投稿の {ID: (カテゴリ ID, 作成日時, タグ ID の集合)} を2回のクエリで読み込みます。"""
+    posts = {row.id: _PostInfo(row.category_id, row.created_at, set()) for row in
+             db.session.query(Post.id, Post.category_id, Post.created_at).filter(Post.is_published == True)}
+    rows = (db.session.query(post_tags.c.post_id, post_tags.c.tag_id)
+            .join(Post, Post.id == post_tags.c.post_id)
+            .filter(Post.is_published == True))
+    for row in rows:
+        posts[row.post_id].tags.add(row.tag_id)
+    return posts
+
+
+def _build_indexes(posts):
+    by_tag, by_category = defaultdict(set), defaultdict(set)
+    for post_id, info in posts.items():
+        for tag_id in info.tags:
+            by_tag[tag_id].add(post_id)
+        if info.category_id is not None:
+            by_category[info.category_id].add(post_id)
+    return by_tag, by_category
+
+
+def _neighbours(info, by_tag, by_category):
+    """タグかカテゴリを共有する投稿の ID の集合を返します。"""
+    neighbours = set()
+    for tag_id in info.tags:
+        neighbours |= by_tag[tag_id]
+    if info.category_id is not None:
+        neighbours |= by_category[info.category_id]
+    return neighbours
+
+
+def score_related(post_id, posts, by_tag, by_category, limit, category_weight):
+    """post_id の投稿の関連記事を [(投稿 ID, スコア)] でスコアの高い順に最大 limit 件返します。"""
+    info = posts[post_id]
+    scored = []
+    for other_id in _neighbours(info, by_tag, by_category) - {post_id}:
+        other = posts[other_id]
+        union = len(info.tags | other.tags)
+        score = len(info.tags & other.tags) / union if union else 0.0
+        if info.category_id is not None and info.category_id == other.category_id:
+            score += category_weight
+        if score > 0:
+            scored.append((score, other.created_at, other_id.hex, other_id))
+    return [(other_id, score) for score, _, _, other_id in heapq.nlargest(limit, scored)]
+
+
+def _stale_owners(post_ids):
+    """保存済みの一覧に post_ids の投稿を含む投稿の ID の集合を返します。"""
+    owners = set()
+    for chunk in _chunks(post_ids):
+        owners.update(row.post_id for row in
+                      db.session.query(RelatedPost.post_id).filter(RelatedPost.related_post_id.in_(chunk)))
+    return owners
+
+
+def _delete_for(post_ids):
+    related, state = RelatedPost.__table__, RelatedPostState.__table__
+    for chunk in _chunks(post_ids):
+        db.session.execute(related.delete().where(related.c.post_id.in_(chunk)))
+        db.session.execute(state.delete().where(state.c.post_id.in_(chunk)))
+
+
+def refresh_related_posts(full=False):
+    """
+    関連記事を計算して related_post に保存し、{'recomputed': 計算した投稿数, 'removed': 削除した投稿数} を返します。
+    full が False の場合は前回から変更された投稿とその影響を受ける投稿だけを計算します。
+    コミットは呼び出し側で行ってください。
+    """
+    limit = current_app.config.get('RELATED_POSTS_LIMIT', 5)
+    category_weight = current_app.config.get('RELATED_POSTS_CATEGORY_WEIGHT', 0.25)
+    now = datetime.now(pytz.utc)
+
+    posts = load_published_posts()
+    by_tag, by_category = _build_indexes(posts)
+    signatures = {post_id: _signature(info) for post_id, info in posts.items()}
+    states = dict(db.session.query(RelatedPostState.post_id, RelatedPostState.signature))
+
+    removed = set(states) - set(posts)
+    if full:
+        db.session.execute(RelatedPost.__table__.delete())
+        db.session.execute(RelatedPostState.__table__.delete())
+        dirty = set(posts)
+    else:
+        touched = {post_id for post_id, signature in signatures.items() if states.get(post_id) != signature}
+        dirty = set(touched) | _stale_owners(touched | removed)
+        for post_id in touched:
+            dirty |= _neighbours(posts[post_id], by_tag, by_category)
+        dirty &= set(posts)
+        _delete_for(removed | dirty)
+
+    related_rows, state_rows = [], []
+    for post_id in dirty:
+        for rank, (other_id, score) in enumerate(
+                score_related(post_id, posts, by_tag, by_category, limit, category_weight), start=1):
+            related_rows.append({'post_id': post_id, 'related_post_id': other_id, 'rank': rank, 'score': score})
+        state_rows.append({'post_id': post_id, 'signature': signatures[post_id], 'computed_at': now})
+    if related_rows:
+        db.session.execute(RelatedPost.__table__.insert(), related_rows)
+    if state_rows:
+        db.session.execute(RelatedPostState.__table__.insert(), state_rows)
+
+    return {'recomputed': len(dirty), 'removed': len(removed)}
+
+
+def related_posts(post_id):
+    """
+    投稿の関連記事を rank 順の RelatedEntry のリストで返します (非公開の投稿は除きます)。
+    ix_related_post_post_id_rank を使う1クエリで読み込みます。
+    """
+    rows = (db.session.query(Post.id, Post.title, Post.created_at, RelatedPost.score)
+            .join(RelatedPost, RelatedPost.related_post_id == Post.id)
+            .filter(RelatedPost.post_id == post_id, Post.is_published == True)
+            .order_by(RelatedPost.rank))
+    return [RelatedEntry(*row) for row in rows]
+
+
+def init_app(app):
+    """投稿詳細テンプレートから related_posts() を呼べるようにします。"""
+    app.add_template_global(related_posts, 'related_posts')
@@ -2,7 +2,9 @@
 
 from flask import Blueprint, render_template, flash, redirect, url_for, current_app, abort
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from app.models import Comment # Commentモデルをインポート
+from app.listing import comment_listing
 from app.extensions import db # dbがapp.extensionsからインポートされていることを確認
 import os
 
@@ -30,8 +32,8 @@ def list_comments():
         current_app.logger.warning(f"ACCESS_DENIED: User {current_user.id} attempted to access list_comments without admin role.")
         abort(403)
 
-    comments = Comment.query.order_by(Comment.created_at.desc()).all()
-    return render_template('admin/list_comments.html', comments=comments)
+    listing = comment_listing(Comment.query.options(joinedload(Comment.post), joinedload(Comment.comment_author)))
+    return render_template('comments/list_comments.html', comments=listing.items, listing=listing)
 
 # コメント承認/非承認のルート (adminのみ)
 @comments_bp.route('/toggle_approval/<uuid:comment_id>', methods=['POST'])
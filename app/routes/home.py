@@ -1,10 +1,20 @@
 # F:\dev\BrogDev\app\routes\home.py
 
 from flask import Blueprint, render_template, current_app, url_for, redirect, flash, request, abort
-from app.models import Post, Category, Tag, Comment, Image
+from app.models import (Post, Category, Tag, Comment, Image, ImageVariant, RelatedPost, RelatedPostState, User,
+                        post_tags)
 from app.extensions import db
 from flask_login import current_user # current_user を使用するためにインポートを確認
 from app.forms import CommentForm, DeleteForm
+from app.pagination import paginate_posts
+from app.page_cache import cached_page
+from app.conditional import conditional_page, listing_state
+from app.db_routing import replica_reads
+from app.queries import post_load_options
+from app.search import search_posts_query, highlight_snippet
+from app.tag_counts import tag_cloud
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased, joinedload
 import logging
 from datetime import datetime
 import pytz # datetime.now() にタイムゾーン情報を付与するため
@@ -13,24 +23,82 @@ logger = logging.getLogger(__name__)
 
 # ブループリントの定義
 home_bp = Blueprint('home', __name__)
+# 公開ページの GET の読み込みは読み取り専用レプリカから行う (設定されている場合)
+# コメントの投稿 (POST) とその後のリダイレクト先はプライマリを使う (app/db_routing.py)
+home_bp.before_request(replica_reads)
+
+
+# --- 条件付き GET (app/conditional.py) の検証用の値 ---
+def _index_state():
+    return listing_state(Post.query.filter_by(is_published=True))
+
+
+def _post_detail_state(post_id):
+    """
+    投稿の updated_at、承認済みコメントの最終更新日時・件数、関連記事の計算日時と関連先の投稿の最終更新日時・件数、
+    メイン画像のサムネイルの生成状態・派生画像の件数、表示するタグ・カテゴリ・利用者 (投稿者とコメントの投稿者) の
+    updated_at を1クエリで取得します (名前の変更は投稿の updated_at を進めないため)。
+    """
+    approved = (Comment.post_id == Post.id) & (Comment.is_approved == True)
+    related = aliased(Post)
+    related_rows = (RelatedPost.post_id == Post.id) & (RelatedPost.related_post_id == related.id)
+    post_tag_rows = (post_tags.c.post_id == Post.id) & (post_tags.c.tag_id == Tag.id)
+    # 二重の入れ子でも外側の post と相関させる
+    shown_users = (User.id == Post.user_id) | User.id.in_(select(Comment.user_id).where(approved).correlate_except(Comment))
+    row = (db.session.query(
+               Post.updated_at,
+               Post.main_image_id,
+               select(func.max(Comment.updated_at)).where(approved).scalar_subquery(),
+               select(func.count(Comment.id)).where(approved).scalar_subquery(),
+               select(RelatedPostState.computed_at).where(RelatedPostState.post_id == Post.id).scalar_subquery(),
+               select(func.max(related.updated_at)).where(related_rows).scalar_subquery(),
+               select(func.count(related.id)).where(related_rows).scalar_subquery(),
+               select(Image.thumbnail_status).where(Image.id == Post.main_image_id).scalar_subquery(),
+               select(func.count(ImageVariant.id)).where(ImageVariant.image_id == Post.main_image_id).scalar_subquery(),
+               select(func.max(Tag.updated_at)).where(post_tag_rows).scalar_subquery(),
+               select(func.count(Tag.id)).where(post_tag_rows).scalar_subquery(),
+               select(Category.updated_at).where(Category.id == Post.category_id).scalar_subquery(),
+               select(func.max(User.updated_at)).where(shown_users).scalar_subquery(),
+           )
+           .filter(Post.id == post_id, Post.is_published == True)
+           .first())
+    if row is None:
+        return None
+    return tuple(row)
+
+
+def _category_state(category_id):
+    category = db.session.get(Category, category_id)
+    if category is None:
+        return None
+    return listing_state(Post.query.filter_by(category_id=category_id, is_published=True)) + (category.updated_at,)
+
+
+def _tag_state(tag_id):
+    tag = db.session.get(Tag, tag_id)
+    if tag is None:
+        return None
+    return listing_state(tag.posts.filter(Post.is_published == True)) + (tag.updated_at,)
+
+
+def _tags_state():
+    """タグの updated_at の最大値と件数 (post_count の増減で updated_at も進む)。"""
+    return tuple(db.session.query(func.max(Tag.updated_at), func.count(Tag.id)).one())
+
 
 # ホームページ（最新の投稿を表示）
 @home_bp.route('/')
 @home_bp.route('/index')
+@cached_page
+@conditional_page(_index_state)
 def index():
     
     #logger.debug("DEBUG(home): index route accessed.")
-    page = request.args.get('page', 1, type=int)
-    posts_pagination = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=current_app.config.get('POSTS_PER_PAGE', 10), error_out=False
-    )
+    posts_query = (Post.query.options(*post_load_options('card'))
+                   .filter_by(is_published=True).order_by(Post.created_at.desc()))
+    posts_pagination, next_url, prev_url = paginate_posts(posts_query, 'home.index', count_key='home.index')
     posts = posts_pagination.items 
     
-    csrf_form = DeleteForm()
-    
-    next_url = url_for('home.index', page=posts_pagination.next_num) if posts_pagination.has_next else None
-    prev_url = url_for('home.index', page=posts_pagination.prev_num) if posts_pagination.has_prev else None
-    
     current_year = datetime.now(pytz.utc).year 
     
     return render_template('home/index.html', 
@@ -39,20 +107,24 @@ def index():
                            title='ホーム',
                            next_url=next_url,
                            prev_url=prev_url,
-                           csrf_form=csrf_form,
                            current_year=current_year)
 
 # 投稿詳細ページ
 @home_bp.route('/post/<uuid:post_id>', methods=['GET', 'POST'])
+@cached_page
+@conditional_page(_post_detail_state)
 def post_detail(post_id):
     #logger.debug(f"DEBUG(home): Accessed post detail for post_id: {post_id}")
-    post = db.session.get(Post, post_id)
+    post = db.session.get(Post, post_id, options=post_load_options('detail'))
     if post is None or not post.is_published: 
         current_app.logger.warning(f"Attempted to access non-existent or unpublished post with ID: {post_id}")
         abort(404)
     
-    comment_form = CommentForm()
-    delete_form = DeleteForm() 
+    # フォームはログイン中のみ作成する (CSRF トークンの発行でセッションが変更され、匿名向けのページをキャッシュできなくなるため)
+    comment_form = delete_form = None
+    if current_user.is_authenticated:
+        comment_form = CommentForm()
+        delete_form = DeleteForm()
 
     if request.method == 'POST':
         #current_app.logger.debug(f"DEBUG: POST request received for post_id: {post_id}")
@@ -98,7 +170,8 @@ def post_detail(post_id):
                 for error in errors:
                     flash(f'フォームエラー - {field}: {error}', 'danger')
 
-    comments = Comment.query.filter_by(post_id=post.id, is_approved=True).order_by(Comment.created_at.desc()).all()
+    comments = (Comment.query.options(joinedload(Comment.comment_author))
+                .filter_by(post_id=post.id, is_approved=True).order_by(Comment.created_at.desc()).all())
     
     current_year = datetime.now(pytz.utc).year 
     
@@ -133,23 +206,21 @@ def delete_comment(post_id, comment_id):
 
 # カテゴリ別記事一覧
 @home_bp.route('/category/<uuid:category_id>')
+@cached_page
+@conditional_page(_category_state)
 def posts_by_category(category_id):
     category = db.session.get(Category, category_id) 
     if category is None:
         flash('カテゴリが見つかりません。', 'danger')
         abort(404) 
 
-    page = request.args.get('page', 1, type=int)
-    posts_pagination = Post.query.filter_by(category=category, is_published=True).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=current_app.config.get('POSTS_PER_PAGE', 10), error_out=False
+    posts_query = (Post.query.options(*post_load_options('card'))
+                   .filter_by(category=category, is_published=True).order_by(Post.created_at.desc()))
+    posts_pagination, next_url, prev_url = paginate_posts(
+        posts_query, 'home.posts_by_category', count_key=f'category:{category.id}', category_id=category.id
     )
     posts = posts_pagination.items
 
-    next_url = url_for('home.posts_by_category', category_id=category.id, page=posts_pagination.next_num) if posts_pagination.has_next else None
-    prev_url = url_for('home.posts_by_category', category_id=category.id, page=posts_pagination.prev_num) if posts_pagination.has_prev else None
-
-    csrf_form = DeleteForm()
-
     current_year = datetime.now(pytz.utc).year 
 
     return render_template('home/posts_by_category.html', 
@@ -158,27 +229,24 @@ def posts_by_category(category_id):
                            posts_pagination=posts_pagination, 
                            next_url=next_url,
                            prev_url=prev_url,
-                           csrf_form=csrf_form, 
                            current_year=current_year)
 
 # タグ別記事一覧
 @home_bp.route('/tag/<uuid:tag_id>')
+@cached_page
+@conditional_page(_tag_state)
 def posts_by_tag(tag_id):
     tag = db.session.get(Tag, tag_id)
     if tag is None:
         flash('タグが見つかりません。', 'danger')
         abort(404) 
 
-    page = request.args.get('page', 1, type=int)
-    posts_pagination = tag.posts.filter(Post.is_published==True).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=current_app.config.get('POSTS_PER_PAGE', 10), error_out=False
+    posts_query = (tag.posts.options(*post_load_options('card'))
+                   .filter(Post.is_published==True).order_by(Post.created_at.desc()))
+    posts_pagination, next_url, prev_url = paginate_posts(
+        posts_query, 'home.posts_by_tag', count_key=f'tag:{tag.id}', tag_id=tag.id
     )
     posts = posts_pagination.items
-    
-    next_url = url_for('home.posts_by_tag', tag_id=tag.id, page=posts_pagination.next_num) if posts_pagination.has_next else None
-    prev_url = url_for('home.posts_by_tag', tag_id=tag.id, page=posts_pagination.prev_num) if posts_pagination.has_prev else None
-
-    csrf_form = DeleteForm()
 
     current_year = datetime.now(pytz.utc).year
     
@@ -188,28 +256,35 @@ def posts_by_tag(tag_id):
                            posts_pagination=posts_pagination, 
                            next_url=next_url,
                            prev_url=prev_url,
-                           csrf_form=csrf_form, 
                            current_year=current_year)
 
+# タグクラウド (公開済み投稿の件数は Tag.post_count を読むだけで数えない)
+@home_bp.route('/tags')
+@cached_page
+@conditional_page(_tags_state)
+def tags():
+    cloud = tag_cloud(limit=current_app.config.get('TAG_CLOUD_LIMIT', 100))
+    current_year = datetime.now(pytz.utc).year
+    return render_template('home/tags.html', cloud=cloud, current_year=current_year)
+
+
 # 検索結果ページ
 @home_bp.route('/search')
 def search_results():
     query = request.args.get('query', '')
-    page = request.args.get('page', 1, type=int)
 
+    snippets = {}
     if query:
-        posts_query = Post.query.filter(
-            (Post.title.ilike(f'%{query}%')) | (Post.body.ilike(f'%{query}%')),
-            Post.is_published==True 
-        ).order_by(Post.created_at.desc())
-        
-        posts_pagination = posts_query.paginate(
-            page=page, per_page=current_app.config.get('POSTS_PER_PAGE', 10), error_out=False
+        posts_query, ranked = search_posts_query(query, options=post_load_options('card'))
+        # FTS5 の結果は関連度順のため、キーセット方式 (created_at 順) は使用しない
+        posts_pagination, next_url, prev_url = paginate_posts(
+            posts_query, 'home.search_results', keyset=not ranked, query=query
         )
-        posts = posts_pagination.items
-        
-        next_url = url_for('home.search_results', query=query, page=posts_pagination.next_num) if posts_pagination.has_next else None
-        prev_url = url_for('home.search_results', query=query, page=posts_pagination.prev_num) if posts_pagination.has_prev else None
+        if ranked:
+            posts = [row.Post for row in posts_pagination.items]
+            snippets = {row.Post.id: highlight_snippet(row.snippet) for row in posts_pagination.items}
+        else:
+            posts = posts_pagination.items
 
         flash(f"「{query}」の検索結果", 'info')
     else:
@@ -219,16 +294,15 @@ def search_results():
         prev_url = None
         flash('検索キーワードが入力されていません。', 'warning')
     
-    csrf_form = DeleteForm() 
     current_year = datetime.now(pytz.utc).year
     
     return render_template('home/search_results.html', 
                            posts=posts, 
                            posts_pagination=posts_pagination, 
                            query=query, 
+                           snippets=snippets,
                            next_url=next_url,
                            prev_url=prev_url,
-                           csrf_form=csrf_form, 
                            current_year=current_year)
 
 # その他の共通処理（例: エラーハンドリング）
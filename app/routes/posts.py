@@ -3,6 +3,9 @@
 from flask import Blueprint, render_template, url_for, abort
 from app.extensions import db
 from app.models import Post, Category, Tag, Image # Post, Category, Tag, Image をインポート
+from app.page_cache import cached_page
+from app.conditional import conditional_page, listing_state
+from app.db_routing import replica_reads
 import os
 import logging
 
@@ -17,10 +20,14 @@ public_posts_bp = Blueprint(
     # '..' を使って 'app' ディレクトリに上がり、そこから 'templates/posts' を指定
     template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates', 'posts')
 )
+# 公開ページの GET の読み込みは読み取り専用レプリカから行う (設定されている場合)
+public_posts_bp.before_request(replica_reads)
 
 # --- 公開されている記事一覧を表示するルート ---
 @public_posts_bp.route('/') # /posts/ にアクセスした場合
 @public_posts_bp.route('/list') # /posts/list にアクセスした場合 (より明確なパス)
+@cached_page
+@conditional_page(lambda: listing_state(Post.query.filter_by(is_published=True)))
 def list_posts():
     """公開されている投稿の一覧を表示します。"""
     # is_published=True で公開済みの投稿のみを取得
@@ -0,0 +1,195 @@
+# F:\dev\BrogDev\app\search.py
+"""
+SQLite FTS5 による投稿の全文検索。
+
+post_search 仮想テーブル (trigram トークナイザー) に投稿のタイトルと本文を保持し、
+SQLAlchemy の after_flush イベントで Post の追加・更新・削除に追従させます。
+post_search の post_id は UNINDEXED (検索すると全行の走査になる) のため、
+post_search_map で投稿ごとに整数の rowid を割り当て、更新・削除は rowid で行います。
+trigram は空白で区切られない日本語も3文字単位で索引化できるため、形態素解析なしで部分一致検索ができます。
+
+FTS5 が使えない環境 (SQLite 以外のデータベースや索引未作成時) や、
+3文字未満の検索語では従来どおり ILIKE による検索にフォールバックします。
+"""
+
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, bindparam, column, event, func, inspect, literal_column, or_, select, table, text
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Post
+
+FTS_TABLE = 'post_search'
+
+# trigram トークナイザーは3文字未満の語では一致しない
+MIN_TERM_LENGTH = 3
+
+# bm25 の列ごとの重み (post_id, title, body)。タイトルの一致を本文より重視する
+BM25_WEIGHTS = (0.0, 10.0, 1.0)
+
+# snippet() の強調範囲を示す目印。HTML エスケープ後に <mark> へ置き換える
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(post_id UNINDEXED, title, body, tokenize='trigram')"
+)
+DROP_FTS_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+# post.id と post_search の rowid の対応 (post_search の rowid = post_search_map.id)
+MAP_TABLE = 'post_search_map'
+CREATE_MAP_SQL = f"CREATE TABLE IF NOT EXISTS {MAP_TABLE} (id INTEGER PRIMARY KEY, post_id BLOB NOT NULL UNIQUE)"
+DROP_MAP_SQL = f"DROP TABLE IF EXISTS {MAP_TABLE}"
+
+# post_id は post.id と同じ型で保存する (SQLite では16バイトの BLOB)
+post_search = table(FTS_TABLE, column('rowid'), column('post_id', Post.__table__.c.id.type), column('title'), column('body'))
+post_search_map = table(MAP_TABLE, column('id'), column('post_id', Post.__table__.c.id.type))
+
+# 投稿の rowid (post_search_map.id) を引く副問い合わせ。FTS5 の rowid の検索は索引で1行を引く
+_rowid_of_post = (select(post_search_map.c.id)
+                  .where(post_search_map.c.post_id == bindparam('b_post_id'))
+                  .scalar_subquery())
+
+# エンジンごとの索引テーブル有無のキャッシュ {エンジンURL: bool}
+_fts_ready = {}
+
+
+def _is_sqlite(bind):
+    return bind.dialect.name == 'sqlite'
+
+
+def search_index_exists(connection):
+    """接続先に post_search 仮想テーブルが存在するかを返します (結果はエンジンごとにキャッシュ)。"""
+    if not _is_sqlite(connection):
+        return False
+    key = str(connection.engine.url)
+    if key not in _fts_ready:
+        row = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE},
+        ).first()
+        _fts_ready[key] = row is not None
+    return _fts_ready[key]
+
+
+def rebuild_search_index(connection):
+    """post_search を作り直し、全投稿を索引に登録します。登録件数を返します。"""
+    for statement in (DROP_FTS_SQL, DROP_MAP_SQL, CREATE_MAP_SQL, CREATE_FTS_SQL):
+        connection.execute(text(statement))
+    connection.execute(text(f"INSERT INTO {MAP_TABLE} (post_id) SELECT id FROM post"))
+    connection.execute(text(
+        f"INSERT INTO {FTS_TABLE} (rowid, post_id, title, body) "
+        f"SELECT m.id, p.id, p.title, p.body FROM {MAP_TABLE} m JOIN post p ON p.id = m.post_id"
+    ))
+    _fts_ready[str(connection.engine.url)] = True
+    return connection.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+def _sync_posts_after_flush(session, flush_context):
+    """フラッシュされた Post の変更を post_search に反映します。"""
+    added = [obj for obj in session.new if isinstance(obj, Post)]
+    changed = []
+    for obj in session.dirty:
+        if isinstance(obj, Post) and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            if state.attrs.title.history.has_changes() or state.attrs.body.history.has_changes():
+                changed.append(obj)
+    deleted = [obj for obj in session.deleted if isinstance(obj, Post)]
+    if not added and not changed and not deleted:
+        return
+
+    connection = session.connection()
+    if not search_index_exists(connection):
+        return
+
+    if deleted:
+        params = [{'b_post_id': obj.id} for obj in deleted]
+        connection.execute(post_search.delete().where(post_search.c.rowid == _rowid_of_post), params)
+        connection.execute(post_search_map.delete().where(post_search_map.c.post_id == bindparam('b_post_id')),
+                           params)
+    if changed:
+        connection.execute(
+            post_search.update().where(post_search.c.rowid == _rowid_of_post)
+            .values(title=bindparam('b_title'), body=bindparam('b_body')),
+            [{'b_post_id': obj.id, 'b_title': obj.title, 'b_body': obj.body} for obj in changed],
+        )
+    if added:
+        # 新しい投稿は索引に行がないため削除せず、rowid を割り当てて追加する
+        connection.execute(post_search_map.insert(), [{'post_id': obj.id} for obj in added])
+        connection.execute(
+            post_search.insert().values(rowid=_rowid_of_post, post_id=bindparam('b_post_id'),
+                                        title=bindparam('b_title'), body=bindparam('b_body')),
+            [{'b_post_id': obj.id, 'b_title': obj.title, 'b_body': obj.body} for obj in added],
+        )
+
+
+_create_map_ddl = DDL(CREATE_MAP_SQL).execute_if(dialect='sqlite')
+_create_fts_ddl = DDL(CREATE_FTS_SQL).execute_if(dialect='sqlite')
+_drop_fts_ddl = DDL(DROP_FTS_SQL).execute_if(dialect='sqlite')
+_drop_map_ddl = DDL(DROP_MAP_SQL).execute_if(dialect='sqlite')
+
+
+def _reset_fts_cache(target, connection, **kw):
+    _fts_ready.pop(str(connection.engine.url), None)
+
+
+def init_app(app):
+    """検索索引の自動作成と Post との同期イベントを登録します。"""
+    # db.create_all() / drop_all() で post_search と post_search_map も作成・削除する (SQLite のみ)
+    if not event.contains(db.metadata, 'after_create', _create_fts_ddl):
+        event.listen(db.metadata, 'after_create', _create_map_ddl)
+        event.listen(db.metadata, 'after_create', _create_fts_ddl)
+        event.listen(db.metadata, 'before_drop', _drop_fts_ddl)
+        event.listen(db.metadata, 'before_drop', _drop_map_ddl)
+        event.listen(db.metadata, 'after_drop', _reset_fts_cache)
+    if not event.contains(Session, 'after_flush', _sync_posts_after_flush):
+        event.listen(Session, 'after_flush', _sync_posts_after_flush)
+
+
+def _match_expression(query):
+    """ユーザー入力を FTS5 の MATCH 式に変換します (各語をフレーズとして引用し AND 検索)。"""
+    terms = query.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def can_use_fts(query):
+    """FTS5 で検索できる語かどうか (全ての語が trigram の最小長以上か) を返します。"""
+    terms = query.split()
+    return bool(terms) and all(len(term) >= MIN_TERM_LENGTH for term in terms)
+
+
+def search_posts_query(query, options=()):
+    """
+    公開済み投稿を検索するクエリを返します。
+    FTS5 が使える場合は (Post, snippet) の行を bm25 の関連度順で返すクエリ、
+    使えない場合は Post を新着順で返す ILIKE クエリを返します。
+    戻り値は (クエリ, FTS5 使用有無) のタプルです。
+    """
+    if can_use_fts(query) and search_index_exists(db.session.connection()):
+        fts = literal_column(FTS_TABLE)
+        rank = func.bm25(fts, *BM25_WEIGHTS)
+        snippet = func.snippet(fts, 2, _HIGHLIGHT_START, _HIGHLIGHT_END, '…', 24)
+        posts_query = (
+            Post.query.options(*options)
+            .join(post_search, post_search.c.post_id == Post.id)
+            .filter(fts.op('MATCH')(_match_expression(query)), Post.is_published == True)
+            .add_columns(snippet.label('snippet'))
+            .order_by(rank, Post.created_at.desc())
+        )
+        return posts_query, True
+
+    posts_query = Post.query.options(*options).filter(
+        or_(Post.title.ilike(f'%{query}%'), Post.body.ilike(f'%{query}%')),
+        Post.is_published == True
+    ).order_by(Post.created_at.desc())
+    return posts_query, False
+
+
+def highlight_snippet(snippet):
+    """snippet() の結果を HTML エスケープし、一致箇所を <mark> で囲んだ Markup を返します。"""
+    if not snippet:
+        return Markup('')
+    return (escape(snippet)
+            .replace(_HIGHLIGHT_START, Markup('<mark>'))
+            .replace(_HIGHLIGHT_END, Markup('</mark>')))
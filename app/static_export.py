@@ -0,0 +1,395 @@
+# F:\dev\BrogDev\app\static_export.py
+"""
+公開サイトの静的 HTML への書き出し (`flask init export-static`)。
+
+トップページ・投稿詳細・カテゴリ別・タグ別の各ページ (ページ送りを含む) と、
+公開済み投稿が参照する画像・サムネイル・派生画像、static/ の CSS・JS を出力先ディレクトリに書き出します。
+出力はそのまま nginx や オブジェクトストレージで配信できる構成です。
+
+    /                        -> index.html
+    /?page=2                 -> page/2/index.html
+    /post/<id>               -> post/<id>/index.html
+    /category/<id>?page=2    -> category/<id>/page/2/index.html
+
+ページごとに「署名」(掲載する投稿の id と updated_at など) を出力先の .export-manifest.json に記録し、
+次回は署名が変わったページだけを描画し直します (--force で全ページを再描画)。
+描画はプロセスプールで並列に行い、各ワーカーは自分のアプリケーションを作成してテストクライアント経由で描画します。
+"""
+
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from flask import current_app, url_for
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models import (Category, Comment, Image, ImageVariant, Post, RelatedPost, RelatedPostState, Tag, User,
+                        post_additional_images, post_tags)
+
+MANIFEST_FILENAME = '.export-manifest.json'
+
+# サイト内リンクのうち、ページ送り (?page=N) とトップページの別名 (/index) を静的なパスに書き換える
+_LINK_RE = re.compile(r'href="(/[^"?#]*)(?:\?page=(\d+))?"')
+_INDEX_ALIAS = '/index'
+
+# 書き出し中はリクエストごとのキャッシュや条件付き GET を使わず、OFFSET 方式のページ送りで描画する
+_EXPORT_CONFIG_OVERRIDES = {
+    'PAGE_CACHE_BACKEND': None,
+    'CONDITIONAL_GET': False,
+    'KEYSET_PAGINATION': False,
+}
+
+# ワーカープロセスごとのアプリケーション
+_worker_app = None
+
+
+@dataclass
+class ExportResult:
+    rendered: int = 0
+    skipped: int = 0
+    removed: int = 0
+    failed: int = 0
+    copied_files: int = 0
+
+
+def page_path(path, page=1):
+    """一覧ページの URL パスと番号から、静的サイトでの URL パスを返します。"""
+    if path == _INDEX_ALIAS:
+        path = '/'
+    if page <= 1:
+        return path
+    return path.rstrip('/') + f'/page/{page}/'
+
+
+def output_file(url_path):
+    """静的サイトの URL パスから、出力先ディレクトリからの相対ファイルパスを返します。"""
+    parts = [part for part in url_path.split('/') if part]
+    return os.path.join(*parts, 'index.html') if parts else 'index.html'
+
+
+def rewrite_links(html):
+    """描画した HTML のページ送り・トップページへのリンクを静的サイトのパスに書き換えます。"""
+    return _LINK_RE.sub(lambda m: f'href="{page_path(m.group(1), int(m.group(2) or 1))}"', html)
+
+
+def _signature(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _listing_pages(endpoint, url_kwargs, rows, extra=(), per_page=10):
+    """
+    一覧の投稿のカード (id, updated_at, メイン画像のサムネイルの生成状態, タグ名) の並びから、ページごとの (URL, 出力先, 署名) を作成します。
+    各ページの署名には掲載する投稿と前後のページの有無を含めるため、投稿を1件編集しても
+    その投稿が載っているページだけが再描画されます。
+    """
+    path = url_for(endpoint, **url_kwargs)
+    pages_count = max(1, math.ceil(len(rows) / per_page))
+    pages = []
+    for page in range(1, pages_count + 1):
+        items = rows[(page - 1) * per_page:page * per_page]
+        url = path if page == 1 else url_for(endpoint, page=page, **url_kwargs)
+        pages.append({
+            'url': url,
+            'file': output_file(page_path(path, page)),
+            'signature': _signature(endpoint, page, page < pages_count, tuple(items), extra),
+        })
+    return pages
+
+
+def collect_pages():
+    """書き出す全ページの一覧を作成します (ページ描画は行わず、集計クエリのみ実行します)。"""
+    per_page = current_app.config.get('POSTS_PER_PAGE', 10)
+    published = Post.is_published == True
+    newest_first = (Post.created_at.desc(), Post.id.desc())
+    pages = []
+
+    # 投稿ごとのタグ名と承認済みコメントの投稿者名 (名前の変更は投稿の updated_at を進めないため署名に含める)
+    tag_names = {}
+    for row in (db.session.query(post_tags.c.post_id, Tag.name)
+                .join(Tag, Tag.id == post_tags.c.tag_id).order_by(post_tags.c.post_id, Tag.name)):
+        tag_names.setdefault(row.post_id, []).append(row.name)
+    commenter_names = {}
+    for row in (db.session.query(Comment.post_id, User.username).join(User, User.id == Comment.user_id)
+                .filter(Comment.is_approved == True).order_by(Comment.post_id, User.username)):
+        commenter_names.setdefault(row.post_id, []).append(row.username)
+
+    def card(row):
+        # 一覧のカード: 投稿・メイン画像のサムネイルの生成状態・タグ名
+        return (row.id.hex, row.updated_at, row.thumbnail_status, tuple(tag_names.get(row.id, ())))
+
+    # トップページ
+    rows = [card(row) for row in
+            db.session.query(Post.id, Post.updated_at, Image.thumbnail_status)
+            .outerjoin(Image, Image.id == Post.main_image_id).filter(published).order_by(*newest_first)]
+    pages += _listing_pages('home.index', {}, rows, per_page=per_page)
+
+    # 投稿詳細 (承認済みコメントの件数と最終更新日時、関連記事の計算日時と関連先の投稿の最終更新日時・件数、
+    # メイン画像のサムネイルの生成状態と派生画像の件数、カテゴリ名・投稿者名・タグ名・コメントの投稿者名も署名に含める)
+    comment_stats = (select(Comment.post_id,
+                            func.max(Comment.updated_at).label('updated_at'),
+                            func.count(Comment.id).label('count'))
+                     .where(Comment.is_approved == True)
+                     .group_by(Comment.post_id)
+                     .subquery())
+    related = aliased(Post)
+    related_stats = (select(RelatedPost.post_id,
+                            func.max(related.updated_at).label('updated_at'),
+                            func.count(related.id).label('count'))
+                     .join(related, related.id == RelatedPost.related_post_id)
+                     .group_by(RelatedPost.post_id)
+                     .subquery())
+    variant_counts = (select(ImageVariant.image_id, func.count(ImageVariant.id).label('count'))
+                      .group_by(ImageVariant.image_id)
+                      .subquery())
+    details = (db.session.query(Post.id, Post.updated_at, Post.category_id, Post.main_image_id,
+                                comment_stats.c.updated_at, comment_stats.c.count, RelatedPostState.computed_at,
+                                related_stats.c.updated_at, related_stats.c.count,
+                                Image.thumbnail_status, variant_counts.c.count, Category.name, User.username)
+               .join(User, User.id == Post.user_id)
+               .outerjoin(Category, Category.id == Post.category_id)
+               .outerjoin(comment_stats, comment_stats.c.post_id == Post.id)
+               .outerjoin(RelatedPostState, RelatedPostState.post_id == Post.id)
+               .outerjoin(related_stats, related_stats.c.post_id == Post.id)
+               .outerjoin(Image, Image.id == Post.main_image_id)
+               .outerjoin(variant_counts, variant_counts.c.image_id == Post.main_image_id)
+               .filter(published))
+    for row in details:
+        url = url_for('home.post_detail', post_id=row[0])
+        signature = _signature(*row, tuple(tag_names.get(row[0], ())), tuple(commenter_names.get(row[0], ())))
+        pages.append({'url': url, 'file': output_file(url), 'signature': signature})
+
+    # カテゴリ別
+    by_category = {}
+    for row in (db.session.query(Post.category_id, Post.id, Post.updated_at, Image.thumbnail_status)
+                .outerjoin(Image, Image.id == Post.main_image_id)
+                .filter(published, Post.category_id.isnot(None)).order_by(Post.category_id, *newest_first)):
+        by_category.setdefault(row.category_id, []).append(card(row))
+    for category in db.session.query(Category.id, Category.name, Category.updated_at):
+        pages += _listing_pages('home.posts_by_category', {'category_id': category.id},
+                                by_category.get(category.id, []),
+                                extra=(category.name, category.updated_at), per_page=per_page)
+
+    # タグ別
+    by_tag = {}
+    for row in (db.session.query(post_tags.c.tag_id, Post.id, Post.updated_at, Image.thumbnail_status)
+                .join(Post, Post.id == post_tags.c.post_id)
+                .outerjoin(Image, Image.id == Post.main_image_id)
+                .filter(published).order_by(post_tags.c.tag_id, *newest_first)):
+        by_tag.setdefault(row.tag_id, []).append(card(row))
+    for tag in db.session.query(Tag.id, Tag.name, Tag.updated_at):
+        pages += _listing_pages('home.posts_by_tag', {'tag_id': tag.id}, by_tag.get(tag.id, []),
+                                extra=(tag.name, tag.updated_at), per_page=per_page)
+
+    # タグクラウド
+    cloud = tuple((row.id.hex, row.name, row.post_count) for row in
+                  db.session.query(Tag.id, Tag.name, Tag.post_count).filter(Tag.post_count > 0).order_by(Tag.id))
+    url = url_for('home.tags')
+    pages.append({'url': url, 'file': output_file(url), 'signature': _signature('home.tags', cloud)})
+    return pages
+
+
+def published_image_files():
+    """
+    公開済み投稿が参照する画像のファイルを (設定のディレクトリキー, 出力先のサブディレクトリ, ファイル名) で返します。
+    下書きにのみ使われている画像は書き出しません。
+    """
+    published_ids = select(Post.id).where(Post.is_published == True)
+    referenced = (Image.id.in_(select(Post.main_image_id).where(Post.is_published == True))
+                  | Image.post_id.in_(published_ids)
+                  | Image.id.in_(select(post_additional_images.c.image_id)
+                                 .where(post_additional_images.c.post_id.in_(published_ids))))
+    files = set()
+    for row in db.session.query(Image.unique_filename, Image.thumbnail_filename).filter(referenced):
+        files.add(('UPLOAD_IMAGES_DIR', 'images', row.unique_filename))
+        if row.thumbnail_filename:
+            files.add(('UPLOAD_THUMBNAILS_DIR', 'thumbnails', row.thumbnail_filename))
+    variant_rows = (db.session.query(ImageVariant.filename)
+                    .filter(ImageVariant.image_id.in_(select(Image.id).where(referenced))))
+    for row in variant_rows:
+        files.add(('UPLOAD_VARIANTS_DIR', 'variants', row.filename))
+    return sorted(files)
+
+
+def _copy_if_changed(src, dest):
+    """dest が存在しないか、サイズ・更新時刻が異なる場合のみコピーします。コピーした場合は True を返します。"""
+    try:
+        src_stat = os.stat(src)
+    except OSError:
+        return False
+    try:
+        dest_stat = os.stat(dest)
+        if dest_stat.st_size == src_stat.st_size and int(dest_stat.st_mtime) == int(src_stat.st_mtime):
+            return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.copy2(src, dest)
+    return True
+
+
+def copy_assets(output_dir):
+    """static/ (アップロード画像を除く) と公開済み投稿の画像を出力先にコピーし、コピーしたファイル数を返します。"""
+    config = current_app.config
+    copied = 0
+    static_folder = current_app.static_folder
+    uploads_dir = os.path.abspath(config['UPLOAD_FOLDER'])
+    for root, dirs, filenames in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != uploads_dir]
+        for filename in filenames:
+            src = os.path.join(root, filename)
+            dest = os.path.join(output_dir, 'static', os.path.relpath(src, static_folder))
+            copied += _copy_if_changed(src, dest)
+    # /uploads/<サブディレクトリ>/<ファイル名> (app/media.py の配信 URL) に合わせて配置する
+    for config_key, subdir, filename in published_image_files():
+        copied += _copy_if_changed(os.path.join(config[config_key], filename),
+                                   os.path.join(output_dir, 'uploads', subdir, filename))
+    return copied
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def render_pages(app, output_dir, pages):
+    """
+    app のテストクライアントで pages を描画して書き出し、成功したページの出力先のリストを返します。
+    ワーカープロセスとプロセス内の描画で共通に使用します。
+    """
+    client = app.test_client()
+    written = []
+    for page in pages:
+        response = client.get(page['url'])
+        if response.status_code != 200:
+            app.logger.error(f"静的書き出しに失敗しました: {page['url']} (HTTP {response.status_code})")
+            continue
+        html = rewrite_links(response.get_data(as_text=True))
+        _write_atomic(os.path.join(output_dir, page['file']), html.encode('utf-8'))
+        written.append(page['file'])
+    return written
+
+
+def _picklable_settings(config):
+    """ワーカープロセスに渡せる設定値だけを取り出します。"""
+    settings = {}
+    for key, value in config.items():
+        if not key.isupper():
+            continue
+        try:
+            pickle.dumps(value)
+        except Exception:
+            continue
+        settings[key] = value
+    settings.update(_EXPORT_CONFIG_OVERRIDES)
+    return settings
+
+
+def _init_worker(settings):
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(type('StaticExportConfig', (), settings))
+
+
+def _render_chunk(output_dir, pages):
+    return render_pages(_worker_app, output_dir, pages)
+
+
+def _render_inline(output_dir, pages):
+    """ワーカーを使わず、現在のアプリケーションで描画します (workers=1 や SQLite のメモリ DB 向け)。"""
+    app = current_app._get_current_object()
+    saved_config = {key: app.config.get(key) for key in _EXPORT_CONFIG_OVERRIDES}
+    saved_cache = app.extensions.get('page_cache')
+    app.config.update(_EXPORT_CONFIG_OVERRIDES)
+    app.extensions['page_cache'] = None
+    try:
+        return render_pages(app, output_dir, pages)
+    finally:
+        app.config.update(saved_config)
+        app.extensions['page_cache'] = saved_cache
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME), encoding='utf-8') as f:
+            return json.load(f).get('pages', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(output_dir, manifest):
+    data = json.dumps({'pages': manifest}, ensure_ascii=False, sort_keys=True, indent=0)
+    _write_atomic(os.path.join(output_dir, MANIFEST_FILENAME), data.encode('utf-8'))
+
+
+def _remove_page(output_dir, relpath):
+    path = os.path.join(output_dir, relpath)
+    if os.path.exists(path):
+        os.remove(path)
+    # 空になったディレクトリ (post/<id>/ など) も削除する
+    directory = os.path.dirname(path)
+    while os.path.abspath(directory) != os.path.abspath(output_dir):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def export_site(output_dir, workers=None, force=False, chunk_size=200):
+    """
+    公開サイトを output_dir に書き出し、ExportResult を返します。
+    workers が 2 以上の場合はプロセスプールで描画します (SQLite のメモリ DB では使用できません)。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    result = ExportResult()
+    workers = workers or os.cpu_count() or 1
+
+    with current_app.test_request_context():
+        pages = collect_pages()
+    previous = {} if force else _load_manifest(output_dir)
+
+    current_files = {page['file'] for page in pages}
+    for relpath in set(previous) - current_files:
+        _remove_page(output_dir, relpath)
+        result.removed += 1
+
+    manifest = {relpath: signature for relpath, signature in previous.items() if relpath in current_files}
+    stale = []
+    for page in pages:
+        if (previous.get(page['file']) == page['signature']
+                and os.path.exists(os.path.join(output_dir, page['file']))):
+            result.skipped += 1
+        else:
+            stale.append(page)
+    signatures = {page['file']: page['signature'] for page in stale}
+
+    if stale:
+        if workers > 1 and len(stale) > chunk_size:
+            chunks = [stale[i:i + chunk_size] for i in range(0, len(stale), chunk_size)]
+            settings = _picklable_settings(current_app.config)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(settings,)) as executor:
+                written = [relpath for chunk_written in
+                           executor.map(_render_chunk, [output_dir] * len(chunks), chunks)
+                           for relpath in chunk_written]
+        else:
+            written = _render_inline(output_dir, stale)
+        for relpath in written:
+            manifest[relpath] = signatures[relpath]
+        result.rendered = len(written)
+        result.failed = len(stale) - len(written)
+
+    _save_manifest(output_dir, manifest)
+    result.copied_files = copy_assets(output_dir)
+    return result
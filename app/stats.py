@@ -0,0 +1,212 @@
+# F:\dev\BrogDev\app\stats.py
+"""
+管理ダッシュボードの集計値 (site_stat テーブル) の管理。
+
+投稿数・公開済み投稿数・コメント数・ユーザー数・管理者数を site_stat に保持し、
+SQLAlchemy のマッパーイベント (after_insert / after_update / after_delete) で増減を集め、
+after_flush で同じトランザクション内の UPDATE として反映します。
+ロールバックされれば集計値の変更も取り消されるため、実際の件数とずれません。
+
+Query.update() / delete() などフラッシュを経由しない一括変更の後は、その場で全件を数え直します。
+値がずれた場合は `flask init recount` で修復できます。
+"""
+
+from collections import Counter
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import db
+from app.models import Comment, Post, Role, SiteStat, User, roles_users
+
+ADMIN_ROLE = 'admin'
+
+COUNTERS = ('posts', 'published_posts', 'comments', 'users', 'admins')
+
+# 一括変更の後に数え直す対象のテーブル
+_COUNTED_TABLES = frozenset({'post', 'comment', 'user', 'roles_users'})
+
+_DELTAS_KEY = 'site_stat_deltas'
+
+
+def count_statements():
+    """各集計値を実際に数える SELECT 文を返します。"""
+    return {
+        'posts': select(func.count()).select_from(Post),
+        'published_posts': select(func.count()).select_from(Post).where(Post.is_published == True),
+        'comments': select(func.count()).select_from(Comment),
+        'users': select(func.count()).select_from(User),
+        'admins': (select(func.count(func.distinct(roles_users.c.user_id)))
+                   .join(Role, Role.id == roles_users.c.role_id)
+                   .where(Role.name == ADMIN_ROLE)),
+    }
+
+
+def recount_stats(connection):
+    """全ての集計値を数え直して site_stat に保存し、{名前: 値} を返します。"""
+    counts = {name: connection.execute(stmt).scalar() for name, stmt in count_statements().items()}
+    table = SiteStat.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert(), [{'name': name, 'value': value} for name, value in counts.items()])
+    return counts
+
+
+def get_stats():
+    """
+    集計値を {名前: 値} で返します (site_stat を1回読むだけ)。
+    site_stat にまだ行がない集計値はその場で数えます (`flask init recount` で作成されます)。
+    """
+    stats = dict(db.session.query(SiteStat.name, SiteStat.value))
+    statements = count_statements()
+    for name in COUNTERS:
+        if name not in stats:
+            stats[name] = db.session.execute(statements[name]).scalar()
+    return stats
+
+
+def count_live(name):
+    """
+    集計値を site_stat を使わずにその場で数えます。
+    最後の管理者の削除防止など、集計値がずれていると安全性に関わる判定ではこちらを使います。
+    """
+    return db.session.execute(count_statements()[name]).scalar()
+
+
+# --- 増減の収集 ---
+
+def _deltas(target):
+    return object_session(target).info.setdefault(_DELTAS_KEY, Counter())
+
+
+def _committed(target, attr):
+    """フラッシュ前 (変更前) の属性値を返します。"""
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+def _admin_roles(roles):
+    return sum(1 for role in roles if role.name == ADMIN_ROLE)
+
+
+def _post_inserted(mapper, connection, target):
+    deltas = _deltas(target)
+    deltas['posts'] += 1
+    deltas['published_posts'] += bool(target.is_published)
+
+
+def _post_updated(mapper, connection, target):
+    history = inspect(target).attrs.is_published.history
+    if history.has_changes():
+        _deltas(target)['published_posts'] += bool(target.is_published) - bool(_committed(target, 'is_published'))
+
+
+def _post_deleted(mapper, connection, target):
+    deltas = _deltas(target)
+    deltas['posts'] -= 1
+    deltas['published_posts'] -= bool(_committed(target, 'is_published'))
+
+
+def _comment_inserted(mapper, connection, target):
+    _deltas(target)['comments'] += 1
+
+
+def _comment_deleted(mapper, connection, target):
+    _deltas(target)['comments'] -= 1
+
+
+def _user_inserted(mapper, connection, target):
+    deltas = _deltas(target)
+    deltas['users'] += 1
+    deltas['admins'] += min(1, _admin_roles(target.roles))
+
+
+def _user_updated(mapper, connection, target):
+    history = inspect(target).attrs.roles.history
+    before = min(1, _admin_roles(list(history.unchanged) + list(history.deleted)))
+    after = min(1, _admin_roles(list(history.unchanged) + list(history.added)))
+    if before != after:
+        _deltas(target)['admins'] += after - before
+
+
+def _user_deleted(mapper, connection, target):
+    history = inspect(target).attrs.roles.history
+    deltas = _deltas(target)
+    deltas['users'] -= 1
+    deltas['admins'] -= min(1, _admin_roles(list(history.unchanged) + list(history.deleted)))
+
+
+def _load_before_delete(db_session, flush_context, instances):
+    # 削除する行の公開状態・ロールを DELETE の前に読み込んでおき、減算に使う
+    for obj in db_session.deleted:
+        if isinstance(obj, Post):
+            obj.is_published
+        elif isinstance(obj, User):
+            obj.roles
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    # active_history=True で登録することで、未読み込みの属性を変更した場合も変更前の値が履歴に残る
+    return value
+
+
+def _apply_deltas(db_session, flush_context):
+    deltas = db_session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+    table = SiteStat.__table__
+    connection = db_session.connection()
+    for name, delta in deltas.items():
+        if delta:
+            connection.execute(table.update().where(table.c.name == name).values(value=table.c.value + delta))
+
+
+def _discard_deltas(db_session):
+    db_session.info.pop(_DELTAS_KEY, None)
+
+
+def _recount_after_bulk(orm_execute_state):
+    """Query.update() / delete() や Core の一括 INSERT などの後に集計値を数え直します。"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    # 呼び出し側で集計値を調整済みの文 (app.tag_counts.COUNTS_MAINTAINED) は数え直さない
+    if orm_execute_state.execution_options.get('counts_maintained'):
+        return None
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(table, 'name', None) not in _COUNTED_TABLES:
+        return None
+    result = orm_execute_state.invoke_statement()
+    recount_stats(orm_execute_state.session.connection())
+    return result
+
+
+def _create_stats(target, connection, **kw):
+    # db.create_all() の直後に現在の件数で site_stat を作成する
+    recount_stats(connection)
+
+
+_listeners = (
+    (Post, 'after_insert', _post_inserted),
+    (Post, 'after_update', _post_updated),
+    (Post, 'after_delete', _post_deleted),
+    (Comment, 'after_insert', _comment_inserted),
+    (Comment, 'after_delete', _comment_deleted),
+    (User, 'after_insert', _user_inserted),
+    (User, 'after_update', _user_updated),
+    (User, 'after_delete', _user_deleted),
+    (Session, 'before_flush', _load_before_delete),
+    (Session, 'after_flush', _apply_deltas),
+    (Session, 'after_rollback', _discard_deltas),
+    (Session, 'do_orm_execute', _recount_after_bulk),
+    (db.metadata, 'after_create', _create_stats),
+)
+
+
+def init_app(app):
+    """集計値を増減させるイベントを登録します。"""
+    for target, name, listener in _listeners:
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
+    if not event.contains(Post.is_published, 'set', _keep_previous_value):
+        event.listen(Post.is_published, 'set', _keep_previous_value, active_history=True)
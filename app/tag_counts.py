@@ -0,0 +1,187 @@
+# F:\dev\BrogDev\app\tag_counts.py
+"""
+タグ・カテゴリごとの公開済み投稿数 (Tag.post_count / Category.post_count) の管理。
+
+タグクラウドやカテゴリ一覧で件数を表示するたびに post_tags と post を数えずに済むよう、
+公開済み投稿の件数を各行に保持します。
+
+- before_flush で、変更・削除される投稿の変更前の寄与 (公開状態・カテゴリ・タグ) を記録します。
+- after_flush で変更後の寄与との差分を求め、同じトランザクション内の UPDATE として反映します。
+  ロールバックされれば件数の変更も取り消されます。件数が変わった行は updated_at も更新されるため、
+  タグ別一覧やタグクラウドの条件付き GET の検証用の値も変わります。
+- Query.update() / delete() や post_tags への Core の一括 INSERT など、フラッシュを経由しない変更の後は
+  その場で全件を数え直します。ただし実行オプション COUNTS_MAINTAINED 付きの文 (app/post_bulk.py など、
+  呼び出し側で apply_count_deltas により調整済みのもの) は数え直しません。
+
+値がずれた場合は `flask init recount-tags` で修復できます。
+"""
+
+import math
+from collections import Counter
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import Category, Post, Tag, post_tags
+
+# 一括変更の後に数え直す対象のテーブル
+_COUNTED_TABLES = frozenset({'post', 'post_tags'})
+
+# 変更されたら件数に影響する投稿の属性
+_TRACKED_ATTRS = ('is_published', 'category_id', 'category', 'tags')
+
+_PENDING_KEY = 'post_count_pending'
+
+# 呼び出し側で post_count を調整済みの一括変更に指定する実行オプション (数え直しを行わない)
+COUNTS_MAINTAINED = {'counts_maintained': True}
+
+
+def recount_post_counts(connection):
+    """全てのタグ・カテゴリの post_count を実際の件数で更新し、修正した行数を {'tags': 行数, 'categories': 行数} で返します。"""
+    tag, category, post = Tag.__table__, Category.__table__, Post.__table__
+    tag_count = (select(func.count())
+                 .select_from(post_tags.join(post, post.c.id == post_tags.c.post_id))
+                 .where(post_tags.c.tag_id == tag.c.id, post.c.is_published == True)
+                 .scalar_subquery())
+    category_count = (select(func.count())
+                      .select_from(post)
+                      .where(post.c.category_id == category.c.id, post.c.is_published == True)
+                      .scalar_subquery())
+    # 値が実際の件数と異なる行だけを更新する (updated_at が進み、ページの ETag も変わる)
+    tags = connection.execute(tag.update().where(tag.c.post_count != tag_count).values(post_count=tag_count))
+    categories = connection.execute(category.update()
+                                    .where(category.c.post_count != category_count)
+                                    .values(post_count=category_count))
+    return {'tags': tags.rowcount, 'categories': categories.rowcount}
+
+
+def apply_count_deltas(connection, table, deltas):
+    """{行の ID: 増減量} を tag / category テーブルの post_count に加算します (同じ増減量の行は1回の UPDATE)。"""
+    by_delta = {}
+    for row_id, delta in deltas.items():
+        if row_id is not None and delta:
+            by_delta.setdefault(delta, []).append(row_id)
+    for delta, ids in by_delta.items():
+        connection.execute(table.update()
+                           .where(table.c.id.in_(ids))
+                           .values(post_count=table.c.post_count + delta))
+
+
+def tag_cloud(limit=None, steps=5):
+    """
+    公開済み投稿があるタグを件数の多い順に最大 limit 件読み込み (ix_tag_post_count を使う1クエリ)、
+    名前順に並べた [(タグ, 重み 1〜steps)] を返します。重みは件数の対数で段階分けします。
+    """
+    query = Tag.query.filter(Tag.post_count > 0).order_by(Tag.post_count.desc(), Tag.name)
+    if limit:
+        query = query.limit(limit)
+    tags = query.all()
+    if not tags:
+        return []
+    low = math.log(min(tag.post_count for tag in tags))
+    high = math.log(max(tag.post_count for tag in tags))
+    spread = high - low or 1
+    cloud = [(tag, 1 + round((math.log(tag.post_count) - low) / spread * (steps - 1))) for tag in tags]
+    return sorted(cloud, key=lambda item: item[0].name)
+
+
+# --- 増減の収集 ---
+
+def _contribution(is_published, category_id, tag_ids):
+    """1件の投稿が件数に与える寄与 (カテゴリ ID, タグ ID の集合) を返します。非公開なら寄与なし。"""
+    if not is_published:
+        return None, frozenset()
+    return category_id, frozenset(tag_ids)
+
+
+def _committed(state, attr):
+    """フラッシュ前 (変更前) の属性値を返します。"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.obj(), attr)
+
+
+def _committed_contribution(post):
+    state = inspect(post)
+    tags = state.attrs.tags.load_history()
+    return _contribution(_committed(state, 'is_published'), _committed(state, 'category_id'),
+                         (tag.id for tag in list(tags.unchanged) + list(tags.deleted)))
+
+
+def _record_before_flush(db_session, flush_context, instances):
+    pending = db_session.info.setdefault(_PENDING_KEY, {})
+    for obj in db_session.new:
+        if isinstance(obj, Post):
+            pending.setdefault(obj, _contribution(False, None, ()))
+    for obj in db_session.dirty:
+        if isinstance(obj, Post) and obj not in pending:
+            state = inspect(obj)
+            if any(state.attrs[attr].history.has_changes() for attr in _TRACKED_ATTRS):
+                pending[obj] = _committed_contribution(obj)
+    for obj in db_session.deleted:
+        if isinstance(obj, Post):
+            pending[obj] = _committed_contribution(obj)
+
+
+def _apply_deltas(db_session, flush_context):
+    pending = db_session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    tag_deltas, category_deltas = Counter(), Counter()
+    for post, (old_category_id, old_tag_ids) in pending.items():
+        if inspect(post).deleted or post in db_session.deleted:
+            new_category_id, new_tag_ids = None, frozenset()
+        else:
+            new_category_id, new_tag_ids = _contribution(post.is_published, post.category_id,
+                                                         (tag.id for tag in post.tags))
+        tag_deltas.update(new_tag_ids)
+        tag_deltas.subtract(old_tag_ids)
+        if old_category_id != new_category_id:
+            category_deltas[new_category_id] += 1
+            category_deltas[old_category_id] -= 1
+
+    connection = db_session.connection()
+    apply_count_deltas(connection, Tag.__table__, tag_deltas)
+    apply_count_deltas(connection, Category.__table__, category_deltas)
+
+
+def _discard_pending(db_session):
+    db_session.info.pop(_PENDING_KEY, None)
+
+
+def _recount_after_bulk(orm_execute_state):
+    """Query.update() / delete() や post_tags への Core の一括変更の後に件数を数え直します。"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    if orm_execute_state.execution_options.get('counts_maintained'):
+        return None
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(table, 'name', None) not in _COUNTED_TABLES:
+        return None
+    result = orm_execute_state.invoke_statement()
+    recount_post_counts(orm_execute_state.session.connection())
+    return result
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    # active_history=True で登録することで、未読み込みの属性を変更した場合も変更前の値が履歴に残る
+    return value
+
+
+_listeners = (
+    (Session, 'before_flush', _record_before_flush),
+    (Session, 'after_flush', _apply_deltas),
+    (Session, 'after_rollback', _discard_pending),
+    (Session, 'do_orm_execute', _recount_after_bulk),
+)
+
+
+def init_app(app):
+    """post_count を増減させるイベントを登録します。"""
+    for target, name, listener in _listeners:
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
+    for attribute in (Post.is_published, Post.category_id):
+        if not event.contains(attribute, 'set', _keep_previous_value):
+            event.listen(attribute, 'set', _keep_previous_value, active_history=True)
@@ -0,0 +1,245 @@
+# F:\dev\BrogDev\app\thumbnails.py
+"""
+サムネイルのバックグラウンド生成。
+
+アップロード時はリクエスト内で Pillow を実行せず、image_job テーブルにジョブを登録して
+Image.thumbnail_status を 'pending' にするだけにします。
+実際の生成は `flask init thumbnail-worker` がプロセスプールで並列に行い、
+完了後に Image.thumbnail_filename / thumbnail_filepath を設定して 'ready' にします。
+生成が終わるまでは Image.thumbnail_url が元画像の URL を返すため、テンプレート側の変更は不要です。
+
+同じワーカーがレスポンシブ画像用の派生画像 (kind='variants'、app/variants.py) も生成します。
+この動作は THUMBNAIL_ASYNC = True の場合だけで、既定 (False) ではワーカーを起動しない環境でも
+画像が揃うよう、サムネイルと派生画像の両方をリクエスト内で生成します。
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pytz
+from flask import current_app
+from PIL import Image as PilImage
+
+from app.extensions import db
+from app.models import Image, ImageJob
+from app.variants import JOB_KIND_VARIANTS, generate_variants, replace_variants, variant_task_args
+
+JOB_KIND_THUMBNAIL = 'thumbnail'
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+THUMBNAIL_PENDING = 'pending'
+THUMBNAIL_READY = 'ready'
+THUMBNAIL_FAILED = 'failed'
+
+
+def thumbnail_filename_for(unique_filename):
+    """元画像のファイル名からサムネイルのファイル名を返します。"""
+    return 'thumb_' + unique_filename
+
+
+def generate_thumbnail(src_path, dest_path, size):
+    """
+    src_path の画像から size に収まるサムネイルを dest_path に保存します。
+    ワーカープロセスで実行されるため、アプリケーションコンテキストには依存しません。
+    """
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    with PilImage.open(src_path) as img:
+        img.thumbnail(tuple(size))
+        img.save(dest_path)
+    return dest_path
+
+
+def _thumbnail_paths(image):
+    """(元画像の絶対パス, サムネイルの絶対パス) を返します。"""
+    config = current_app.config
+    src_path = os.path.join(config['UPLOAD_IMAGES_DIR'], image.unique_filename)
+    dest_path = os.path.join(config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename_for(image.unique_filename))
+    return src_path, dest_path
+
+
+def _mark_thumbnail_ready(image):
+    thumbnail_filename = thumbnail_filename_for(image.unique_filename)
+    image.thumbnail_filename = thumbnail_filename
+    image.thumbnail_filepath = os.path.join(
+        current_app.config['THUMBNAIL_FOLDER_RELATIVE_PATH'], thumbnail_filename
+    ).replace('\\', '/')
+    image.thumbnail_status = THUMBNAIL_READY
+
+
+def schedule_thumbnail(image):
+    """
+    image のサムネイル生成を予約します (image はセッションに追加済みであること)。
+    THUMBNAIL_ASYNC が有効ならジョブを登録し、無効ならその場で生成します。
+    コミットは呼び出し側で行ってください。
+    """
+    config = current_app.config
+    if not config.get('GENERATE_THUMBNAILS', True):
+        image.thumbnail_status = THUMBNAIL_READY
+        return
+
+    if config.get('THUMBNAIL_ASYNC', False):
+        image.thumbnail_status = THUMBNAIL_PENDING
+        db.session.add(ImageJob(image=image, kind=JOB_KIND_THUMBNAIL))
+        return
+
+    src_path, dest_path = _thumbnail_paths(image)
+    try:
+        generate_thumbnail(src_path, dest_path, config['THUMBNAIL_SIZE'])
+        _mark_thumbnail_ready(image)
+    except Exception as e:
+        current_app.logger.error(f"サムネイル生成中にエラーが発生しました: {image.unique_filename} - {e}")
+        image.thumbnail_status = THUMBNAIL_FAILED
+
+
+def schedule_variants(image):
+    """
+    image のレスポンシブ用派生画像の生成を予約します (IMAGE_VARIANT_WIDTHS が空なら何もしない)。
+    THUMBNAIL_ASYNC が有効ならジョブを登録し、無効ならその場で生成します。
+    """
+    config = current_app.config
+    if not config.get('IMAGE_VARIANT_WIDTHS'):
+        return
+    if config.get('THUMBNAIL_ASYNC', False):
+        db.session.add(ImageJob(image=image, kind=JOB_KIND_VARIANTS))
+        return
+    try:
+        replace_variants(image, generate_variants(*variant_task_args(image.unique_filename)))
+    except Exception as e:
+        current_app.logger.error("派生画像の生成中にエラーが発生しました: %s - %s", image.unique_filename, e)
+
+
+def schedule_derivatives(image):
+    """アップロードされた image のサムネイルと派生画像の生成を予約します。"""
+    schedule_thumbnail(image)
+    schedule_variants(image)
+
+
+def reset_stale_jobs():
+    """前回のワーカーが処理途中で停止した 'running' のジョブを 'pending' に戻します。戻した件数を返します。"""
+    count = ImageJob.query.filter_by(status=STATUS_RUNNING).update(
+        {'status': STATUS_PENDING, 'started_at': None}, synchronize_session=False
+    )
+    db.session.commit()
+    return count
+
+
+def claim_jobs(limit):
+    """
+    未処理のジョブを最大 limit 件取り出して 'running' にし、リストで返します。
+    status='pending' を条件に UPDATE するため、複数のワーカーを起動しても同じジョブを二重に処理しません。
+    """
+    candidate_ids = [row.id for row in db.session.query(ImageJob.id)
+                     .filter_by(status=STATUS_PENDING)
+                     .order_by(ImageJob.id)
+                     .limit(limit)]
+    now = datetime.now(pytz.utc)
+    claimed_ids = []
+    for job_id in candidate_ids:
+        updated = ImageJob.query.filter_by(id=job_id, status=STATUS_PENDING).update(
+            {'status': STATUS_RUNNING, 'started_at': now, 'attempts': ImageJob.attempts + 1},
+            synchronize_session=False,
+        )
+        if updated:
+            claimed_ids.append(job_id)
+    db.session.commit()
+    if not claimed_ids:
+        return []
+    return ImageJob.query.filter(ImageJob.id.in_(claimed_ids)).order_by(ImageJob.id).all()
+
+
+def _job_task(job):
+    """ジョブの種類に応じて、ワーカープロセスで実行する (関数, 引数) を返します。"""
+    if job.kind == JOB_KIND_VARIANTS:
+        return generate_variants, variant_task_args(job.image.unique_filename)
+    src_path, dest_path = _thumbnail_paths(job.image)
+    return generate_thumbnail, (src_path, dest_path, current_app.config['THUMBNAIL_SIZE'])
+
+
+def _sharing_images(image):
+    """image と同じ content_hash (同じファイル) を持つ他の Image を返します。"""
+    if image.content_hash is None:
+        return []
+    return Image.query.filter(Image.content_hash == image.content_hash, Image.id != image.id).all()
+
+
+def _finish_job(job, result=None, error=None):
+    max_attempts = current_app.config.get('THUMBNAIL_JOB_MAX_ATTEMPTS', 3)
+    job.finished_at = datetime.now(pytz.utc)
+    if error is None:
+        job.status = STATUS_DONE
+        job.error = None
+        # 同じ内容のファイルを共有している画像 (重複アップロード) にも結果を反映する
+        for image in [job.image] + _sharing_images(job.image):
+            if job.kind == JOB_KIND_VARIANTS:
+                replace_variants(image, result)
+            else:
+                _mark_thumbnail_ready(image)
+    elif job.attempts >= max_attempts:
+        job.status = STATUS_FAILED
+        job.error = error
+        if job.kind == JOB_KIND_THUMBNAIL:
+            job.image.thumbnail_status = THUMBNAIL_FAILED
+    else:
+        # 再試行に回す
+        job.status = STATUS_PENDING
+        job.error = error
+
+
+def process_jobs(executor, batch_size):
+    """
+    ジョブを1バッチ分取り出して executor で並列に処理します。
+    処理結果を反映してコミットし、(成功件数, 失敗件数) を返します。取り出すジョブがなければ None を返します。
+    """
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return None
+
+    futures = {}
+    for job in jobs:
+        func, args = _job_task(job)
+        futures[executor.submit(func, *args)] = job
+
+    succeeded = failed = 0
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            current_app.logger.error(f"画像ジョブ {job.id} ({job.kind}) が失敗しました: {job.image.unique_filename} - {e}")
+            _finish_job(job, error=str(e))
+            failed += 1
+        else:
+            _finish_job(job, result=result)
+            succeeded += 1
+    db.session.commit()
+    return succeeded, failed
+
+
+def run_worker(workers=None, once=False, poll_interval=2.0, batch_size=None):
+    """
+    サムネイル生成ワーカーを実行します。
+    once=True の場合は未処理のジョブがなくなった時点で終了し、(成功件数, 失敗件数) を返します。
+    """
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size or workers * 4
+    reset_stale_jobs()
+
+    succeeded = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            result = process_jobs(executor, batch_size)
+            if result is None:
+                if once:
+                    break
+                db.session.remove()
+                time.sleep(poll_interval)
+                continue
+            succeeded += result[0]
+            failed += result[1]
+    return succeeded, failed
@@ -0,0 +1,422 @@
+# F:\dev\BrogDev\app\uploads.py
+"""
+画像のアップロード処理 (コンテンツアドレス方式の保存と重複排除、一括アップロード)。
+
+アップロードされたファイルはチャンク単位で書き出しながら SHA-256 を計算し、
+UPLOAD_IMAGES_DIR/<sha256><拡張子> に保存します。同じ内容の画像が既にある場合
+(Image.content_hash の索引で検索) はファイルを共有し、サムネイル・派生画像も再生成せずに引き継ぎます。
+ファイルは同じ content_hash を持つ最後の Image の削除がコミットされたときにだけ削除されます (release_image_files)。
+
+一括アップロード (ingest_uploads) は次の順で処理します。
+1. 各ファイルをチャンク単位でディスクに書き出す (リクエストボディ全体をメモリに載せない)
+2. 新しい内容の画像だけ、デコード (破損チェック) とサムネイル生成をプロセスプールで並列に実行する
+3. 成功した Image 行をまとめて1回の INSERT (executemany) で登録する
+
+ファイルごとの成否は UploadResult のリストで返します。
+THUMBNAIL_ASYNC が有効な場合、サムネイルとレスポンシブ用の派生画像 (app/variants.py) はここでは生成せず
+ジョブとして登録します (app/thumbnails.py)。無効 (既定) の場合は手順 2 で一緒に生成します。
+"""
+
+import atexit
+import hashlib
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from flask import current_app
+from PIL import Image as PilImage
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session, selectinload
+from werkzeug.utils import secure_filename
+
+from app.extensions import db
+from app.models import Image, ImageJob, ImageVariant
+from app.thumbnails import (JOB_KIND_THUMBNAIL, THUMBNAIL_PENDING, THUMBNAIL_READY, schedule_derivatives,
+                            thumbnail_filename_for)
+from app.variants import JOB_KIND_VARIANTS, generate_variants, variant_task_args
+
+# ディスクへの書き込み単位 (バイト)
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# release_image_files() で登録した、コミット後に削除するファイルのパスを保存する Session.info のキー
+_PENDING_REMOVALS_KEY = 'uploads_pending_removals'
+
+# アップロード処理で共有するプロセスプール (初回使用時に作成)
+_executor = None
+_executor_lock = Lock()
+
+
+class UploadResult:
+    """1ファイル分のアップロード結果。"""
+
+    def __init__(self, filename, image_id=None, error=None):
+        self.filename = filename
+        self.image_id = image_id
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f"<UploadResult {self.filename} {'ok' if self.ok else self.error}>"
+
+
+def get_upload_executor():
+    """アップロード処理用のプロセスプールを返します (UPLOAD_WORKERS、未設定なら CPU コア数)。"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config.get('UPLOAD_WORKERS') or os.cpu_count() or 1
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            atexit.register(_executor.shutdown, wait=False)
+        return _executor
+
+
+def is_allowed_filename(filename):
+    return '.' in filename and \
+        filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+
+def stream_to_disk(file_storage, dest_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    アップロードファイルを chunk_size ごとに dest_path へ書き出しながら SHA-256 を計算し、
+    (書き込んだバイト数, 16進数のハッシュ) を返します。
+    """
+    written = 0
+    digest = hashlib.sha256()
+    stream = file_storage.stream
+    with open(dest_path, 'wb') as dest:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dest.write(chunk)
+            written += len(chunk)
+    return written, digest.hexdigest()
+
+
+def content_addressed_filename(content_hash, original_filename):
+    """内容のハッシュと元のファイル名の拡張子から保存用のファイル名を返します。"""
+    return content_hash + os.path.splitext(original_filename)[1].lower()
+
+
+def save_to_temp(file_storage, chunk_size=None):
+    """
+    アップロードファイルを UPLOAD_IMAGES_DIR 内の一時ファイルに書き出し、(一時ファイルのパス, ハッシュ) を返します。
+    書き込みに失敗した場合は一時ファイルを削除して OSError を送出します。
+    """
+    config = current_app.config
+    os.makedirs(config['UPLOAD_IMAGES_DIR'], exist_ok=True)
+    temp_path = os.path.join(config['UPLOAD_IMAGES_DIR'], f'.upload-{uuid.uuid4().hex}.tmp')
+    try:
+        _, content_hash = stream_to_disk(file_storage, temp_path,
+                                         chunk_size or config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    except OSError:
+        _remove_quietly(temp_path)
+        raise
+    return temp_path, content_hash
+
+
+def place_content(temp_path, unique_filename):
+    """
+    一時ファイルをコンテンツアドレスの保存先に移動し、保存先の絶対パスを返します。
+    同じ内容のファイルが既にあれば一時ファイルを破棄します。
+    """
+    dest_path = os.path.join(current_app.config['UPLOAD_IMAGES_DIR'], unique_filename)
+    if os.path.exists(dest_path):
+        _remove_quietly(temp_path)
+    else:
+        os.replace(temp_path, dest_path)
+    return dest_path
+
+
+def find_images_by_hash(content_hashes):
+    """ハッシュごとに最初に登録された Image を {ハッシュ: Image} で返します (1回のクエリ)。"""
+    content_hashes = set(content_hashes)
+    if not content_hashes:
+        return {}
+    found = {}
+    for image in (Image.query.options(selectinload(Image.variants))
+                  .filter(Image.content_hash.in_(content_hashes))
+                  .order_by(Image.uploaded_at)):
+        found.setdefault(image.content_hash, image)
+    return found
+
+
+def derivative_fields(source):
+    """重複した画像に引き継ぐサムネイル関連の列を辞書で返します。"""
+    return {
+        'thumbnail_filename': source.thumbnail_filename,
+        'thumbnail_filepath': source.thumbnail_filepath,
+        'thumbnail_status': source.thumbnail_status,
+    }
+
+
+def variant_data(source):
+    """source の派生画像の記録を複製用の辞書のリストで返します (ファイルは共有)。"""
+    return [{'format': v.format, 'width': v.width, 'height': v.height,
+             'filename': v.filename, 'bytes': v.bytes} for v in source.variants]
+
+
+def create_image_from_upload(file_storage, user_id, alt_text=''):
+    """
+    1ファイルのアップロードを保存し、Image をセッションに追加して返します (コミットは呼び出し側で行う)。
+    同じ内容の画像が既にあればファイルとサムネイル・派生画像を共有し、なければ生成を予約します。
+    """
+    original_filename = secure_filename(file_storage.filename)
+    temp_path, content_hash = save_to_temp(file_storage)
+    source = find_images_by_hash([content_hash]).get(content_hash)
+    unique_filename = source.unique_filename if source else content_addressed_filename(content_hash, original_filename)
+    place_content(temp_path, unique_filename)
+
+    image = Image(
+        original_filename=original_filename,
+        unique_filename=unique_filename,
+        content_hash=content_hash,
+        mimetype=file_storage.mimetype,
+        filepath=os.path.join(current_app.config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename).replace('\\', '/'),
+        user_id=user_id,
+        alt_text=alt_text,
+    )
+    db.session.add(image)
+    if source is None:
+        schedule_derivatives(image)
+    else:
+        current_app.logger.info(f"同じ内容の画像が既に存在するためファイルを共有します: {unique_filename}")
+        for key, value in derivative_fields(source).items():
+            setattr(image, key, value)
+        image.variants = [ImageVariant(**data) for data in variant_data(source)]
+    return image
+
+
+def release_image_files(image):
+    """
+    image を削除する前に呼び出し、同じ内容を参照する Image が他になければ
+    元画像・サムネイル・派生画像のファイルを削除対象に登録します。登録した場合は True を返します。
+    ファイルは削除をコミットした後に削除し、ロールバックした場合は残します (行が消えたファイルを指さないように)。
+    """
+    if image.content_hash is not None:
+        others = Image.query.filter(Image.content_hash == image.content_hash, Image.id != image.id).count()
+        if others:
+            current_app.logger.info(f"{others} 件の画像が参照しているためファイルを残します: {image.unique_filename}")
+            return False
+
+    config = current_app.config
+    paths = [os.path.join(config['UPLOAD_IMAGES_DIR'], image.unique_filename)]
+    if image.thumbnail_filename:
+        paths.append(os.path.join(config['UPLOAD_THUMBNAILS_DIR'], image.thumbnail_filename))
+    paths.extend(os.path.join(config['UPLOAD_VARIANTS_DIR'], v.filename) for v in image.variants)
+    db.session.info.setdefault(_PENDING_REMOVALS_KEY, []).extend(paths)
+    return True
+
+
+def _remove_released_files(db_session):
+    for path in db_session.info.pop(_PENDING_REMOVALS_KEY, ()):
+        if os.path.exists(path):
+            os.remove(path)
+            current_app.logger.info(f"Deleted physical file: {path}")
+        else:
+            current_app.logger.warning(f"File not found for deletion: {path}")
+
+
+def _keep_released_files(db_session):
+    db_session.info.pop(_PENDING_REMOVALS_KEY, None)
+
+
+def process_upload(src_path, thumbnail_path=None, size=None):
+    """
+    画像を最後までデコードして破損していないことを確認し、(幅, 高さ) を返します。
+    thumbnail_path を指定した場合はサムネイルも生成します。ワーカープロセスで実行されます。
+    """
+    with PilImage.open(src_path) as img:
+        width, height = img.size
+        if thumbnail_path:
+            # thumbnail() は JPEG を縮小スケールでデコードする (draft) ため、先に load() しない
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            img.thumbnail(tuple(size))
+            img.save(thumbnail_path)
+        else:
+            # 検証のみの場合も JPEG は 1/8 スケールでデコードすれば十分
+            img.draft(img.mode, (1, 1))
+            img.load()
+    return width, height
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def ingest_uploads(files, user_id, alt_text='', executor=None):
+    """
+    files (FileStorage のリスト) を保存・検証し、成功分の Image をまとめて登録してコミットします。
+    既存の画像や同じバッチ内の画像と内容が同じファイルはデコード・サムネイル生成を省略します。
+    executor を省略した場合、UPLOAD_PARALLEL_MIN_FILES 件以上なら共有プロセスプール、
+    それ未満ならこのプロセス内で処理します。戻り値は files と同じ順の UploadResult のリストです。
+    """
+    config = current_app.config
+    make_thumbnails = config.get('GENERATE_THUMBNAILS', True)
+    async_derivatives = config.get('THUMBNAIL_ASYNC', False)
+    async_thumbnails = make_thumbnails and async_derivatives
+    inline_thumbnails = make_thumbnails and not async_derivatives
+    inline_variants = bool(config.get('IMAGE_VARIANT_WIDTHS')) and not async_derivatives
+
+    # 1. 一時ファイルへ書き出しながらハッシュを計算する
+    results = []
+    saved = []  # (result, 元のファイル名, mimetype, 一時ファイルのパス, ハッシュ)
+    for file_storage in files:
+        original_filename = secure_filename(file_storage.filename or '')
+        result = UploadResult(file_storage.filename or original_filename)
+        results.append(result)
+        if not original_filename or not is_allowed_filename(original_filename):
+            result.error = '許可されていないファイル形式です。'
+            continue
+        try:
+            temp_path, content_hash = save_to_temp(file_storage)
+        except OSError as e:
+            current_app.logger.error(f"バルクアップロード中にファイル保存エラー: {original_filename} - {e}")
+            result.error = 'ファイルを保存できませんでした。'
+            continue
+        saved.append((result, original_filename, file_storage.mimetype, temp_path, content_hash))
+
+    # 2. 既存の画像 (1回のクエリ) とバッチ内の先行ファイルに対して重複を判定する
+    existing = find_images_by_hash(entry[4] for entry in saved)
+    staged = []      # 新しい内容: (result, row, 保存先パス, サムネイル保存先パス)
+    duplicates = []  # 重複: (result, row, 既存の Image または先行する row)
+    first_rows = {}  # バッチ内で最初に現れたハッシュの row
+    for result, original_filename, mimetype, temp_path, content_hash in saved:
+        source = existing.get(content_hash) or first_rows.get(content_hash)
+        if source is not None:
+            unique_filename = source.unique_filename if isinstance(source, Image) else source['unique_filename']
+        else:
+            unique_filename = content_addressed_filename(content_hash, original_filename)
+        try:
+            filepath_abs = place_content(temp_path, unique_filename)
+        except OSError as e:
+            current_app.logger.error(f"バルクアップロード中にファイル保存エラー: {original_filename} - {e}")
+            _remove_quietly(temp_path)
+            result.error = 'ファイルを保存できませんでした。'
+            continue
+
+        row = {
+            'id': uuid.uuid4(),
+            'original_filename': original_filename,
+            'unique_filename': unique_filename,
+            'content_hash': content_hash,
+            'mimetype': mimetype,
+            'filepath': os.path.join(config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename).replace('\\', '/'),
+            'thumbnail_filename': None,
+            'thumbnail_filepath': None,
+            'thumbnail_status': THUMBNAIL_PENDING if async_thumbnails else THUMBNAIL_READY,
+            'user_id': user_id,
+            'alt_text': alt_text,
+        }
+        if source is not None:
+            duplicates.append((result, row, source))
+            continue
+        first_rows[content_hash] = row
+        thumbnail_abs = None
+        if inline_thumbnails:
+            thumbnail_abs = os.path.join(config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename_for(unique_filename))
+        staged.append((result, row, filepath_abs, thumbnail_abs))
+
+    # 3. 新しい内容の画像だけをデコード・サムネイル生成する
+    if executor is None and len(staged) >= config.get('UPLOAD_PARALLEL_MIN_FILES', 4):
+        executor = get_upload_executor()
+    size = config['THUMBNAIL_SIZE']
+    futures = [executor.submit(process_upload, src, thumb, size) if executor is not None else None
+               for _, _, src, thumb in staged]
+
+    rows = []
+    new_rows = []
+    failed_hashes = set()
+    for (result, row, src, thumb), future in zip(staged, futures):
+        try:
+            if future is not None:
+                future.result()
+            else:
+                process_upload(src, thumb, size)
+        except Exception as e:
+            current_app.logger.error(f"バルクアップロード中に画像の処理エラー: {row['original_filename']} - {e}")
+            _remove_quietly(src)
+            failed_hashes.add(row['content_hash'])
+            result.error = '画像ファイルとして読み込めませんでした。'
+            continue
+        if thumb:
+            row['thumbnail_filename'] = os.path.basename(thumb)
+            row['thumbnail_filepath'] = os.path.join(
+                config['THUMBNAIL_FOLDER_RELATIVE_PATH'], row['thumbnail_filename']
+            ).replace('\\', '/')
+        rows.append(row)
+        new_rows.append(row)
+        result.image_id = row['id']
+
+    # 派生画像をジョブにしない設定では、ここで生成する (サムネイルと同じくプロセスプールを使う)
+    variant_rows = []
+    batch_variants = {}  # バッチ内で生成した派生画像 {ハッシュ: generate_variants の戻り値}
+    if inline_variants and new_rows:
+        futures = [executor.submit(generate_variants, *variant_task_args(row['unique_filename']))
+                   if executor is not None else None for row in new_rows]
+        for row, future in zip(new_rows, futures):
+            try:
+                if future is not None:
+                    generated = future.result()
+                else:
+                    generated = generate_variants(*variant_task_args(row['unique_filename']))
+            except Exception as e:
+                current_app.logger.error("バルクアップロード中に派生画像の生成エラー: %s - %s", row['original_filename'], e)
+                continue
+            batch_variants[row['content_hash']] = generated
+            variant_rows.extend(dict(data, image_id=row['id']) for data in generated)
+
+    # 4. 重複した画像は元の画像のサムネイル・派生画像を引き継ぐ
+    for result, row, source in duplicates:
+        if isinstance(source, Image):
+            row.update(derivative_fields(source))
+            variant_rows.extend(dict(data, image_id=row['id']) for data in variant_data(source))
+        elif row['content_hash'] in failed_hashes:
+            result.error = '画像ファイルとして読み込めませんでした。'
+            continue
+        else:
+            # 非同期生成の場合は、元の画像のジョブ完了時に同じハッシュの画像へ反映される
+            # (同期生成の場合はバッチ内で生成した派生画像を引き継ぐ)
+            row.update({key: source[key] for key in ('thumbnail_filename', 'thumbnail_filepath', 'thumbnail_status')})
+            variant_rows.extend(dict(data, image_id=row['id'])
+                                for data in batch_variants.get(row['content_hash'], ()))
+        rows.append(row)
+        result.image_id = row['id']
+
+    if rows:
+        db.session.execute(insert(Image), rows)
+        if variant_rows:
+            db.session.execute(insert(ImageVariant), variant_rows)
+        job_kinds = []
+        if async_thumbnails:
+            job_kinds.append(JOB_KIND_THUMBNAIL)
+        if async_derivatives and config.get('IMAGE_VARIANT_WIDTHS'):
+            job_kinds.append(JOB_KIND_VARIANTS)
+        if job_kinds and new_rows:
+            db.session.execute(insert(ImageJob), [
+                {'image_id': row['id'], 'kind': kind, 'status': 'pending', 'attempts': 0}
+                for row in new_rows for kind in job_kinds
+            ])
+        db.session.commit()
+    return results
+
+
+_listeners = (
+    ('after_commit', _remove_released_files),
+    ('after_rollback', _keep_released_files),
+)
+
+
+def init_app(app):
+    """release_image_files() で登録したファイルをコミット後に削除するイベントを登録します。"""
+    for name, listener in _listeners:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -2,17 +2,47 @@
 
 import os
 import uuid
+import hashlib
+import markdown
 from flask import current_app
 from werkzeug.utils import secure_filename
 from PIL import Image as PILImage # PIL.ImageをPILImageとしてインポート
 
+from app.instrumentation import timed_markdown
+
 import logging
 
 logger = logging.getLogger(__name__)
 
 # ヘルパー関数群で使用する定数
 UPLOAD_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
-THUMBNAIL_SIZE = (200, 200)
+
+# 投稿本文の Markdown 変換に使用する拡張機能 (Jinja2 フィルターと HTML キャッシュで共通)
+MARKDOWN_EXTENSIONS = [
+    'fenced_code',
+    'tables',
+    'nl2br',
+    'sane_lists',
+    'codehilite',
+    'extra',
+]
+
+def render_markdown(text):
+    """Markdown テキストを HTML に変換します。"""
+    with timed_markdown():
+        return markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+
+def body_hash(text):
+    """本文の SHA-256 ハッシュ (16進数64文字) を返します。HTMLキャッシュの鮮度判定に使用します。"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """ファイル内容の SHA-256 ハッシュ (16進数64文字) を返します。"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 def allowed_file(filename):
     """許可されたファイル拡張子であるかを確認します。"""
@@ -33,7 +63,7 @@ def create_thumbnail(original_filepath):
         os.makedirs(thumbnail_dir)
         #current_app.logger.debug(f"DEBUG(utils): Thumbnail directory created: {thumbnail_dir}")
     else:
-        current_app.logger.debug(f"DEBUG(utils): Thumbnail directory ensured: {thumbnail_dir}")
+        current_app.logger.debug("DEBUG(utils): Thumbnail directory ensured: %s", thumbnail_dir)
 
     try:
         img = PILImage.open(original_filepath)
@@ -48,7 +78,7 @@ def create_thumbnail(original_filepath):
         full_thumbnail_path = os.path.join(thumbnail_dir, thumb_filename)
         #current_app.logger.debug(f"DEBUG(utils): Full thumbnail path: {full_thumbnail_path}")
 
-        img.thumbnail(THUMBNAIL_SIZE, PILImage.Resampling.LANCZOS)
+        img.thumbnail(current_app.config['THUMBNAIL_SIZE'], PILImage.Resampling.LANCZOS) # サイズは config.THUMBNAIL_SIZE に統一
         
         if img.mode == 'RGBA':
             img = img.convert('RGB') # RGBAモードの画像をPNGで保存する際に変換は不要ですが、念のためRGBに変換
@@ -86,24 +116,28 @@ def save_image_and_thumbnail(image_file, upload_folder, thumbnail_folder, user_i
         logger.warning(f"WARNING(utils): Invalid file provided to save_image_and_thumbnail: {image_file.filename if image_file else 'No file'}")
         return None
 
-    original_filename = secure_filename(image_file.filename)
-    unique_filename_uuid = str(uuid.uuid4())
-    # 拡張子を取得
-    file_extension = os.path.splitext(original_filename)[1]
-    
-    # DBに保存するユニークなファイル名
-    unique_filename = f"{unique_filename_uuid}{file_extension}" 
+    from app.uploads import stream_to_disk, content_addressed_filename
 
-    # ファイルのフルパス
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+    original_filename = secure_filename(image_file.filename)
+    # 内容の SHA-256 が分かるまでは一時ファイル名で保存する
+    temp_filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], f".upload-{uuid.uuid4().hex}.tmp")
+    filepath = None
+    created = False # 同じ内容のファイルが既にある場合は、エラー時にも削除しない
     
     thumbnail_filename = None
     thumbnail_filepath = None
 
     try:
-        # まず元画像を保存
-        image_file.save(filepath)
-        logger.debug(f"画像を保存しました: {filepath}")
+        # まず元画像を保存 (書き込みながらハッシュを計算し、<sha256><拡張子> に配置する)
+        _, content_hash = stream_to_disk(image_file, temp_filepath)
+        unique_filename = content_addressed_filename(content_hash, original_filename)
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+        if os.path.exists(filepath):
+            os.remove(temp_filepath)
+        else:
+            os.replace(temp_filepath, filepath)
+            created = True
+        logger.debug("画像を保存しました: %s", filepath)
 
         # サムネイルを生成するためにcreate_thumbnail関数を呼び出す
         generated_thumbnail_filename = create_thumbnail(filepath)
@@ -114,7 +148,7 @@ def save_image_and_thumbnail(image_file, upload_folder, thumbnail_folder, user_i
         else:
             logger.warning(f"WARNING(utils): Thumbnail could not be generated for {original_filename}. Original file will be deleted.")
             # サムネイル生成に失敗したらオリジナルも削除
-            if os.path.exists(filepath):
+            if created and os.path.exists(filepath):
                 os.remove(filepath)
                 logger.info(f"Cleanup: Deleted original file {filepath} due to thumbnail generation error.")
             return None # サムネイルが作れない場合は全体を失敗とみなす
@@ -122,6 +156,7 @@ def save_image_and_thumbnail(image_file, upload_folder, thumbnail_folder, user_i
         return {
             'original_filename': original_filename,
             'unique_filename': unique_filename,
+            'content_hash': content_hash,
             'filepath': filepath,
             'thumbnail_filename': thumbnail_filename,
             'thumbnail_filepath': thumbnail_filepath, # ここも追加
@@ -131,7 +166,9 @@ def save_image_and_thumbnail(image_file, upload_folder, thumbnail_folder, user_i
     except Exception as e:
         logger.error(f"ERROR(utils): Error in save_image_and_thumbnail for {original_filename}: {e}", exc_info=True)
         # エラーが発生した場合は、保存済みのファイルを削除
-        if os.path.exists(filepath):
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        if created and os.path.exists(filepath):
             os.remove(filepath)
             logger.info(f"Cleanup: Deleted original file {filepath} due to error.")
         if thumbnail_filepath and os.path.exists(thumbnail_filepath):
@@ -0,0 +1,133 @@
+# F:\dev\BrogDev\app\variants.py
+"""
+レスポンシブ画像用の派生画像 (ImageVariant) の生成。
+
+元画像から IMAGE_VARIANT_WIDTHS の各幅に縮小した WebP (Pillow が対応していれば AVIF も) を作成し、
+image_variant テーブルに記録します。テンプレートでは Image.srcset(format) を <picture> の
+<source srcset> に指定することで、ブラウザが表示幅に合った最小の画像を選択します。
+
+既定 (THUMBNAIL_ASYNC = False) ではアップロード時にリクエスト内で生成します (app/thumbnails.py・app/uploads.py)。
+THUMBNAIL_ASYNC = True の場合は `flask init thumbnail-worker` のジョブ (kind='variants') として生成されます。
+"""
+
+import os
+
+from flask import current_app
+from PIL import Image as PilImage, ImageOps
+
+from app.models import ImageVariant
+
+try:  # Pillow 11.3 未満では pillow-avif-plugin を入れると AVIF を保存できる
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pillow_avif = None
+
+JOB_KIND_VARIANTS = 'variants'
+
+MIMETYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+_SAVE_FORMATS = {
+    'avif': 'AVIF',
+    'webp': 'WEBP',
+}
+
+
+def format_supported(fmt):
+    """Pillow がその形式で保存できるかを返します。"""
+    PilImage.init()
+    return _SAVE_FORMATS.get(fmt) in PilImage.SAVE
+
+
+def enabled_formats():
+    """IMAGE_VARIANT_FORMATS のうち、この環境で生成できる形式をリストで返します。"""
+    return [fmt for fmt in current_app.config.get('IMAGE_VARIANT_FORMATS', ()) if format_supported(fmt)]
+
+
+def variant_filename(unique_filename, width, fmt):
+    stem = os.path.splitext(unique_filename)[0]
+    return f"{stem}_{width}w.{fmt}"
+
+
+def ladder_widths(original_width, widths):
+    """
+    元画像の幅に対して生成する幅の一覧を昇順で返します。
+    元画像より大きい幅には拡大せず、最上段は min(元画像の幅, 最大幅) になります。
+    """
+    if not widths:
+        return []
+    top = min(original_width, max(widths))
+    return sorted({w for w in widths if w < top} | {top})
+
+
+def generate_variants(src_path, dest_dir, unique_filename, widths, formats, quality):
+    """
+    src_path の画像から各幅・各形式の派生画像を dest_dir に保存し、記録用の辞書のリストを返します。
+    ワーカープロセスで実行されるため、アプリケーションコンテキストには依存しません。
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    variants = []
+    if not widths or not formats:
+        return variants
+    with PilImage.open(src_path) as source:
+        # JPEG は必要な最大幅を下回らない範囲の縮小スケールでデコードして処理を軽くする
+        source.draft('RGB', (max(widths), max(widths)))
+        img = ImageOps.exif_transpose(source)
+        targets = ladder_widths(img.width, widths)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or img.mode == 'P' else 'RGB')
+
+        # 大きい順に縮小し、前段の結果を次段の元にする
+        for width in reversed(targets):
+            height = max(1, round(img.height * width / img.width))
+            if (width, height) != img.size:
+                img = img.resize((width, height), PilImage.Resampling.LANCZOS)
+            for fmt in formats:
+                filename = variant_filename(unique_filename, width, fmt)
+                path = os.path.join(dest_dir, filename)
+                img.save(path, _SAVE_FORMATS[fmt], quality=quality.get(fmt, 80))
+                variants.append({
+                    'format': fmt,
+                    'width': width,
+                    'height': height,
+                    'filename': filename,
+                    'bytes': os.path.getsize(path),
+                })
+    return variants
+
+
+def variant_task_args(unique_filename):
+    """unique_filename の画像について generate_variants に渡す引数のタプルを返します。"""
+    config = current_app.config
+    return (
+        os.path.join(config['UPLOAD_IMAGES_DIR'], unique_filename),
+        config['UPLOAD_VARIANTS_DIR'],
+        unique_filename,
+        tuple(config.get('IMAGE_VARIANT_WIDTHS', ())),
+        tuple(enabled_formats()),
+        dict(config.get('IMAGE_VARIANT_QUALITY', {})),
+    )
+
+
+def replace_variants(image, generated):
+    """image の派生画像の記録を generated (generate_variants の戻り値) で置き換えます。"""
+    existing = {(v.format, v.width): v for v in image.variants}
+    for data in generated:
+        variant = existing.pop((data['format'], data['width']), None)
+        if variant is None:
+            image.variants.append(ImageVariant(**data))
+        else:
+            for key, value in data.items():
+                setattr(variant, key, value)
+    # 設定変更などで不要になった段を削除する
+    for variant in existing.values():
+        remove_variant_file(variant)
+        image.variants.remove(variant)
+
+
+def remove_variant_file(variant):
+    path = os.path.join(current_app.config['UPLOAD_VARIANTS_DIR'], variant.filename)
+    if os.path.exists(path):
+        os.remove(path)
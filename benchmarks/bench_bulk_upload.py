@@ -0,0 +1,159 @@
+# benchmarks/bench_bulk_upload.py
+"""
+一括アップロード処理 (app/uploads.py の ingest_uploads) の効果を計測するベンチマーク。
+
+合成した JPEG (既定 200 枚) を、以下の方式でそれぞれ登録して所要時間を比較します。
+
+  legacy        : 従来の bulk_upload_images と同じ直列ループ (保存 → Pillow でサムネイル → 1件ずつ add)
+  pipeline      : ingest_uploads (チャンク書き込み + プロセスプールでサムネイル生成 + 一括 INSERT)
+  pipeline-async: ingest_uploads (THUMBNAIL_ASYNC = True。サムネイルはジョブ登録のみ)
+
+使い方:
+    python benchmarks/bench_bulk_upload.py --images 200 --workers 4
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image as PilImage
+from werkzeug.datastructures import FileStorage
+
+import config
+from app import create_app, db
+from app.models import Image, ImageJob, User
+from app.uploads import ingest_uploads, get_upload_executor
+
+
+def make_jpegs(count, size):
+    """ノイズを含む合成 JPEG を count 枚生成し、(ファイル名, バイト列) のリストで返します。"""
+    rng = random.Random(42)
+    jpegs = []
+    for i in range(count):
+        img = PilImage.effect_noise(size, rng.randint(20, 80)).convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=90)
+        jpegs.append((f'photo_{i:04d}.jpg', buffer.getvalue()))
+    return jpegs
+
+
+def as_uploads(jpegs):
+    return [FileStorage(stream=io.BytesIO(data), filename=name, content_type='image/jpeg')
+            for name, data in jpegs]
+
+
+def legacy_upload(files, user_id, app_config):
+    """変更前の bulk_upload_images と同じ処理。"""
+    for image_file in files:
+        original_filename = image_file.filename
+        unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1]
+        filepath_abs = os.path.join(app_config['UPLOAD_IMAGES_DIR'], unique_filename)
+        image_file.save(filepath_abs)
+
+        thumbnail_filename = 'thumb_' + unique_filename
+        thumbnail_filepath_abs = os.path.join(app_config['UPLOAD_THUMBNAILS_DIR'], thumbnail_filename)
+        img_pil = PilImage.open(filepath_abs)
+        img_pil.thumbnail(app_config['THUMBNAIL_SIZE'])
+        img_pil.save(thumbnail_filepath_abs)
+
+        db.session.add(Image(
+            original_filename=original_filename,
+            unique_filename=unique_filename,
+            thumbnail_filename=thumbnail_filename,
+            filepath=os.path.join(app_config['UPLOAD_FOLDER_RELATIVE_PATH'], unique_filename),
+            thumbnail_filepath=os.path.join(app_config['THUMBNAIL_FOLDER_RELATIVE_PATH'], thumbnail_filename),
+            user_id=user_id,
+            alt_text='',
+        ))
+    db.session.commit()
+
+
+def reset(app_config):
+    """前回の計測で作成したファイルと行を削除します。"""
+    for key in ('UPLOAD_IMAGES_DIR', 'UPLOAD_THUMBNAILS_DIR'):
+        shutil.rmtree(app_config[key], ignore_errors=True)
+        os.makedirs(app_config[key])
+    db.session.execute(ImageJob.__table__.delete())
+    db.session.execute(Image.__table__.delete())
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=200, help='アップロードする画像数')
+    parser.add_argument('--width', type=int, default=1600, help='合成画像の幅')
+    parser.add_argument('--height', type=int, default=1200, help='合成画像の高さ')
+    parser.add_argument('--workers', type=int, default=None, help='プロセス数 (既定: CPU コア数)')
+    parser.add_argument('--repeat', type=int, default=3, help='各方式の繰り返し回数 (最短時間を表示)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+
+    class BenchConfig(config.Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        UPLOAD_IMAGES_DIR = os.path.join(workdir, 'images')
+        UPLOAD_THUMBNAILS_DIR = os.path.join(workdir, 'thumbnails')
+        UPLOAD_WORKERS = args.workers
+        DEBUG = False
+
+    app = create_app(BenchConfig)
+    try:
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com')
+            user.set_password('benchmark')
+            db.session.add(user)
+            db.session.commit()
+
+            print(f'{args.images} 枚の JPEG ({args.width}x{args.height}) を生成中...')
+            jpegs = make_jpegs(args.images, (args.width, args.height))
+            total_mb = sum(len(data) for _, data in jpegs) / 1024 / 1024
+            print(f'合計 {total_mb:.1f} MB')
+
+            # プロセスプールの起動時間は計測に含めない
+            get_upload_executor()
+
+            def run_legacy():
+                legacy_upload(as_uploads(jpegs), user.id, app.config)
+
+            def run_pipeline(async_thumbnails):
+                def _run():
+                    app.config['THUMBNAIL_ASYNC'] = async_thumbnails
+                    results = ingest_uploads(as_uploads(jpegs), user.id)
+                    assert all(result.ok for result in results)
+                return _run
+
+            cases = [
+                ('legacy', run_legacy),
+                ('pipeline', run_pipeline(False)),
+                ('pipeline-async', run_pipeline(True)),
+            ]
+            timings = {}
+            for name, func in cases:
+                best = None
+                for _ in range(args.repeat):
+                    reset(app.config)
+                    start = time.perf_counter()
+                    func()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[name] = best
+
+            print()
+            for name, elapsed in timings.items():
+                speedup = timings['legacy'] / elapsed if elapsed else float('inf')
+                print(f'{name:15s} {elapsed * 1000:10.1f} ms   x{speedup:5.2f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# benchmarks/bench_listing_indexes.py
+"""
+公開一覧クエリ用の複合インデックスの効果を計測するベンチマーク。
+
+一時的な SQLite データベースに投稿 (既定 100,000 件)・コメント・画像・タグを投入し、
+インデックスなし / ありの状態で各クエリの実行計画 (EXPLAIN QUERY PLAN) と
+平均レイテンシを表示します。
+
+使い方:
+    python benchmarks/bench_listing_indexes.py --posts 100000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+
+import config
+from app import create_app, db
+from app.models import Post, Comment, Image, Tag, Category, User, post_tags
+
+# ベンチマーク対象のインデックス (models.py / migrations の定義と一致させる)
+INDEX_NAMES = [
+    'ix_post_is_published_created_at',
+    'ix_post_category_id_is_published_created_at',
+    'ix_comment_post_id_is_approved_created_at',
+    'ix_image_user_id_uploaded_at',
+    'ix_post_tags_tag_id',
+]
+
+
+def seed(num_posts, num_categories=20, num_tags=50, batch=5000):
+    """ベンチマーク用のデータを一括投入し、計測に使う ID を返します。"""
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.flush()
+
+    categories = [Category(name=f'cat{i}', slug=f'cat{i}', user_id=user.id) for i in range(num_categories)]
+    tags = [Tag(name=f'tag{i}', slug=f'tag{i}', user_id=user.id) for i in range(num_tags)]
+    db.session.add_all(categories + tags)
+    db.session.commit()
+
+    rng = random.Random(42)
+    base = datetime(2020, 1, 1)
+    post_ids = []
+    for start in range(0, num_posts, batch):
+        posts, links, comments, images = [], [], [], []
+        for i in range(start, min(start + batch, num_posts)):
+            post_id = uuid.uuid4()
+            post_ids.append(post_id)
+            created = base + timedelta(minutes=i)
+            posts.append({
+                'id': post_id, 'title': f'Post {i}', 'body': 'lorem ipsum ' * 20,
+                'created_at': created, 'updated_at': created,
+                'is_published': rng.random() < 0.8, 'user_id': user.id,
+                'category_id': rng.choice(categories).id,
+            })
+            for tag in rng.sample(tags, 3):
+                links.append({'post_id': post_id, 'tag_id': tag.id})
+            for c in range(2):
+                comments.append({
+                    'id': uuid.uuid4(), 'body': 'comment', 'author_name': 'bench',
+                    'timestamp': created, 'created_at': created + timedelta(seconds=c),
+                    'updated_at': created, 'is_approved': c == 0,
+                    'user_id': user.id, 'post_id': post_id,
+                })
+            if i % 10 == 0:
+                images.append({
+                    'id': uuid.uuid4(), 'original_filename': f'{i}.jpg',
+                    'unique_filename': f'{uuid.uuid4()}.jpg', 'filepath': 'uploads/images/x.jpg',
+                    'uploaded_at': created, 'user_id': user.id,
+                })
+        db.session.execute(Post.__table__.insert(), posts)
+        db.session.execute(post_tags.insert(), links)
+        db.session.execute(Comment.__table__.insert(), comments)
+        if images:
+            db.session.execute(Image.__table__.insert(), images)
+        db.session.commit()
+
+    return {
+        'user_id': user.id,
+        'category_id': categories[0].id,
+        'tag_id': tags[0].id,
+        'post_id': post_ids[len(post_ids) // 2],
+    }
+
+
+def build_queries(ids, per_page=10, deep_page=500):
+    """各ビューと同等のクエリを (名前, Query) のリストで返します。"""
+    published = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc())
+    return [
+        ('home.index (page 1)', published.limit(per_page)),
+        (f'home.index (page {deep_page})', published.limit(per_page).offset(per_page * (deep_page - 1))),
+        ('home.index COUNT(*)', Post.query.filter_by(is_published=True)),
+        ('home.posts_by_category', Post.query.filter_by(category_id=ids['category_id'], is_published=True)
+            .order_by(Post.created_at.desc()).limit(per_page)),
+        ('home.posts_by_tag', Post.query.join(post_tags).filter(post_tags.c.tag_id == ids['tag_id'],
+            Post.is_published == True).order_by(Post.created_at.desc()).limit(per_page)),
+        ('post_detail comments', Comment.query.filter_by(post_id=ids['post_id'], is_approved=True)
+            .order_by(Comment.created_at.desc())),
+        ('admin images by user', Image.query.filter_by(user_id=ids['user_id'])
+            .order_by(Image.uploaded_at.desc()).limit(per_page)),
+    ]
+
+
+def explain(query):
+    """クエリの EXPLAIN QUERY PLAN を文字列のリストで返します。"""
+    compiled = query.statement.compile(db.engine)
+    # UUIDType は SQLite では16バイトの BLOB として保存されるため、DBAPI に渡す前に変換する
+    params = tuple(
+        value.bytes if isinstance(value, uuid.UUID) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def run(ids, repeat):
+    results = {}
+    for name, query in build_queries(ids):
+        is_count = name.endswith('COUNT(*)')
+        start = time.perf_counter()
+        for _ in range(repeat):
+            if is_count:
+                query.count()
+            else:
+                query.all()
+            db.session.expunge_all()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        results[name] = (elapsed_ms, explain(query) if not is_count else [])
+    return results
+
+
+def drop_indexes():
+    for name in INDEX_NAMES:
+        db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    db.session.commit()
+
+
+def create_indexes():
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name in INDEX_NAMES:
+                index.create(db.engine, checkfirst=True)
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=100000, help='投入する投稿数')
+    parser.add_argument('--repeat', type=int, default=20, help='各クエリの繰り返し回数')
+    parser.add_argument('--keep', action='store_true', help='終了後も一時データベースを残す')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_indexes_')
+
+    class BenchConfig(config.Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        DEBUG = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        drop_indexes()
+        print(f'{args.posts} 件の投稿を投入中...')
+        ids = seed(args.posts)
+
+        before = run(ids, args.repeat)
+        create_indexes()
+        after = run(ids, args.repeat)
+
+        for name in before:
+            print(f'\n=== {name} ===')
+            print(f'  before: {before[name][0]:8.2f} ms   after: {after[name][0]:8.2f} ms')
+            for label, (_, plan) in (('before', before[name]), ('after', after[name])):
+                for line in plan:
+                    print(f'    [{label}] {line}')
+
+    if args.keep:
+        print(f'\nデータベース: {os.path.join(workdir, "bench.db")}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_sqlite_profile.py
+"""
+SQLite のエンジン設定 (app/db_engine.py の SQLITE_ENGINE_PROFILE) の効果を計測するベンチマーク。
+
+一時的な SQLite データベースに投稿 (既定 5,000 件) を投入し、
+複数の読み取りスレッド (公開一覧の1ページ目と投稿詳細のコメントを読み込む) と
+1つの書き込みスレッド (コメントを1件ずつ追加してコミット) を同時に一定時間動かして、
+プロファイルごとの読み取り・書き込みのスループットと、ロック待ちによるエラーの件数を表示します。
+
+journal_mode はデータベースファイルに保存されるため、プロファイルごとに新しいデータベースを作成します。
+
+使い方:
+    python benchmarks/bench_sqlite_profile.py --readers 16 --seconds 10
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import config
+from app import create_app, db
+from app.models import Comment, Post, User
+
+PROFILES = ('default', 'production')
+
+
+def seed(num_posts, batch=5000):
+    """ベンチマーク用の投稿とコメントを一括投入し、(利用者 ID, 投稿 ID のリスト) を返します。"""
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+
+    base = datetime(2020, 1, 1)
+    post_ids = []
+    for start in range(0, num_posts, batch):
+        posts, comments = [], []
+        for i in range(start, min(start + batch, num_posts)):
+            post_id = uuid.uuid4()
+            post_ids.append(post_id)
+            created = base + timedelta(minutes=i)
+            posts.append({
+                'id': post_id, 'title': f'Post {i}', 'body': 'lorem ipsum ' * 50,
+                'created_at': created, 'updated_at': created, 'is_published': True, 'user_id': user.id,
+            })
+            for c in range(3):
+                comments.append({
+                    'id': uuid.uuid4(), 'body': 'comment', 'author_name': 'bench',
+                    'timestamp': created, 'created_at': created + timedelta(seconds=c),
+                    'updated_at': created, 'is_approved': True, 'user_id': user.id, 'post_id': post_id,
+                })
+        db.session.execute(Post.__table__.insert(), posts)
+        db.session.execute(Comment.__table__.insert(), comments)
+        db.session.commit()
+    return user.id, post_ids
+
+
+def reader(app, post_ids, stop, counts, seed_value):
+    rng = random.Random(seed_value)
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                Post.query.filter_by(is_published=True).order_by(Post.created_at.desc()).limit(10).all()
+                (Comment.query.filter_by(post_id=rng.choice(post_ids), is_approved=True)
+                 .order_by(Comment.created_at.desc()).all())
+                counts['reads'] += 1
+            except OperationalError:
+                counts['read_errors'] += 1
+            finally:
+                db.session.remove()
+
+
+def writer(app, user_id, post_ids, stop, counts):
+    rng = random.Random(0)
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                db.session.add(Comment(body='new comment', author_name='writer', user_id=user_id,
+                                       post_id=rng.choice(post_ids), is_approved=True))
+                db.session.commit()
+                counts['writes'] += 1
+            except OperationalError:
+                db.session.rollback()
+                counts['write_errors'] += 1
+            finally:
+                db.session.remove()
+
+
+def run_profile(profile, args, workdir):
+    class BenchConfig(config.Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, f'bench_{profile}.db')
+        SQLITE_ENGINE_PROFILE = profile
+        SQLITE_POOL = {'pool_size': args.readers + 1}
+        PAGE_CACHE_BACKEND = None
+        DEBUG = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user_id, post_ids = seed(args.posts)
+        journal_mode = db.session.execute(text('PRAGMA journal_mode')).scalar()
+        db.session.remove()
+
+    stop = threading.Event()
+    reader_counts = [{'reads': 0, 'read_errors': 0} for _ in range(args.readers)]
+    writer_counts = {'writes': 0, 'write_errors': 0}
+    threads = [threading.Thread(target=reader, args=(app, post_ids, stop, counts, i))
+               for i, counts in enumerate(reader_counts)]
+    threads.append(threading.Thread(target=writer, args=(app, user_id, post_ids, stop, writer_counts)))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        db.engine.dispose()
+    return {
+        'journal_mode': journal_mode,
+        'reads': sum(counts['reads'] for counts in reader_counts) / args.seconds,
+        'read_errors': sum(counts['read_errors'] for counts in reader_counts),
+        'writes': writer_counts['writes'] / args.seconds,
+        'write_errors': writer_counts['write_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=5000, help='投入する投稿数')
+    parser.add_argument('--readers', type=int, default=16, help='読み取りスレッドの数')
+    parser.add_argument('--seconds', type=float, default=10, help='各プロファイルの計測時間 (秒)')
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=PROFILES)
+    parser.add_argument('--keep', action='store_true', help='終了後も一時データベースを残す')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_sqlite_')
+    results = {}
+    for profile in args.profiles:
+        print(f'{profile}: {args.posts} 件の投稿を投入し、{args.readers} 読み取り + 1 書き込みスレッドで {args.seconds} 秒計測中...')
+        results[profile] = run_profile(profile, args, workdir)
+
+    print(f'\n{"profile":<12}{"journal":>9}{"reads/s":>12}{"writes/s":>12}{"read err":>10}{"write err":>10}')
+    for profile, result in results.items():
+        print(f'{profile:<12}{result["journal_mode"]:>9}{result["reads"]:>12.1f}{result["writes"]:>12.1f}'
+              f'{result["read_errors"]:>10}{result["write_errors"]:>10}')
+
+    if args.keep:
+        print(f'\nデータベース: {workdir}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Key post_search rows by an integer rowid from post_search_map
+
+Revision ID: 0c6f3b9d2e17
+Revises: 5a9c2e7f1b38
+Create Date: 2026-10-19 10:12:05.384512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c6f3b9d2e17'
+down_revision = '5a9c2e7f1b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # post_search の post_id は UNINDEXED のため、投稿ごとの rowid を post_search_map に割り当てて作り直す (SQLite のみ)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("CREATE TABLE IF NOT EXISTS post_search_map (id INTEGER PRIMARY KEY, post_id BLOB NOT NULL UNIQUE)")
+    op.execute("DELETE FROM post_search_map")
+    op.execute("INSERT INTO post_search_map (post_id) SELECT id FROM post")
+    op.execute("DROP TABLE IF EXISTS post_search")
+    op.execute(
+        "CREATE VIRTUAL TABLE post_search "
+        "USING fts5(post_id UNINDEXED, title, body, tokenize='trigram')"
+    )
+    op.execute(
+        "INSERT INTO post_search (rowid, post_id, title, body) "
+        "SELECT m.id, p.id, p.title, p.body FROM post_search_map m JOIN post p ON p.id = m.post_id"
+    )
+
+
+def downgrade():
+    # post_search の行はそのまま使える (以前の版は post_id で削除する)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS post_search_map")
@@ -0,0 +1,116 @@
+"""Store UUID columns as 16-byte binary and index join table reverse lookups
+
+Revision ID: 5a9c2e7f1b38
+Revises: 7d2e9a4c1f63
+Create Date: 2026-10-18 22:31:40.157206
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9c2e7f1b38'
+down_revision = '7d2e9a4c1f63'
+branch_labels = None
+depends_on = None
+
+# UUID を保存する列 (テーブル名: 列名のリスト)
+UUID_COLUMNS = {
+    'user': ['id'],
+    'roles_users': ['user_id'],
+    'category': ['id', 'user_id'],
+    'tag': ['id', 'user_id'],
+    'image': ['id', 'user_id', 'post_id'],
+    'image_variant': ['image_id'],
+    'image_job': ['image_id'],
+    'post': ['id', 'user_id', 'category_id', 'main_image_id'],
+    'post_tags': ['post_id', 'tag_id'],
+    'post_additional_images': ['post_id', 'image_id'],
+    'comment': ['id', 'user_id', 'post_id'],
+    'related_post': ['post_id', 'related_post_id'],
+    'related_post_state': ['post_id'],
+}
+
+# 全文検索の仮想テーブル (SQLite のみ。post.id と同じ形式で post_id を保存する)
+FTS_TABLE = 'post_search'
+
+
+def _uuid_to_bytes(value):
+    return uuid.UUID(value).bytes if isinstance(value, str) else value
+
+
+def _recreate_columns(table, columns, type_):
+    """
+    SQLite のテーブルを作り直して列の宣言型を type_ にします。
+    alter_column は CAST (BINARY(16) は NUMERIC 型親和性) で値を壊すため、reflect_args で型だけ差し替えて
+    値はそのままコピーします (差し替えた列の主キー・NOT NULL・外部キーは反映し直す)。
+    """
+    inspector = sa.inspect(op.get_bind())
+    reflected = {column['name']: column for column in inspector.get_columns(table)}
+    primary_key = set(inspector.get_pk_constraint(table)['constrained_columns'])
+    foreign_keys = {fk['constrained_columns'][0]: fk for fk in inspector.get_foreign_keys(table)
+                    if len(fk['constrained_columns']) == 1}
+    reflect_args = []
+    for name in columns:
+        args = []
+        if name in foreign_keys:
+            fk = foreign_keys[name]
+            args.append(sa.ForeignKey(f"{fk['referred_table']}.{fk['referred_columns'][0]}",
+                                      ondelete=fk.get('options', {}).get('ondelete')))
+        reflect_args.append(sa.Column(name, type_, *args, nullable=reflected[name]['nullable'],
+                                      primary_key=name in primary_key))
+    with op.batch_alter_table(table, schema=None, recreate='always', reflect_args=reflect_args):
+        pass
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _existing_tables():
+    # roles_users はマイグレーションではなく db.create_all() で作成された環境があるため、存在するものだけを対象にする
+    return [(table, columns) for table, columns in UUID_COLUMNS.items() if _has_table(table)]
+
+
+def upgrade():
+    bind = op.get_bind()
+    # PostgreSQL では UUIDType が元からネイティブの uuid 型のため、値の変換は SQLite だけで行う
+    if bind.dialect.name == 'sqlite':
+        bind.connection.driver_connection.create_function('uuid_to_bytes', 1, _uuid_to_bytes, deterministic=True)
+        for table, columns in _existing_tables():
+            _recreate_columns(table, columns, sqlalchemy_utils.types.uuid.UUIDType(binary=True))
+            for column in columns:
+                op.execute(f'UPDATE "{table}" SET "{column}" = uuid_to_bytes("{column}") '
+                           f'WHERE typeof("{column}") = \'text\'')
+        if _has_table(FTS_TABLE):
+            op.execute(f"UPDATE {FTS_TABLE} SET post_id = uuid_to_bytes(post_id) WHERE typeof(post_id) = 'text'")
+
+    with op.batch_alter_table('post_additional_images', schema=None) as batch_op:
+        batch_op.create_index('ix_post_additional_images_image_id', ['image_id'], unique=False)
+
+    if _has_table('roles_users'):
+        with op.batch_alter_table('roles_users', schema=None) as batch_op:
+            batch_op.create_index('ix_roles_users_role_id', ['role_id'], unique=False)
+
+
+def downgrade():
+    if _has_table('roles_users'):
+        with op.batch_alter_table('roles_users', schema=None) as batch_op:
+            batch_op.drop_index('ix_roles_users_role_id')
+
+    with op.batch_alter_table('post_additional_images', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_additional_images_image_id')
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for table, columns in _existing_tables():
+            for column in columns:
+                op.execute(f'UPDATE "{table}" SET "{column}" = lower(hex("{column}")) '
+                           f'WHERE typeof("{column}") = \'blob\'')
+            _recreate_columns(table, columns, sqlalchemy_utils.types.uuid.UUIDType(binary=False))
+        if _has_table(FTS_TABLE):
+            op.execute(f"UPDATE {FTS_TABLE} SET post_id = lower(hex(post_id)) WHERE typeof(post_id) = 'blob'")
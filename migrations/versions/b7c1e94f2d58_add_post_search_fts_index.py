@@ -0,0 +1,33 @@
+"""Add post_search FTS5 virtual table
+
+Revision ID: b7c1e94f2d58
+Revises: 8a3e5b0d6c12
+Create Date: 2026-10-18 13:40:12.771093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c1e94f2d58'
+down_revision = '8a3e5b0d6c12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 の仮想テーブルは Alembic の autogenerate 対象外のため手書き (SQLite のみ)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS post_search "
+        "USING fts5(post_id UNINDEXED, title, body, tokenize='trigram')"
+    )
+    op.execute("INSERT INTO post_search (post_id, title, body) SELECT id, title, body FROM post")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS post_search")
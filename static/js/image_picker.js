@@ -0,0 +1,130 @@
+// F:\dev\BrogDev\static\js\image_picker.js
+// 投稿フォームの画像ギャラリー (モーダル) 用の画像ピッカー。
+// 画像を全件埋め込まず、モーダルを開いた時に /admin/uploads/images/json から1ページずつ読み込みます。
+// ファイル名での検索と「さらに読み込む」に対応します。カードを選んだ時の処理は各テンプレート側で行います。
+function initImagePicker(options) {
+    const modalElement = options.modal;
+    const grid = options.grid;
+    const spinner = options.spinner;
+    const searchInput = options.searchInput;
+    const moreButton = options.moreButton;
+
+    let nextPage = 1;
+    let query = '';
+    let loading = false;
+    let requestId = 0;
+    let loadedOnce = false;
+    let searchTimer = null;
+
+    function createCard(image) {
+        const thumbnailUrl = image.thumbnail_url || image.url;
+        const filename = image.original_filename || image.unique_filename;
+
+        const col = document.createElement('div');
+        col.classList.add('col');
+        const card = document.createElement('div');
+        card.className = 'card h-100 image-card cursor-pointer';
+        card.dataset.imageId = image.id;
+        card.dataset.imageUrl = image.url;
+        card.dataset.thumbnailUrl = thumbnailUrl;
+        card.dataset.filename = filename;
+
+        const img = document.createElement('img');
+        img.src = thumbnailUrl;
+        img.className = 'card-img-top img-fluid rounded';
+        img.alt = filename;
+        img.loading = 'lazy';
+
+        const body = document.createElement('div');
+        body.className = 'card-body p-2';
+        const text = document.createElement('p');
+        text.className = 'card-text text-truncate small';
+        text.textContent = filename;
+
+        body.appendChild(text);
+        card.appendChild(img);
+        card.appendChild(body);
+        col.appendChild(card);
+        return col;
+    }
+
+    function showMessage(message, className) {
+        const p = document.createElement('p');
+        p.className = `${className} text-center col-12`;
+        p.textContent = message;
+        grid.appendChild(p);
+    }
+
+    function load(reset) {
+        // 検索語が変わった場合は読み込み中でも最初から読み直し、古い応答は捨てる
+        if (loading && !reset) {
+            return;
+        }
+        const current = ++requestId;
+        if (reset) {
+            nextPage = 1;
+            grid.innerHTML = '';
+        }
+        loading = true;
+        spinner.style.display = 'block';
+        moreButton.style.display = 'none';
+
+        const params = new URLSearchParams({page: nextPage});
+        if (query) {
+            params.set('q', query);
+        }
+        fetch(`${options.url}?${params}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('画像のロードに失敗しました。');
+                }
+                return response.json();
+            })
+            .then(data => {
+                if (current !== requestId) {
+                    return;
+                }
+                data.images.forEach(image => grid.appendChild(createCard(image)));
+                if (nextPage === 1 && data.images.length === 0) {
+                    showMessage(query ? '一致する画像がありません。' : '利用可能な画像がありません。', 'text-muted');
+                }
+                nextPage = data.next_page;
+                moreButton.style.display = data.has_next ? 'inline-block' : 'none';
+                loadedOnce = true;
+            })
+            .catch(error => {
+                if (current !== requestId) {
+                    return;
+                }
+                showMessage(`エラー: ${error.message}`, 'text-danger');
+                console.error('Error loading images:', error);
+            })
+            .finally(() => {
+                if (current !== requestId) {
+                    return;
+                }
+                loading = false;
+                spinner.style.display = 'none';
+            });
+    }
+
+    // モーダルを初めて開いた時に1ページ目を読み込む
+    modalElement.addEventListener('show.bs.modal', function () {
+        if (!loadedOnce) {
+            load(true);
+        }
+    });
+
+    moreButton.addEventListener('click', function () {
+        load(false);
+    });
+
+    // 入力が止まってから検索する
+    searchInput.addEventListener('input', function () {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            query = searchInput.value.trim();
+            load(true);
+        }, 300);
+    });
+}
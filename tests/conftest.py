@@ -7,19 +7,25 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import create_app, db # 元々ある行
-from app.models import User, Post, Category, Tag # 必要に応じてインポート
+from app.models import User, Post, Category, Tag, Role # 必要に応じてインポート
 
 import pytest
+import config
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+class TestConfig(config.Config):
+    """テスト用設定 (エンジン生成前に URI を差し替えるため create_app に渡す)"""
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:" # メモリ上のDBを使用
+    WTF_CSRF_ENABLED = False # テスト中はCSRFを無効にすることが多い
+    PAGE_CACHE_BACKEND = None # ページキャッシュは test_page_cache.py で個別に有効にする
 
 @pytest.fixture(scope='session')
 def app():
     """テスト用Flaskアプリケーションのインスタンスを生成するフィクスチャ"""
-    app = create_app() # あなたのcreate_app関数を呼び出す
-    app.config.update({
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", # メモリ上のDBを使用
-        "WTF_CSRF_ENABLED": False # テスト中はCSRFを無効にすることが多い
-    })
+    app = create_app(TestConfig) # あなたのcreate_app関数を呼び出す
     with app.app_context():
         db.create_all() # Create tables once for the session
     yield app
@@ -94,4 +100,62 @@ def logged_in_client(client, app, new_user_data, session): # Added session
         'password': new_user_data['password']
     }, follow_redirects=True)
 
-    yield client
\ No newline at end of file
+    yield client
+
+@pytest.fixture(scope='function')
+def author(app):
+    """投稿者ユーザーを作成し、テスト終了後に全テーブルのデータを削除するフィクスチャ"""
+    with app.app_context():
+        user = User(username='author', email='author@example.com')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        yield user
+        db.session.rollback()
+        for table in db.metadata.tables.values(): # SQLite は外部キー制約を強制しないため順不同で可
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture(scope='function')
+def admin_client(client, author):
+    """管理者ロールを付与した author でログインしたテストクライアントを生成するフィクスチャ"""
+    author.roles.append(Role(name='admin'))
+    db.session.commit()
+    with client.session_transaction() as sess:
+        # ログイン時に Flask-Login / Flask-Principal がセッションへ保存する値
+        sess['_user_id'] = author.fs_uniquifier
+        sess['_fresh'] = True
+        sess['identity.id'] = author.fs_uniquifier
+        sess['identity.auth_type'] = None
+    return client
+
+
+@pytest.fixture(scope='function')
+def assert_max_queries(app):
+    """
+    ブロック内で発行された SQL 文の数が上限を超えたら失敗させるフィクスチャ (N+1 検出用)
+
+    使い方:
+        with assert_max_queries(5):
+            client.get('/')
+    """
+    @contextmanager
+    def _assert_max_queries(budget):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        assert len(statements) <= budget, (
+            f"{len(statements)} queries executed (budget {budget}):\n" + "\n".join(statements)
+        )
+
+    return _assert_max_queries
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# tests/test_admin_listing.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Comment, Post, User
+
+
+@pytest.fixture
+def posts(author):
+    """公開・下書きを交互に作成日をずらして5件ずつ作成するフィクスチャ"""
+    start = datetime(2025, 1, 1)
+    posts = [Post(title=f'投稿{i:02d}', body='本文', posted_by=author, is_published=i % 2 == 0,
+                  created_at=start + timedelta(days=i)) for i in range(10)]
+    db.session.add_all(posts)
+    db.session.commit()
+    return posts
+
+
+def test_list_posts_paginates_and_keeps_filters(admin_client, posts):
+    """?per_page= でページ分割し、ページ送りのリンクが絞り込み条件を引き継ぐかテスト"""
+    response = admin_client.get('/admin/posts?per_page=3&status=published')
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert '5 件中 1〜3 件を表示' in html
+    assert '投稿08' in html and '投稿06' in html and '投稿04' in html
+    assert '投稿02' not in html and '投稿09' not in html
+    assert 'href="/admin/posts?status=published&amp;per_page=3&amp;page=2"' in html
+
+    html = admin_client.get('/admin/posts?per_page=3&status=published&page=2').get_data(as_text=True)
+    assert '投稿02' in html and '投稿00' in html and '投稿04' not in html
+
+
+def test_list_posts_sorts_and_filters_by_author_and_date(admin_client, posts, author):
+    """並び順・作成者・期間 (終了日を含む) で絞り込めるかテスト"""
+    html = admin_client.get('/admin/posts?sort=title').get_data(as_text=True)
+    assert html.index('投稿00') < html.index('投稿09')
+
+    html = admin_client.get('/admin/posts?date_from=2025-01-03&date_to=2025-01-04').get_data(as_text=True)
+    assert '2 件中' in html and '投稿02' in html and '投稿03' in html
+
+    assert '10 件中' in admin_client.get(f'/admin/posts?author={author.username}').get_data(as_text=True)
+    html = admin_client.get('/admin/posts?author=nobody').get_data(as_text=True)
+    assert '条件に一致する投稿はありません。' in html
+
+    # 不正な値は無視して既定の並び順・絞り込みなしで表示する
+    html = admin_client.get('/admin/posts?sort=password_hash&status=bogus&date_from=x').get_data(as_text=True)
+    assert '10 件中' in html
+    assert html.index('投稿09') < html.index('投稿00')
+
+
+def test_list_comments_filters_by_status(admin_client, posts, author):
+    """コメント一覧を承認状態で絞り込み、ページ分割するかテスト"""
+    db.session.add_all([Comment(body=f'コメント{i}', author_name='author', user_id=author.id,
+                                post_id=posts[0].id, is_approved=i < 3) for i in range(5)])
+    db.session.commit()
+
+    html = admin_client.get('/admin/comments?status=pending').get_data(as_text=True)
+    assert '2 件中' in html
+    assert 'コメント3' in html and 'コメント0' not in html
+
+    html = admin_client.get('/admin/comments?per_page=2').get_data(as_text=True)
+    assert '5 件中 1〜2 件を表示' in html
+
+
+def test_list_users_uses_constant_queries(admin_client, author, assert_max_queries):
+    """ユーザー一覧のクエリ数が件数に比例しないかテスト (ロールはまとめて読み込む)"""
+    for i in range(5):
+        user = User(username=f'user{i}', email=f'user{i}@example.com')
+        user.set_password('password123')
+        db.session.add(user)
+    db.session.commit()
+    admin_client.get('/admin/users')
+
+    with assert_max_queries(8):
+        response = admin_client.get('/admin/users?sort=-created_at')
+    assert response.status_code == 200
+    assert '6 件中' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('path', ['/admin/categories', '/admin/tags', '/admin/images'])
+def test_other_listings_render(admin_client, path):
+    """カテゴリ・タグ・画像の一覧も絞り込みフォーム付きで表示されるかテスト"""
+    response = admin_client.get(f'{path}?sort=-created_at&date_from=2025-01-01&per_page=1000')
+    assert response.status_code == 200
+    assert '0 件中' in response.get_data(as_text=True)
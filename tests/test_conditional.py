@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# tests/test_conditional.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Post, Comment, Category, Image, ImageVariant, RelatedPost, Tag
+
+
+@pytest.fixture
+def post(author):
+    category = Category(name='日記', slug='diary', user_id=author.id)
+    post = Post(title='条件付きGET', body='本文', posted_by=author, is_published=True, category=category,
+                updated_at=datetime(2025, 1, 1, 12, 0, 0))
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_post_detail_returns_304_without_rendering(client, post, assert_max_queries):
+    """ETag が一致すれば描画せずに 304 を返し、クエリは検証用の1件だけかテスト"""
+    first = client.get(f'/post/{post.id}')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"')
+    assert 'Last-Modified' not in first.headers
+    assert 'no-cache' in first.headers['Cache-Control']
+    assert 'Cookie' in first.headers['Vary']
+
+    with assert_max_queries(1):
+        second = client.get(f'/post/{post.id}', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+    # 検証用の値の最大日時は過去に戻ることがあるため、If-Modified-Since だけでは 304 を返さない
+    by_date = client.get(f'/post/{post.id}', headers={'If-Modified-Since': 'Wed, 01 Jan 2025 12:00:00 GMT'})
+    assert by_date.status_code == 200
+
+
+def test_post_detail_etag_changes_with_post_and_comments(client, post):
+    """投稿の更新や承認済みコメントの追加で ETag が変わるかテスト"""
+    etag = client.get(f'/post/{post.id}').headers['ETag']
+
+    db.session.add(Comment(body='こんにちは', author_name='author', user_id=post.user_id,
+                           post_id=post.id, is_approved=True))
+    db.session.commit()
+    response = client.get(f'/post/{post.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    etag = response.headers['ETag']
+
+    post.updated_at = post.updated_at + timedelta(minutes=5)
+    db.session.commit()
+    assert client.get(f'/post/{post.id}', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_post_detail_etag_tracks_main_image_and_related_posts(client, post, author):
+    """メイン画像のサムネイル生成・派生画像の追加や関連先の投稿の更新で ETag が変わるかテスト"""
+    image = Image(original_filename='a.jpg', unique_filename='a.jpg', filepath='uploads/images/a.jpg',
+                  user_id=author.id, thumbnail_status='pending')
+    other = Post(title='関連記事', body='本文', posted_by=author, is_published=True)
+    post.main_image = image
+    db.session.add_all([image, other])
+    db.session.flush()
+    db.session.add(RelatedPost(post_id=post.id, related_post_id=other.id, rank=1, score=1.0))
+    db.session.commit()
+    url = f'/post/{post.id}'
+
+    def changed(etag):
+        response = client.get(url, headers={'If-None-Match': etag})
+        return response.status_code == 200, response.headers['ETag']
+
+    etag = client.get(url).headers['ETag']
+    image.thumbnail_status = 'ready'
+    db.session.commit()
+    is_changed, etag = changed(etag)
+    assert is_changed
+
+    db.session.add(ImageVariant(image_id=image.id, format='webp', width=480, height=360, filename='a-480.webp'))
+    db.session.commit()
+    is_changed, etag = changed(etag)
+    assert is_changed
+
+    other.title = '関連記事 (改題)'
+    db.session.commit()
+    is_changed, etag = changed(etag)
+    assert is_changed
+    assert changed(etag) == (False, etag)
+
+
+def test_listing_etag_tracks_listed_posts(client, post, author):
+    """一覧の ETag が投稿の追加・ページ番号で変わり、カテゴリ一覧でも 304 を返すかテスト"""
+    etag = client.get('/').headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/?page=2', headers={'If-None-Match': etag}).status_code == 200
+
+    db.session.add(Post(title='新しい投稿', body='本文', posted_by=author, is_published=True,
+                        updated_at=datetime(2024, 1, 1)))
+    db.session.commit()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+    url = f'/category/{post.category_id}'
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_listing_etag_changes_when_newest_post_is_removed(client, post, author):
+    """最新の投稿を削除すると updated_at の最大値が過去に戻っても ETag が変わり、Last-Modified は付けないかテスト"""
+    newest = Post(title='削除する投稿', body='本文', posted_by=author, is_published=True, updated_at=datetime(2025, 6, 1))
+    db.session.add(newest)
+    db.session.commit()
+    first = client.get('/')
+    assert 'Last-Modified' not in first.headers
+
+    db.session.delete(newest)
+    db.session.commit()
+    response = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert '削除する投稿' not in response.get_data(as_text=True)
+
+
+def test_listing_etag_tracks_thumbnails(client, post, author):
+    """一覧のカードのサムネイルが生成されると (投稿が更新されなくても) ETag が変わるかテスト"""
+    image = Image(original_filename='b.jpg', unique_filename='b.jpg', filepath='uploads/images/b.jpg',
+                  user_id=author.id, thumbnail_status='pending')
+    post.main_image = image
+    db.session.add(image)
+    db.session.commit()
+    etag = client.get('/').headers['ETag']
+
+    image.thumbnail_status = 'ready'
+    db.session.commit()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_missing_post_is_still_404(client, author):
+    """存在しない投稿では検証を行わずビューが 404 を返すかテスト"""
+    response = client.get('/post/00000000-0000-0000-0000-000000000000', headers={'If-None-Match': '*'})
+    assert response.status_code == 404
+
+
+def test_etags_track_tag_category_and_author_names(client, post, author):
+    """タグ・カテゴリ・投稿者の名前の変更で (投稿を更新しなくても) 詳細と一覧の ETag が変わるかテスト"""
+    tag = Tag(name='旅行', slug='travel', user_id=author.id)
+    post.tags.append(tag)
+    db.session.commit()
+    urls = (f'/post/{post.id}', '/')
+
+    def etags():
+        return [client.get(url).headers['ETag'] for url in urls]
+
+    before = etags()
+    tag.name = '旅'
+    db.session.commit()
+    after = etags()
+    assert all(old != new for old, new in zip(before, after))
+
+    post.category.name = '日々'
+    db.session.commit()
+    before, after = after, etags()
+    assert all(old != new for old, new in zip(before, after))
+
+    author.username = 'renamed_author'
+    db.session.commit()
+    response = client.get(urls[0], headers={'If-None-Match': after[0]})
+    assert response.status_code == 200
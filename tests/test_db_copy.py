@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# tests/test_db_copy.py
+from sqlalchemy import create_engine, text
+
+from app import db
+from app.models import Category, Image, Post, Tag
+
+
+def test_uuids_are_stored_as_16_byte_blobs(app, author):
+    """SQLite では UUID の列と検索索引の post_id が16バイトの BLOB で保存されるかテスト"""
+    db.session.add(Post(title='保存形式', body='本文', posted_by=author, is_published=True))
+    db.session.commit()
+    for column, table in (('id', 'post'), ('user_id', 'post'), ('post_id', 'post_search')):
+        sql = f"SELECT typeof({column}), length({column}) FROM {table} WHERE title = '保存形式'"
+        assert db.session.execute(text(sql)).one() == ('blob', 16)
+
+
+def test_copy_database_copies_rows_and_circular_keys(app, runner, author, tmp_path):
+    """copy-database で全ての行がコピーされ、循環する外部キー (post ⇔ image) も復元されるかテスト"""
+    category = Category(name='cat', slug='cat', user_id=author.id)
+    tag = Tag(name='tag', slug='tag', user_id=author.id)
+    post = Post(title='コピー元', body='本文', posted_by=author, is_published=True, category=category, tags=[tag])
+    image = Image(original_filename='a.jpg', unique_filename='a.jpg', filepath='uploads/images/a.jpg',
+                  user_id=author.id)
+    db.session.add_all([category, tag, post, image])
+    db.session.flush()
+    image.post_id = post.id
+    post.main_image_id = image.id
+    db.session.commit()
+
+    target = 'sqlite:///' + str(tmp_path / 'copy.db')
+    result = runner.invoke(args=['init', 'copy-database', target, '--batch-size', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'post: 1 行' in result.output
+
+    engine = create_engine(target)
+    with engine.connect() as connection:
+        row = connection.execute(text(
+            'SELECT post.title, image.original_filename, tag.name, category.name FROM post '
+            'JOIN image ON image.id = post.main_image_id AND image.post_id = post.id '
+            'JOIN post_tags ON post_tags.post_id = post.id JOIN tag ON tag.id = post_tags.tag_id '
+            'JOIN category ON category.id = post.category_id')).one()
+        assert tuple(row) == ('コピー元', 'a.jpg', 'tag', 'cat')
+
+    result = runner.invoke(args=['init', 'copy-database', target])
+    assert result.exit_code != 0
+    assert 'is not empty' in result.output
+    engine.dispose()
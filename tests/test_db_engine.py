@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# tests/test_db_engine.py
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db
+from tests.conftest import TestConfig
+
+
+def _make_app(tmp_path, **settings):
+    config_class = type('EngineConfig', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'engine.db'), **settings})
+    return create_app(config_class)
+
+
+def _pragma(name):
+    return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+
+def test_production_profile_sets_pragmas_and_pool(tmp_path):
+    """production プロファイルで WAL などのプラグマと接続プールの大きさが設定されるかテスト"""
+    app = _make_app(tmp_path, SQLITE_ENGINE_PROFILE='production', SQLITE_PRAGMAS={'cache_size': -8000})
+    with app.app_context():
+        assert _pragma('journal_mode') == 'wal'
+        assert _pragma('synchronous') == 1  # NORMAL
+        assert _pragma('busy_timeout') == 5000
+        assert _pragma('cache_size') == -8000
+        assert _pragma('temp_store') == 2  # MEMORY
+        assert db.engine.pool.size() == 10
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_default_profile_keeps_sqlite_defaults(tmp_path):
+    """default プロファイルではプラグマを実行せず、ロールバックジャーナルのままかテスト"""
+    app = _make_app(tmp_path, SQLITE_ENGINE_PROFILE='default', SQLITE_POOL={'pool_size': 3})
+    with app.app_context():
+        assert _pragma('journal_mode') == 'delete'
+        assert db.engine.pool.size() == 3
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.mark.parametrize('settings', [
+    {'SQLITE_ENGINE_PROFILE': 'fastest'},
+    {'SQLITE_PRAGMAS': {'cache_size': '1; DROP TABLE post'}},
+])
+def test_invalid_profile_settings_raise(tmp_path, settings):
+    """存在しないプロファイルや不正なプラグマは起動時にエラーになるかテスト"""
+    with pytest.raises(ValueError):
+        _make_app(tmp_path, **settings)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# tests/test_db_routing.py
+import pytest
+
+from app import create_app, db
+from app.db_routing import REPLICA_BIND
+from app.models import Post, User
+from app.page_cache import MemoryPageCache
+from tests.conftest import TestConfig
+
+
+@pytest.fixture
+def replica_app(app, tmp_path):
+    """プライマリとレプリカの2つの SQLite ファイルを使うアプリケーションを作成するフィクスチャ"""
+    config_class = type('ReplicaConfig', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'primary.db'),
+        'SQLALCHEMY_REPLICA_URI': 'sqlite:///' + str(tmp_path / 'replica.db'),
+    })
+    replica = create_app(config_class)
+    try:
+        # pytest-flask が押すテスト用アプリのコンテキストより優先させる (CLI もこのアプリで動く)
+        with replica.app_context():
+            db.create_all()
+            user = User(username='reader', email='reader@example.com')
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.add(Post(title='同期済みの記事', body='本文', posted_by=user, is_published=True))
+            db.session.commit()
+            result = replica.test_cli_runner().invoke(args=['init', 'sync-replica'])
+            assert result.exit_code == 0, result.output
+            # レプリカには同期されていない記事 (プライマリだけにある)
+            db.session.add(Post(title='未同期の記事', body='本文', posted_by=user, is_published=True))
+            db.session.commit()
+            uniquifier = user.fs_uniquifier
+        yield replica, uniquifier
+    finally:
+        with replica.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        # db.metadatas はアプリケーション間で共有されるため、テスト用アプリの create_all / drop_all に影響しないよう外す
+        db.metadatas.pop(REPLICA_BIND, None)
+
+
+def test_public_reads_use_replica_until_sync(replica_app):
+    """公開ページの GET はレプリカから読み、sync-replica で同期すると反映されるかテスト"""
+    replica, _ = replica_app
+    client = replica.test_client()
+    html = client.get('/').get_data(as_text=True)
+    assert '同期済みの記事' in html
+    assert '未同期の記事' not in html
+
+    with replica.app_context():
+        result = replica.test_cli_runner().invoke(args=['init', 'sync-replica'])
+    assert 'レプリカをプライマリと同期しました' in result.output
+    assert '未同期の記事' in client.get('/').get_data(as_text=True)
+
+
+def test_commit_sticks_reads_to_primary(replica_app):
+    """コメントを投稿した利用者は、スティッキーの期間内はプライマリから読むかテスト"""
+    replica, uniquifier = replica_app
+    client = replica.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = uniquifier
+        sess['_fresh'] = True
+    with replica.app_context():
+        post_id = Post.query.filter_by(title='同期済みの記事').one().id
+
+    response = client.post(f'/post/{post_id}', data={'body': 'コメント'})
+    assert response.status_code == 302
+    assert '未同期の記事' in client.get('/').get_data(as_text=True)
+
+    with client.session_transaction() as sess:
+        sess['_db_primary_until'] = 0  # 期間切れ
+    assert '未同期の記事' not in client.get('/').get_data(as_text=True)
+
+
+def test_sync_replica_requires_replica(runner):
+    """レプリカが設定されていなければ sync-replica はエラーになるかテスト"""
+    result = runner.invoke(args=['init', 'sync-replica'])
+    assert result.exit_code != 0
+    assert 'SQLALCHEMY_REPLICA_URI is not set' in result.output
+
+
+def test_cached_pages_are_rendered_from_primary(replica_app):
+    """ページキャッシュに保存するページは未同期のレプリカではなくプライマリから描画し、同期で破棄するかテスト"""
+    replica, _ = replica_app
+    cache = replica.extensions['page_cache'] = MemoryPageCache()
+    client = replica.test_client()
+
+    first = client.get('/')
+    assert first.headers['X-Page-Cache'] == 'MISS'
+    assert '未同期の記事' in first.get_data(as_text=True)
+    assert client.get('/').headers['X-Page-Cache'] == 'HIT'
+
+    with replica.app_context():
+        result = replica.test_cli_runner().invoke(args=['init', 'sync-replica'])
+    assert result.exit_code == 0, result.output
+    assert cache.generation() == 1
+    assert client.get('/').headers['X-Page-Cache'] == 'MISS'
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# tests/test_home.py
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Post, Category, Tag, Image
+from app.pagination import encode_cursor, decode_cursor, keyset_paginate, clear_count_cache
+
+
+@pytest.fixture
+def published_posts(author):
+    """公開済み投稿を25件作成するフィクスチャ (一部は created_at が同一)"""
+    base = datetime(2025, 1, 1)
+    posts = []
+    for i in range(25):
+        # 同一時刻の投稿を含め、id によるタイブレークを確認する
+        post = Post(title=f'投稿{i}', body='本文', posted_by=author, is_published=True,
+                    created_at=base + timedelta(hours=i // 2))
+        posts.append(post)
+    db.session.add_all(posts)
+    db.session.add(Post(title='下書き', body='本文', posted_by=author, is_published=False, created_at=base))
+    db.session.commit()
+    return sorted(posts, key=lambda p: (p.created_at, p.id.hex), reverse=True)
+
+
+def _post_ids(response):
+    return re.findall(r'/post/([0-9a-f-]{36})', response.data.decode('utf-8'))
+
+
+def _pager_urls(response):
+    html = response.data.decode('utf-8')
+    links = re.findall(r'<a class="page-link" href="([^"]+)">', html)
+    return [link.replace('&amp;', '&') if link != '#' else None for link in links]
+
+
+def test_cursor_roundtrip(published_posts):
+    """カーソルトークンが (created_at, id) を復元できるかテスト"""
+    post = published_posts[0]
+    assert decode_cursor(encode_cursor(post)) == (post.created_at, post.id)
+    assert decode_cursor('invalid!!') is None
+
+
+def test_keyset_paginate_walks_all_posts(app, published_posts):
+    """キーセット方式で前後のページを辿り、全投稿を重複なく取得できるかテスト"""
+    query = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc())
+    seen = []
+    page = keyset_paginate(query, per_page=10)
+    pages = [page]
+    while True:
+        seen.extend(p.id for p in page.items)
+        if not page.has_next:
+            break
+        page = keyset_paginate(query, per_page=10, after=page.next_cursor)
+        pages.append(page)
+    assert seen == [p.id for p in published_posts]
+    assert len(pages) == 3
+
+    # 最後のページから前のページへ戻る
+    back = keyset_paginate(query, per_page=10, before=pages[-1].prev_cursor)
+    assert [p.id for p in back.items] == [p.id for p in pages[1].items]
+    assert back.has_prev
+
+
+def test_home_index_keyset_mode(app, client, published_posts, monkeypatch):
+    """KEYSET_PAGINATION 有効時に ?after= の next_url / prev_url でページ送りできるかテスト"""
+    monkeypatch.setitem(app.config, 'KEYSET_PAGINATION', True)
+
+    response = client.get('/')
+    assert response.status_code == 200
+    ids = _post_ids(response)
+    prev_url, next_url = _pager_urls(response)
+    assert prev_url is None
+    assert 'after=' in next_url and 'page=' not in next_url
+
+    response = client.get(next_url)
+    second_ids = _post_ids(response)
+    prev_url, next_url = _pager_urls(response)
+    assert 'before=' in prev_url
+    assert not set(ids) & set(second_ids)
+    assert second_ids == [str(p.id) for p in published_posts[10:20]]
+
+    response = client.get(prev_url)
+    assert _post_ids(response) == ids
+
+
+def test_home_index_offset_mode_uses_cached_count(app, client, published_posts, monkeypatch):
+    """PAGINATION_CACHED_COUNT 有効時も OFFSET 方式のページ送りが機能するかテスト"""
+    monkeypatch.setitem(app.config, 'PAGINATION_CACHED_COUNT', True)
+    clear_count_cache()
+
+    response = client.get('/?page=2')
+    assert response.status_code == 200
+    # OFFSET 方式は created_at のみで並べるため、同一時刻の投稿の順序は保証されない
+    assert len(_post_ids(response)) == 10
+    prev_url, next_url = _pager_urls(response)
+    assert prev_url.endswith('page=1') and next_url.endswith('page=3')
+
+
+@pytest.fixture
+def post_cards(author):
+    """メイン画像・カテゴリ・タグ3件付きの公開済み投稿を10件作成するフィクスチャ"""
+    category = Category(name='カテゴリ', slug='category', user_id=author.id)
+    tags = [Tag(name=f'タグ{i}', slug=f'tag{i}', user_id=author.id) for i in range(3)]
+    db.session.add(category)
+    db.session.add_all(tags)
+    for i in range(10):
+        image = Image(original_filename=f'{i}.jpg', unique_filename=f'card{i}.jpg',
+                      thumbnail_filename=f'thumb_card{i}.jpg', filepath=f'uploads/images/card{i}.jpg',
+                      user_id=author.id)
+        db.session.add(Post(title=f'カード{i}', body='本文', posted_by=author, is_published=True,
+                            category=category, tags=tags, main_image=image))
+    db.session.commit()
+    return category, tags
+
+
+@pytest.mark.parametrize('url', ['/', '/category/{category_id}', '/tag/{tag_id}'])
+def test_listing_query_budget(client, post_cards, assert_max_queries, url):
+    """一覧ページのクエリ数が投稿数に比例しない (N+1 が発生しない) かテスト"""
+    category, tags = post_cards
+    url = url.format(category_id=category.id, tag_id=tags[0].id)
+    db.session.expire_all()
+
+    with assert_max_queries(6):
+        response = client.get(url)
+    assert response.status_code == 200
+    assert len(_post_ids(response)) == 10
+
+
+def test_search_ranks_and_highlights(client, author):
+    """FTS5 検索がタイトル一致を上位に並べ、一致箇所を強調表示するかテスト"""
+    body_hit = Post(title='日記', body='今日は東京タワーに行きました。<script>', posted_by=author, is_published=True)
+    title_hit = Post(title='東京タワーの夜景', body='夜景がきれいでした。', posted_by=author, is_published=True)
+    draft = Post(title='東京タワー (下書き)', body='未公開', posted_by=author, is_published=False)
+    db.session.add_all([body_hit, title_hit, draft])
+    db.session.commit()
+
+    response = client.get('/search?query=東京タワー')
+    assert response.status_code == 200
+    assert _post_ids(response) == [str(title_hit.id), str(body_hit.id)]
+    html = response.data.decode('utf-8')
+    assert '<mark>東京タワー</mark>に行きました' in html
+    assert '<script>' not in html.split('<mark>東京タワー</mark>に行きました')[1][:20]
+
+
+def test_search_index_follows_edits(client, author):
+    """投稿の編集・削除が検索索引に反映されるかテスト"""
+    post = Post(title='古いタイトル', body='本文です', posted_by=author, is_published=True)
+    db.session.add(post)
+    db.session.commit()
+
+    post.title = '新しいタイトル'
+    db.session.commit()
+    assert _post_ids(client.get('/search?query=古いタイトル')) == []
+    assert _post_ids(client.get('/search?query=新しいタイトル')) == [str(post.id)]
+
+    db.session.delete(post)
+    db.session.commit()
+    assert _post_ids(client.get('/search?query=新しいタイトル')) == []
+
+
+def test_search_index_updates_by_rowid(author, assert_max_queries):
+    """索引の更新・削除が post_id (UNINDEXED) の全件走査ではなく rowid で行われるかテスト"""
+    post = Post(title='索引のキー', body='本文です', posted_by=author, is_published=True)
+    db.session.add(post)
+    with assert_max_queries(100) as statements:
+        db.session.commit()
+    # 新しい投稿では削除を行わない
+    assert not [s for s in statements if s.startswith('DELETE FROM post_search')]
+
+    post.body = '新しい本文です'
+    with assert_max_queries(100) as statements:
+        db.session.commit()
+    fts = [s for s in statements if 'post_search' in s]
+    assert fts and all('post_search.rowid = (SELECT' in s.replace('\n', ' ') for s in fts)
+    parameters = ('x',) * (fts[0].count('?') - 1) + (post.id.bytes,)
+    plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + fts[0], parameters).all()
+    assert 'INDEX 0:=' in plan[0][-1]
+
+
+def test_reindex_search_cli(runner, author):
+    """flask init reindex-search が全投稿を索引に登録し直すかテスト"""
+    db.session.add(Post(title='再索引テスト', body='本文', posted_by=author, is_published=True))
+    db.session.commit()
+
+    result = runner.invoke(args=['init', 'reindex-search'])
+    assert result.exit_code == 0, result.output
+    assert '1 件' in result.output
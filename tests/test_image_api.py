@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# tests/test_image_api.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.image_api import ImageUrlBuilder
+from app.models import Image
+
+API = '/admin/api/v1/images'
+
+
+@pytest.fixture
+def images(author):
+    """同じアップロード日時を含む画像を5件作成するフィクスチャ"""
+    start = datetime(2025, 1, 1)
+    images = [Image(original_filename=f'photo{i}.jpg', unique_filename=f'u{i}.jpg', filepath=f'uploads/images/u{i}.jpg',
+                    thumbnail_filename=f'thumb_u{i}.jpg', user_id=author.id,
+                    uploaded_at=start + timedelta(hours=min(i, 3))) for i in range(5)]
+    db.session.add_all(images)
+    db.session.commit()
+    return images
+
+
+def test_cursor_pagination_walks_all_images(admin_client, images):
+    """カーソルをたどると同じ日時の画像も含めて重複・欠落なく全件を取得できるかテスト"""
+    seen = []
+    url = f'{API}?limit=2'
+    while True:
+        data = admin_client.get(url).get_json()
+        assert data['version'] == 1
+        seen.extend(image['original_filename'] for image in data['images'])
+        if data['next_cursor'] is None:
+            break
+        url = f"{API}?limit=2&cursor={data['next_cursor']}"
+    assert sorted(seen) == sorted(image.original_filename for image in images)
+    assert seen[-1] == 'photo0.jpg'
+
+
+def test_fields_selection_and_precomputed_urls(app, admin_client, images):
+    """?fields= で項目を選び、URL が Image.url / thumbnail_url と一致するかテスト"""
+    data = admin_client.get(f'{API}?fields=id,url,thumbnail_url&limit=1').get_json()
+    item = data['images'][0]
+    assert set(item) == {'id', 'url', 'thumbnail_url'}
+    image = next(image for image in images if str(image.id) == item['id'])
+    assert item['url'] == f'/uploads/images/{image.unique_filename}'
+    assert item['thumbnail_url'] == f'/uploads/thumbnails/{image.thumbnail_filename}'
+
+    with app.test_request_context():
+        urls = ImageUrlBuilder()
+        for name in ('写真 (1)#.jpg', 'a/b?c.png', "x;y=z@'!.gif"):
+            image = Image(unique_filename=name, thumbnail_filename=None)
+            assert urls.url(image) == image.url
+            assert urls.thumbnail_url(image) == image.thumbnail_url
+
+
+def test_etag_returns_304_until_images_change(admin_client, images, author, assert_max_queries):
+    """ETag が一致すれば一覧を読まずに 304 を返し、画像の追加やサムネイル生成で変わるかテスト"""
+    first = admin_client.get(API)
+    etag = first.headers['ETag']
+    assert 'private' in first.headers['Cache-Control']
+
+    with assert_max_queries(1):
+        response = admin_client.get(API, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert admin_client.get(f'{API}?limit=3', headers={'If-None-Match': etag}).status_code == 200
+
+    images[0].thumbnail_filename = None
+    images[0].thumbnail_status = 'pending'
+    db.session.commit()
+    response = admin_client.get(API, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    db.session.add(Image(original_filename='new.jpg', unique_filename='new.jpg', filepath='uploads/images/new.jpg',
+                         user_id=author.id, uploaded_at=datetime(2024, 1, 1)))
+    db.session.commit()
+    assert admin_client.get(API, headers={'If-None-Match': etag}).status_code == 200
+
+
+@pytest.mark.parametrize('query, message', [
+    ('fields=id,password', 'Unknown fields: password'),
+    ('limit=0', 'limit must be between 1 and 200'),
+    ('cursor=!!!', 'Invalid cursor'),
+])
+def test_invalid_parameters_return_400(admin_client, images, query, message):
+    """不正なパラメーターには 400 とエラー内容の JSON を返すかテスト"""
+    response = admin_client.get(f'{API}?{query}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == message
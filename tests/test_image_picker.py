@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# tests/test_image_picker.py
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from app.forms import PostForm
+from app.models import Image, Post
+
+
+@pytest.fixture
+def images(author):
+    """アップロード日時をずらした画像5件 (新しい順に photo4 → photo0) と最も古い画像1件を作成するフィクスチャ"""
+    start = datetime(2025, 1, 1)
+    images = [Image(original_filename=f'photo{i}.jpg', unique_filename=f'u{i}.jpg', filepath=f'uploads/images/u{i}.jpg',
+                    user_id=author.id, uploaded_at=start + timedelta(hours=i)) for i in range(5)]
+    images.append(Image(original_filename='100%_cat.png', unique_filename='cat.png', filepath='uploads/images/cat.png',
+                        user_id=author.id, uploaded_at=start - timedelta(days=1)))
+    db.session.add_all(images)
+    db.session.commit()
+    return images
+
+
+def test_images_json_paginates_without_count(admin_client, images, assert_max_queries):
+    """1ページ分だけを返し、次のページの有無を COUNT(*) なしで判定するかテスト"""
+    admin_client.get('/admin/uploads/images/json')  # ログインユーザーの読み込みを済ませておく
+    with assert_max_queries(1):
+        data = admin_client.get('/admin/uploads/images/json?per_page=4').get_json()
+    assert [image['original_filename'] for image in data['images']] == ['photo4.jpg', 'photo3.jpg', 'photo2.jpg', 'photo1.jpg']
+    assert data['has_next'] and data['next_page'] == 2
+    assert data['images'][0]['thumbnail_url']
+
+    data = admin_client.get('/admin/uploads/images/json?per_page=4&page=2').get_json()
+    assert [image['original_filename'] for image in data['images']] == ['photo0.jpg', '100%_cat.png']
+    assert not data['has_next'] and data['next_page'] is None
+
+
+def test_images_json_searches_filename(admin_client, images):
+    """?q= のファイル名検索で % などを文字どおりに扱うかテスト"""
+    data = admin_client.get('/admin/uploads/images/json?q=100%25').get_json()
+    assert [image['original_filename'] for image in data['images']] == ['100%_cat.png']
+    assert admin_client.get('/admin/uploads/images/json?q=%25_').get_json()['images'][0]['original_filename'] == '100%_cat.png'
+    assert admin_client.get('/admin/uploads/images/json?q=dog').get_json()['images'] == []
+
+
+def _post_form(app, **data):
+    formdata = MultiDict({'title': 'タイトル', 'body': '本文', **data})
+    with app.test_request_context(method='POST'):
+        form = PostForm(formdata=formdata, obj=object())  # obj があるとメイン画像の必須チェックを行わない
+        form.category.choices = []
+        return form, form.validate()
+
+
+def test_post_form_resolves_images_with_one_query(app, images, assert_max_queries):
+    """送信された画像 ID を1回の IN クエリで Image に変換し、送信順を保つかテスト"""
+    ids = [str(images[3].id), str(images[0].id)]
+    formdata = MultiDict([('title', 'タイトル'), ('body', '本文'),
+                          ('additional_images', ','.join(ids)), ('additional_images', str(images[3].id))])
+    with app.test_request_context(method='POST'):
+        form = PostForm(formdata=formdata, obj=object())
+        form.category.choices = []
+        with assert_max_queries(2):  # 追加画像の IN クエリ + タグの選択肢
+            assert form.validate(), form.errors
+    assert form.additional_images.data == [images[3], images[0]]
+    assert form.main_image.data is None
+
+
+def test_post_form_rejects_unknown_or_invalid_ids(app, images):
+    """存在しない ID や UUID でない値はエラーになるかテスト"""
+    form, valid = _post_form(app, main_image=str(uuid.uuid4()))
+    assert not valid
+    assert form.main_image.errors == ['選択された画像が見つかりません。']
+
+    form, valid = _post_form(app, additional_images=f'{images[0].id},not-a-uuid')
+    assert not valid
+    assert form.additional_images.errors == ['無効な画像IDです。']
+
+    form, valid = _post_form(app, main_image=str(images[1].id))
+    assert valid, form.errors
+    assert form.main_image.data == images[1]
+
+
+def test_edit_post_uses_picker_selection(admin_client, images, author):
+    """編集画面の画像ピッカーで選んだメイン画像を保存し、送信されない追加画像は保持するかテスト"""
+    post = Post(title='編集', body='本文', posted_by=author, main_image=images[0], additional_images=[images[1]])
+    db.session.add(post)
+    db.session.commit()
+
+    html = admin_client.get(f'/admin/posts/edit/{post.id}').get_data(as_text=True)
+    assert f'value="{images[0].id}"' in html
+    assert 'photo2.jpg' not in html  # 画像の一覧はページに埋め込まない
+
+    response = admin_client.post(f'/admin/posts/edit/{post.id}', data={
+        'title': '編集', 'body': '本文', 'main_image': str(images[2].id),
+    })
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert post.main_image_id == images[2].id
+    assert post.additional_images == [images[1]]
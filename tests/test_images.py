@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+# tests/test_images.py
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from PIL import Image as PilImage
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
+
+import config
+from app import db
+from app.models import Image, ImageJob
+from app.thumbnails import schedule_thumbnail, schedule_derivatives, run_worker
+from app.uploads import create_image_from_upload, ingest_uploads, release_image_files
+from app.variants import format_supported, ladder_widths
+
+
+@pytest.fixture
+def upload_dirs(app, tmp_path):
+    """アップロード先を一時ディレクトリに差し替えるフィクスチャ"""
+    images_dir = tmp_path / 'images'
+    thumbnails_dir = tmp_path / 'thumbnails'
+    images_dir.mkdir()
+    overrides = {
+        'UPLOAD_IMAGES_DIR': str(images_dir),
+        'UPLOAD_THUMBNAILS_DIR': str(thumbnails_dir),
+        'UPLOAD_VARIANTS_DIR': str(tmp_path / 'variants'),
+        'THUMBNAIL_ASYNC': True,
+        'IMAGE_VARIANT_WIDTHS': (320, 640, 1920),
+        'IMAGE_VARIANT_FORMATS': ('avif', 'webp'),
+    }
+    saved = {key: app.config[key] for key in overrides}
+    app.config.update(overrides)
+    yield images_dir, thumbnails_dir
+    app.config.update(saved)
+
+
+def _add_image(author, images_dir, name, save_file=True, schedule=schedule_thumbnail):
+    if save_file:
+        PilImage.new('RGB', (1200, 900), 'orange').save(images_dir / name)
+    image = Image(original_filename=name, unique_filename=name,
+                  filepath=f'uploads/images/{name}', user_id=author.id)
+    db.session.add(image)
+    schedule(image)
+    db.session.commit()
+    return image
+
+
+def test_schedule_thumbnail_enqueues_job(app, author, upload_dirs):
+    """アップロード時はジョブ登録のみ行い、生成前は元画像の URL を返すかテスト"""
+    images_dir, thumbnails_dir = upload_dirs
+    with app.test_request_context():
+        image = _add_image(author, images_dir, 'photo.jpg')
+
+        assert image.thumbnail_status == 'pending'
+        assert image.thumbnail_filename is None
+        assert image.thumbnail_url == image.url
+        assert [job.status for job in image.jobs] == ['pending']
+        assert not thumbnails_dir.exists()
+
+
+def test_worker_generates_pending_thumbnails(app, author, upload_dirs):
+    """ワーカーがジョブを処理し、サムネイルを生成して ready にするかテスト"""
+    images_dir, thumbnails_dir = upload_dirs
+    images = [_add_image(author, images_dir, f'photo{i}.jpg') for i in range(3)]
+
+    assert run_worker(workers=2, once=True) == (3, 0)
+
+    with app.test_request_context():
+        for image in images:
+            db.session.refresh(image)
+            assert image.thumbnail_status == 'ready'
+            assert image.thumbnail_filename == 'thumb_' + image.unique_filename
+            assert image.thumbnail_url != image.url
+            with PilImage.open(thumbnails_dir / image.thumbnail_filename) as thumb:
+                assert thumb.width <= app.config['THUMBNAIL_SIZE'][0]
+                assert thumb.height <= app.config['THUMBNAIL_SIZE'][1]
+    assert {job.status for job in ImageJob.query} == {'done'}
+
+
+def test_worker_marks_failed_after_max_attempts(app, author, upload_dirs):
+    """元画像がない場合は再試行の上限で failed になり、URL は元画像にフォールバックするかテスト"""
+    images_dir, _ = upload_dirs
+    image = _add_image(author, images_dir, 'missing.jpg', save_file=False)
+
+    assert run_worker(workers=1, once=True) == (0, app.config['THUMBNAIL_JOB_MAX_ATTEMPTS'])
+
+    db.session.refresh(image)
+    job = image.jobs[0]
+    assert job.status == 'failed'
+    assert job.attempts == app.config['THUMBNAIL_JOB_MAX_ATTEMPTS']
+    assert image.thumbnail_status == 'failed'
+    with app.test_request_context():
+        assert image.thumbnail_url == image.url
+
+
+def test_thumbnail_worker_cli(runner, author, upload_dirs):
+    """flask init thumbnail-worker --once が未処理ジョブを処理して終了するかテスト"""
+    images_dir, thumbnails_dir = upload_dirs
+    _add_image(author, images_dir, 'cli.png')
+
+    result = runner.invoke(args=['init', 'thumbnail-worker', '--once', '--workers', '1'])
+    assert result.exit_code == 0, result.output
+    assert '1 件' in result.output
+    assert os.path.exists(thumbnails_dir / 'thumb_cli.png')
+
+
+def _jpeg_upload(name, size=(640, 480), color='teal'):
+    buffer = io.BytesIO()
+    PilImage.new('RGB', size, color).save(buffer, 'JPEG')
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename=name, content_type='image/jpeg')
+
+
+def test_ingest_uploads_reports_per_file_results(app, author, upload_dirs):
+    """一括アップロードがファイルごとの成否を返し、成功分を1回の INSERT で登録するかテスト"""
+    images_dir, _ = upload_dirs
+    files = [
+        _jpeg_upload('a.jpg'),
+        FileStorage(stream=io.BytesIO(b'not an image'), filename='broken.jpg'),
+        FileStorage(stream=io.BytesIO(b'text'), filename='notes.txt'),
+        _jpeg_upload('b.jpg', color='navy'),
+    ]
+    inserts = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO image '):
+            inserts.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = ingest_uploads(files, author.id, executor=executor)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert [result.ok for result in results] == [True, False, False, True]
+    assert len(inserts) == 1
+    images = Image.query.order_by(Image.original_filename).all()
+    assert [image.original_filename for image in images] == ['a.jpg', 'b.jpg']
+    assert {image.thumbnail_status for image in images} == {'pending'}
+    assert sorted(job.kind for job in ImageJob.query) == ['thumbnail', 'thumbnail', 'variants', 'variants']
+    # 破損したファイルは保存先から削除される
+    assert sorted(os.listdir(images_dir)) == sorted(image.unique_filename for image in images)
+
+
+def test_ingest_uploads_inline_thumbnails(app, author, upload_dirs):
+    """THUMBNAIL_ASYNC が無効な場合はアップロード処理内でサムネイルと派生画像を生成し、ジョブを登録しないかテスト"""
+    _, thumbnails_dir = upload_dirs
+    app.config['THUMBNAIL_ASYNC'] = False
+
+    results = ingest_uploads([_jpeg_upload('inline.jpg'), _jpeg_upload('same.jpg')], author.id)
+
+    image, duplicate = (db.session.get(Image, result.image_id) for result in results)
+    assert image.thumbnail_status == 'ready'
+    assert (thumbnails_dir / image.thumbnail_filename).exists()
+    assert {v.width for v in image.variants} == {320, 640}
+    # バッチ内の同じ内容の画像は生成した派生画像を引き継ぐ
+    assert sorted(v.filename for v in duplicate.variants) == sorted(v.filename for v in image.variants)
+    assert ImageJob.query.count() == 0
+
+
+def test_schedule_derivatives_inline_by_default(app, author, upload_dirs):
+    """既定の設定 (THUMBNAIL_ASYNC = False) ではワーカーなしでサムネイルと派生画像が揃うかテスト"""
+    images_dir, thumbnails_dir = upload_dirs
+    app.config['THUMBNAIL_ASYNC'] = config.Config.THUMBNAIL_ASYNC
+    image = _add_image(author, images_dir, 'sync.jpg', schedule=schedule_derivatives)
+
+    assert image.thumbnail_status == 'ready'
+    assert (thumbnails_dir / image.thumbnail_filename).exists()
+    assert {v.width for v in image.variants} == {320, 640, 1200}
+    assert image.jobs == []
+
+
+def test_ladder_widths_never_upscales():
+    """派生画像の幅が元画像の幅を超えないかテスト"""
+    assert ladder_widths(1200, (320, 640, 1920)) == [320, 640, 1200]
+    assert ladder_widths(3000, (320, 640, 1920)) == [320, 640, 1920]
+    assert ladder_widths(200, (320, 640)) == [200]
+    assert ladder_widths(1200, ()) == []
+
+
+def test_worker_generates_variants_and_srcset(app, author, upload_dirs):
+    """ワーカーが幅別の派生画像を生成し、Image.srcset が利用できるかテスト"""
+    images_dir, _ = upload_dirs
+    image = _add_image(author, images_dir, 'hero.jpg', schedule=schedule_derivatives)
+    with app.test_request_context():
+        assert image.srcset('webp') == ''
+        assert image.variant_formats == []
+
+    assert run_worker(workers=1, once=True) == (2, 0)
+
+    db.session.refresh(image)
+    formats = ['webp'] + (['avif'] if format_supported('avif') else [])
+    assert sorted(image.variant_formats) == sorted(formats)
+    webp = [v for v in image.variants if v.format == 'webp']
+    assert [(v.width, v.height) for v in webp] == [(320, 240), (640, 480), (1200, 900)]
+    for variant in webp:
+        with PilImage.open(os.path.join(app.config['UPLOAD_VARIANTS_DIR'], variant.filename)) as img:
+            assert img.format == 'WEBP'
+            assert img.width == variant.width
+    with app.test_request_context():
+        srcset = image.srcset('webp')
+    assert srcset.count('w, ') == 2
+    assert srcset.endswith('hero_1200w.webp 1200w')
+
+
+def test_generate_variants_cli_regenerates_ladder(app, runner, author, upload_dirs):
+    """設定変更後に flask init generate-variants --all で派生画像を作り直し、不要な段を削除するかテスト"""
+    images_dir, _ = upload_dirs
+    image = _add_image(author, images_dir, 'ladder.jpg', schedule=schedule_derivatives)
+    run_worker(workers=1, once=True)
+
+    app.config['IMAGE_VARIANT_WIDTHS'] = (320,)
+    result = runner.invoke(args=['init', 'generate-variants'])
+    assert '0 件' in result.output
+    result = runner.invoke(args=['init', 'generate-variants', '--all'])
+    assert result.exit_code == 0, result.output
+    assert '1 件' in result.output
+    run_worker(workers=1, once=True)
+
+    db.session.refresh(image)
+    assert {v.width for v in image.variants} == {320}
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_VARIANTS_DIR'], 'ladder_1200w.webp'))
+
+
+def test_duplicate_upload_shares_file_and_derivatives(app, author, upload_dirs):
+    """同じ内容の画像はファイル・サムネイルを共有し、最後の参照が消えたときだけファイルを削除するかテスト"""
+    images_dir, thumbnails_dir = upload_dirs
+    first = create_image_from_upload(_jpeg_upload('first.jpg'), author.id)
+    db.session.commit()
+    run_worker(workers=1, once=True)
+    db.session.refresh(first)
+
+    second = create_image_from_upload(_jpeg_upload('second.JPG'), author.id)
+    db.session.commit()
+
+    assert first.unique_filename == first.content_hash + '.jpg'
+    assert second.unique_filename == first.unique_filename
+    assert second.thumbnail_status == 'ready'
+    assert second.thumbnail_filename == first.thumbnail_filename
+    assert [v.filename for v in second.variants] == [v.filename for v in first.variants]
+    assert second.jobs == []
+    assert os.listdir(images_dir) == [first.unique_filename]
+
+    assert release_image_files(first) is False
+    db.session.delete(first)
+    db.session.commit()
+    assert os.path.exists(images_dir / second.unique_filename)
+
+    assert release_image_files(second) is True
+    db.session.delete(second)
+    db.session.commit()
+    assert os.listdir(images_dir) == []
+    assert os.listdir(thumbnails_dir) == []
+    assert os.listdir(app.config['UPLOAD_VARIANTS_DIR']) == []
+
+
+def test_released_files_are_removed_only_after_commit(app, author, upload_dirs):
+    """画像の削除がロールバックされた場合はファイルを残し、コミットされた後にだけ削除するかテスト"""
+    images_dir, _ = upload_dirs
+    image = create_image_from_upload(_jpeg_upload('keep.jpg'), author.id)
+    db.session.commit()
+    path = images_dir / image.unique_filename
+
+    assert release_image_files(image) is True
+    db.session.delete(image)
+    assert os.path.exists(path)
+    db.session.rollback()
+    assert os.path.exists(path)
+    # ロールバックで登録を破棄するため、次のコミットでも削除しない
+    db.session.commit()
+    assert os.path.exists(path)
+
+    assert release_image_files(image) is True
+    db.session.delete(image)
+    db.session.commit()
+    assert not os.path.exists(path)
+
+
+def test_ingest_uploads_deduplicates_within_batch(app, author, upload_dirs):
+    """一括アップロード内の重複はデコード・ジョブを省略し、元画像のジョブ完了時にサムネイルが反映されるかテスト"""
+    images_dir, _ = upload_dirs
+    files = [_jpeg_upload('a.jpg'), _jpeg_upload('a-copy.jpg'), _jpeg_upload('c.jpg', color='maroon')]
+
+    results = ingest_uploads(files, author.id)
+
+    assert all(result.ok for result in results)
+    assert len(os.listdir(images_dir)) == 2
+    assert ImageJob.query.filter_by(kind='thumbnail').count() == 2
+
+    run_worker(workers=1, once=True)
+
+    copy = db.session.get(Image, results[1].image_id)
+    original = db.session.get(Image, results[0].image_id)
+    assert copy.thumbnail_status == 'ready'
+    assert copy.thumbnail_filename == original.thumbnail_filename
+    assert len(copy.variants) == len(original.variants) > 0
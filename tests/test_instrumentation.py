@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# tests/test_instrumentation.py
+import os
+
+import pytest
+
+from app import create_app, db, logging_setup
+from app.instrumentation import get_request_log
+from app.models import Post, Role, User
+from tests.conftest import TestConfig
+
+
+@pytest.fixture
+def make_app(app, tmp_path):
+    """計測を有効にしたアプリケーションを SQLite ファイルで作成するフィクスチャ"""
+    created = []
+
+    def _make_app(**settings):
+        config_class = type('InstrumentationConfig', (TestConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / f'instrumented{len(created)}.db'),
+            'INSTRUMENTATION_ENABLED': True,
+            'INSTRUMENTATION_PROFILE_DIR': str(tmp_path / 'profiles'),
+            'LOG_DIR': None, 'LOG_TO_CONSOLE': False, **settings})
+        instrumented = create_app(config_class)
+        with instrumented.app_context():
+            db.create_all()
+            user = User(username='admin', email='admin@example.com')
+            user.set_password('password123')
+            user.roles.append(Role(name='admin'))
+            db.session.add(user)
+            post = Post(title='計測する記事', body='**本文**', posted_by=user, is_published=True)
+            db.session.add(post)
+            db.session.commit()
+            instrumented.config['TEST_POST_ID'] = post.id
+            instrumented.config['TEST_UNIQUIFIER'] = user.fs_uniquifier
+        created.append(instrumented)
+        return instrumented
+
+    try:
+        yield _make_app
+    finally:
+        for instrumented in created:
+            with instrumented.app_context():
+                db.engine.dispose()
+        # create_app で付け替えたロガーをテスト用アプリの設定に戻す
+        logging_setup.init_app(app)
+
+
+def test_server_timing_and_request_log(make_app):
+    """Server-Timing ヘッダーに SQL・テンプレートの時間が含まれ、リングバッファに記録されるかテスト"""
+    instrumented = make_app()
+    client = instrumented.test_client()
+    response = client.get(f"/post/{instrumented.config['TEST_POST_ID']}")
+    assert response.status_code == 200
+
+    timing = dict(entry.strip().split(';', 1) for entry in response.headers['Server-Timing'].split(','))
+    assert set(timing) == {'total', 'db', 'tpl', 'md'}
+    assert 'desc="SQL x' in timing['db']
+
+    with instrumented.app_context():
+        records = get_request_log().records()
+    record = records[0]
+    assert record['endpoint'] == 'home.post_detail'
+    assert record['status'] == 200
+    assert record['sql_count'] > 0
+    assert record['template_ms'] > 0
+    assert record['duration_ms'] >= record['sql_ms']
+    assert record['profile'] is None
+
+
+def test_sample_rate_and_buffer_size(make_app):
+    """サンプリングしないリクエストも Server-Timing は返し、バッファは最新の件数だけ保持するかテスト"""
+    instrumented = make_app(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    client = instrumented.test_client()
+    assert 'Server-Timing' in client.get('/').headers
+    with instrumented.app_context():
+        assert len(get_request_log()) == 0
+
+    instrumented = make_app(INSTRUMENTATION_BUFFER_SIZE=2)
+    client = instrumented.test_client()
+    for path in ('/', '/?page=2', '/?page=3'):
+        client.get(path)
+    with instrumented.app_context():
+        assert [record['path'] for record in get_request_log().records()] == ['/?page=3', '/?page=2']
+
+
+def test_slow_requests_dump_profile(make_app, tmp_path):
+    """しきい値を超えたリクエストの cProfile の結果がファイルに保存されるかテスト"""
+    instrumented = make_app(INSTRUMENTATION_PROFILE_THRESHOLD_MS=0, INSTRUMENTATION_SAMPLE_RATE=0.0)
+    instrumented.test_client().get('/')
+
+    with instrumented.app_context():
+        record = get_request_log().records()[0]
+    assert record['profile'].endswith('ms.prof')
+    assert os.path.exists(tmp_path / 'profiles' / record['profile'])
+
+
+def test_admin_endpoint_lists_records(make_app):
+    """管理画面の計測ページが記録したリクエストをエンドポイント別に集計して返すかテスト"""
+    instrumented = make_app()
+    client = instrumented.test_client()
+    client.get('/')
+    with client.session_transaction() as sess:
+        sess['_user_id'] = instrumented.config['TEST_UNIQUIFIER']
+        sess['_fresh'] = True
+        sess['identity.id'] = instrumented.config['TEST_UNIQUIFIER']
+        sess['identity.auth_type'] = None
+
+    data = client.get('/admin/instrumentation?format=json').get_json()
+    assert data['enabled'] is True
+    assert data['summary'][0]['endpoint'] == 'home.index'
+    assert data['summary'][0]['count'] == 1
+
+    html = client.get('/admin/instrumentation').get_data(as_text=True)
+    assert 'home.index' in html
+
+
+def test_disabled_by_default(client):
+    """既定の設定では計測せず、Server-Timing ヘッダーを返さないかテスト"""
+    assert 'Server-Timing' not in client.get('/').headers
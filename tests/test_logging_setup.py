@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# tests/test_logging_setup.py
+import json
+import logging
+from logging.handlers import QueueHandler
+
+import pytest
+
+from app import create_app, logging_setup
+from tests.conftest import TestConfig
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    def _make_app(**settings):
+        config_class = type('LoggingConfig', (TestConfig,), {
+            'LOG_DIR': str(tmp_path), 'LOG_TO_CONSOLE': False, **settings})
+        return create_app(config_class)
+    try:
+        yield _make_app
+    finally:
+        logging_setup.stop_logging('app')
+
+
+def _read_lines(tmp_path):
+    # リスナーを止めてキューに残ったレコードを書き出してから読む
+    logging_setup.stop_logging('app')
+    return (tmp_path / 'akiomi_blog.log').read_text(encoding='utf-8').splitlines()
+
+
+def test_logs_are_written_as_json_lines_through_queue(make_app, tmp_path):
+    """app.logger には QueueHandler だけが付き、ファイルに JSON Lines で書き込まれるかテスト"""
+    app = make_app()
+    assert [type(handler) for handler in app.logger.handlers] == [logging_setup.RequestQueueHandler]
+    assert isinstance(app.logger.handlers[0], QueueHandler)
+
+    with app.test_request_context('/posts/abc', method='POST'):
+        app.logger.warning('保存に失敗しました: %s', 'タイトル')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            app.logger.exception('例外')
+
+    entries = [json.loads(line) for line in _read_lines(tmp_path)]
+    assert entries[0]['message'] == 'Akiomi Blog startup'
+    warning = entries[1]
+    assert warning['level'] == 'WARNING'
+    assert warning['message'] == '保存に失敗しました: タイトル'
+    assert warning['method'] == 'POST'
+    assert warning['path'] == '/posts/abc'
+    assert 'ValueError: boom' in entries[2]['exc_info']
+
+
+def test_repeated_create_app_replaces_pipeline(make_app, tmp_path):
+    """create_app を繰り返してもハンドラが重複せず、text 形式と LOG_LEVEL が反映されるかテスト"""
+    make_app()
+    app = make_app(LOG_FORMAT='text', LOG_LEVEL='warning')
+    assert len(app.logger.handlers) == 1
+    assert app.logger.level == logging.WARNING
+    app.logger.info('出力されない')
+    app.logger.error('エラー')
+
+    lines = _read_lines(tmp_path)
+    assert 'ERROR: エラー [in ' in lines[-1]
+    assert not any('出力されない' in line for line in lines)
+
+
+def test_debug_arguments_are_not_formatted_when_debug_is_off(make_app):
+    """DEBUG が無効な場合、debug の % 形式の引数が文字列化されないかテスト"""
+    class Expensive:
+        formatted = False
+
+        def __str__(self):
+            Expensive.formatted = True
+            return 'expensive'
+
+    app = make_app(LOG_LEVEL='INFO')
+    app.logger.debug('value: %s', Expensive())
+    assert not Expensive.formatted
+    app.logger.setLevel(logging.DEBUG)
+    app.logger.debug('value: %s', Expensive())
+    assert Expensive.formatted
+
+
+def test_unknown_log_format_raises(make_app):
+    with pytest.raises(ValueError):
+        make_app(LOG_FORMAT='xml')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# tests/test_media.py
+import os
+
+import pytest
+
+
+@pytest.fixture
+def upload_file(app, tmp_path):
+    """一時ディレクトリにアップロード済みの元画像を用意するフィクスチャ"""
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    (images_dir / 'abc.jpg').write_bytes(bytes(range(256)) * 40)
+    saved = {key: app.config[key] for key in ('UPLOAD_IMAGES_DIR', 'UPLOAD_SEND_FILE_MODE')}
+    app.config['UPLOAD_IMAGES_DIR'] = str(images_dir)
+    yield images_dir / 'abc.jpg'
+    app.config.update(saved)
+
+
+def test_upload_has_immutable_cache_headers(client, upload_file):
+    """アップロード画像が長期キャッシュ・ETag 付きで配信されるかテスト"""
+    response = client.get('/uploads/images/abc.jpg')
+    assert response.status_code == 200
+    assert response.data == upload_file.read_bytes()
+    cache_control = response.headers['Cache-Control']
+    assert 'immutable' in cache_control
+    assert 'max-age=31536000' in cache_control
+    assert 'public' in cache_control
+    assert response.headers['ETag'].startswith('"')
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_upload_conditional_and_range_requests(client, upload_file):
+    """If-None-Match に 304、Range に 206 を返すかテスト"""
+    etag = client.get('/uploads/images/abc.jpg').headers['ETag']
+
+    not_modified = client.get('/uploads/images/abc.jpg', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert 'immutable' in not_modified.headers['Cache-Control']
+
+    partial = client.get('/uploads/images/abc.jpg', headers={'Range': 'bytes=0-99'})
+    assert partial.status_code == 206
+    assert partial.data == upload_file.read_bytes()[:100]
+    assert partial.headers['Content-Range'] == f'bytes 0-99/{upload_file.stat().st_size}'
+
+
+def test_upload_etag_is_stable_across_rewrites(client, upload_file):
+    """ETag がファイル名から作られ、更新時刻やサイズが変わっても同じ値になるかテスト"""
+    etag = client.get('/uploads/images/abc.jpg').headers['ETag']
+    upload_file.write_bytes(upload_file.read_bytes() + b'\0')
+    os.utime(upload_file, (0, 0))
+    assert client.get('/uploads/images/abc.jpg').headers['ETag'] == etag
+
+
+def test_upload_offload_modes(app, client, upload_file):
+    """X-Accel-Redirect / X-Sendfile モードで本体を送らずプロキシに転送を任せるかテスト"""
+    app.config['UPLOAD_SEND_FILE_MODE'] = 'x-accel'
+    response = client.get('/uploads/images/abc.jpg')
+    assert response.headers['X-Accel-Redirect'] == '/_uploads/images/abc.jpg'
+    assert response.data == b''
+    assert response.mimetype == 'image/jpeg'
+    assert client.get('/uploads/images/abc.jpg',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    app.config['UPLOAD_SEND_FILE_MODE'] = 'x-sendfile'
+    response = client.get('/uploads/images/abc.jpg')
+    assert response.headers['X-Sendfile'] == str(upload_file)
+    assert response.data == b''
+
+
+def test_upload_rejects_missing_and_traversal(client, upload_file):
+    """存在しないファイルやディレクトリ外へのパスは 404 になるかテスト"""
+    assert client.get('/uploads/images/missing.jpg').status_code == 404
+    assert client.get('/uploads/images/../secret.txt').status_code == 404
+    assert client.get('/uploads/images/%2e%2e/secret.txt').status_code == 404
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# tests/test_page_cache.py
+import pytest
+
+import config
+from app import db
+from app.models import Post, Comment, User
+from app.page_cache import MemoryPageCache, FileSystemPageCache, create_page_cache
+
+
+@pytest.fixture(params=['memory', 'filesystem'])
+def page_cache(request, app, tmp_path):
+    """ページキャッシュを有効にするフィクスチャ (両方のバックエンドで実行)"""
+    saved = app.extensions.get('page_cache')
+    if request.param == 'memory':
+        cache = MemoryPageCache(max_bytes=1024 * 1024)
+    else:
+        cache = FileSystemPageCache(str(tmp_path / 'page_cache'))
+    app.extensions['page_cache'] = cache
+    yield cache
+    app.extensions['page_cache'] = saved
+
+
+@pytest.fixture
+def post(author):
+    post = Post(title='キャッシュ記事', body='本文', posted_by=author, is_published=True)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_anonymous_pages_are_served_from_cache(client, page_cache, post, assert_max_queries):
+    """2回目以降の匿名アクセスはクエリを発行せずキャッシュから返すかテスト"""
+    for url in ('/', f'/post/{post.id}', '/posts/list'):
+        first = client.get(url)
+        assert first.status_code == 200
+        assert first.headers['X-Page-Cache'] == 'MISS'
+
+        with assert_max_queries(0):
+            second = client.get(url)
+        assert second.headers['X-Page-Cache'] == 'HIT'
+        assert second.data == first.data
+
+
+def test_query_string_is_part_of_key(client, page_cache, post):
+    """クエリ文字列が異なるページは別々にキャッシュされるかテスト"""
+    client.get('/?page=1')
+    assert client.get('/?page=2').headers['X-Page-Cache'] == 'MISS'
+    assert client.get('/?page=1').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_commit_invalidates_cache(client, page_cache, post):
+    """記事やコメントの変更がコミットされるとキャッシュが破棄されるかテスト"""
+    client.get('/')
+    post.title = '更新後のタイトル'
+    db.session.commit()
+
+    response = client.get('/')
+    assert response.headers['X-Page-Cache'] == 'MISS'
+    assert '更新後のタイトル' in response.data.decode('utf-8')
+
+    client.get(f'/post/{post.id}')
+    db.session.add(Comment(body='承認済み', author_name='author', user_id=post.user_id, post_id=post.id, is_approved=True))
+    db.session.commit()
+    response = client.get(f'/post/{post.id}')
+    assert response.headers['X-Page-Cache'] == 'MISS'
+    assert '承認済み' in response.data.decode('utf-8')
+
+
+def test_unrelated_commit_keeps_cache(client, page_cache, post):
+    """公開ページに関係しないテーブルの変更ではキャッシュを破棄しないかテスト"""
+    client.get('/')
+    user = User(username='other', email='other@example.com')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    assert client.get('/').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_author_rename_invalidates_cache(client, page_cache, post, author):
+    """投稿者名の変更ではキャッシュを破棄し、ログインの記録の更新では破棄しないかテスト"""
+    db.session.add(Comment(body='コメント', author_name=author.username, user_id=author.id, post_id=post.id,
+                           is_approved=True))
+    db.session.commit()
+    client.get(f'/post/{post.id}')
+    author.login_count = (author.login_count or 0) + 1
+    db.session.commit()
+    assert client.get(f'/post/{post.id}').headers['X-Page-Cache'] == 'HIT'
+
+    author.username = 'renamed_author'
+    db.session.commit()
+    response = client.get(f'/post/{post.id}')
+    assert response.headers['X-Page-Cache'] == 'MISS'
+    assert 'renamed_author' in response.data.decode('utf-8')
+
+
+def test_bulk_update_invalidates_cache(client, page_cache, post):
+    """Query.update() による一括変更でもキャッシュが破棄されるかテスト"""
+    client.get('/')
+    Post.query.filter_by(id=post.id).update({'is_published': False}, synchronize_session=False)
+    db.session.commit()
+    response = client.get('/')
+    assert response.headers['X-Page-Cache'] == 'MISS'
+    assert 'キャッシュ記事' not in response.data.decode('utf-8')
+
+
+def test_pending_flash_bypasses_cache(client, page_cache, post):
+    """フラッシュメッセージの表示待ちがあるリクエストにはキャッシュを使わないかテスト"""
+    client.get('/')
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('info', 'お知らせ')]
+    response = client.get('/')
+    assert 'X-Page-Cache' not in response.headers
+    assert 'お知らせ' in response.data.decode('utf-8')
+
+
+def test_logged_in_users_bypass_cache(client, page_cache, post, author):
+    """ログイン中のユーザーにはキャッシュを使わず、応答も保存しないかテスト"""
+    with client.session_transaction() as sess:
+        sess['_user_id'] = author.fs_uniquifier
+        sess['_fresh'] = True
+    for _ in range(2):
+        response = client.get('/')
+        assert 'X-Page-Cache' not in response.headers
+        assert author.username in response.data.decode('utf-8')
+
+
+def test_memory_cache_evicts_least_recently_used():
+    """合計サイズの上限を超えると最も古く使われたエントリから破棄するかテスト"""
+    cache = MemoryPageCache(max_bytes=10)
+    entry = lambda body: {'status': 200, 'headers': [], 'body': body, 'expires': None}
+    cache.set('a', entry(b'1234'))
+    cache.set('b', entry(b'1234'))
+    assert cache.get('a') is not None
+    cache.set('c', entry(b'1234'))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    cache.set('huge', entry(b'x' * 11))
+    assert cache.get('huge') is None
+
+
+def test_filesystem_cache_shared_between_instances(tmp_path):
+    """ファイルシステムのキャッシュが別インスタンス (別プロセス) と共有され、破棄も反映されるかテスト"""
+    writer = FileSystemPageCache(str(tmp_path))
+    reader = FileSystemPageCache(str(tmp_path))
+    key = f'{writer.generation()}:/?'
+    writer.set(key, {'status': 200, 'headers': [], 'body': b'<html>', 'expires': None})
+    assert reader.get(key)['body'] == b'<html>'
+
+    reader.clear()
+    assert writer.generation() == 1
+    assert writer.get(key) is None
+
+
+def test_cached_page_answers_conditional_requests(client, page_cache, post, assert_max_queries):
+    """キャッシュ済みのページは保存した ETag で、クエリなしに 304 を返すかテスト"""
+    etag = client.get('/').headers['ETag']
+    with assert_max_queries(0):
+        response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['X-Page-Cache'] == 'HIT'
+
+
+def test_pages_are_cached_with_csrf_enabled(app, page_cache, post, monkeypatch):
+    """CSRF 保護が有効でも、初めてアクセスする匿名ユーザーのページを (Cookie なしで) キャッシュするかテスト"""
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', True)
+    for url in ('/', f'/post/{post.id}'):
+        first = app.test_client().get(url)
+        assert first.status_code == 200
+        assert first.headers['X-Page-Cache'] == 'MISS'
+        assert 'Set-Cookie' not in first.headers
+
+        second = app.test_client().get(url)
+        assert second.headers['X-Page-Cache'] == 'HIT'
+
+
+def test_default_backend_is_shared_between_processes(tmp_path):
+    """既定の設定では複数プロセスで破棄を共有できるファイルシステムのキャッシュを使うかテスト"""
+    settings = {'PAGE_CACHE_BACKEND': config.Config.PAGE_CACHE_BACKEND, 'PAGE_CACHE_DIR': str(tmp_path)}
+    assert isinstance(create_page_cache(settings), FileSystemPageCache)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# tests/test_post_bulk.py
+import pytest
+
+from app import db
+from app.models import Category, Post, Tag, User
+from app.post_bulk import KEEP_CATEGORY, bulk_edit_posts
+from app.tag_counts import recount_post_counts
+
+
+@pytest.fixture
+def blog(author):
+    """タグ3件・カテゴリ2件と、公開済み4件・下書き2件の投稿を作成するフィクスチャ"""
+    tags = [Tag(name=f'tag{i}', slug=f'tag{i}', user_id=author.id) for i in range(3)]
+    categories = [Category(name=f'cat{i}', slug=f'cat{i}', user_id=author.id) for i in range(2)]
+    posts = [Post(title=f'投稿{i}', body='本文', posted_by=author, is_published=i < 4,
+                  category=categories[0], tags=[tags[0]] if i % 2 == 0 else []) for i in range(6)]
+    db.session.add_all(tags + categories + posts)
+    db.session.commit()
+    return posts, tags, categories
+
+
+def _tag_names(post):
+    return sorted(tag.name for tag in post.tags)
+
+
+def _assert_counts_match():
+    assert recount_post_counts(db.session.connection()) == {'tags': 0, 'categories': 0}
+
+
+def test_bulk_edit_uses_constant_statements(blog, assert_max_queries):
+    """投稿の件数によらず一定数の SQL 文でタグの追加・削除とカテゴリの変更を行うかテスト"""
+    posts, tags, categories = blog
+    post_ids = [post.id for post in posts]
+    tag_ids = [tag.id for tag in tags]
+    category_id = categories[1].id
+    # 投稿の読み込み + (既存の組の読み込み + executemany + post_count) × 2 + カテゴリと post_count (増・減)
+    with assert_max_queries(10):
+        result = bulk_edit_posts(post_ids, add_tag_ids=tag_ids[1:], remove_tag_ids=tag_ids[:1], category_id=category_id)
+    db.session.commit()
+
+    assert (result.posts, result.tags_added, result.tags_removed, result.categories_changed) == (6, 12, 3, 6)
+    assert all(_tag_names(post) == ['tag1', 'tag2'] and post.category == categories[1] for post in posts)
+    assert [tag.post_count for tag in tags] == [0, 4, 4]
+    assert [category.post_count for category in categories] == [0, 4]
+    _assert_counts_match()
+
+    result = bulk_edit_posts(post_ids, add_tag_ids=[tags[1].id], category_id=KEEP_CATEGORY)
+    assert result.posts == 0  # 変更がなければ何もしない
+
+
+def test_bulk_edit_ignores_posts_of_other_users(blog):
+    """user_id を指定するとその利用者の投稿だけを変更するかテスト"""
+    posts, tags, _ = blog
+    other = User(username='other', email='other@example.com')
+    other.set_password('password123')
+    db.session.add(other)
+    db.session.commit()
+
+    result = bulk_edit_posts([posts[1].id], add_tag_ids=[tags[2].id], user_id=other.id)
+    db.session.commit()
+    assert result.posts == 0
+    assert _tag_names(posts[1]) == []
+
+
+def test_bulk_edit_route(admin_client, blog):
+    """管理画面の一括編集で選択した投稿だけが1つのトランザクションで更新されるかテスト"""
+    posts, tags, categories = blog
+    html = admin_client.get('/admin/posts').get_data(as_text=True)
+    assert 'id="bulkEditForm"' in html and f'value="{posts[0].id}"' in html
+
+    response = admin_client.post('/admin/posts/bulk', data={
+        'post_ids': [str(posts[0].id), str(posts[1].id)],
+        'add_tags': [str(tags[2].id)],
+        'category': 'none',
+        'next': '/admin/posts?status=published',
+    })
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/admin/posts?status=published'
+    db.session.expire_all()
+    assert _tag_names(posts[0]) == ['tag0', 'tag2'] and _tag_names(posts[1]) == ['tag2']
+    assert posts[0].category is None and posts[2].category == categories[0]
+    assert tags[2].post_count == 2
+    _assert_counts_match()
+
+    response = admin_client.post('/admin/posts/bulk', data={'post_ids': str(posts[0].id), 'next': 'https://example.com/'},
+                                 follow_redirects=True)
+    assert 'タグか、変更後のカテゴリを選択してください。' in response.get_data(as_text=True)
+
+
+def test_edit_post_resolves_tags_with_in_query(admin_client, blog):
+    """投稿編集で選んだタグを保存し、何も選ばなければタグを外すかテスト"""
+    posts, tags, categories = blog
+    post = posts[0]
+    data = {'title': '編集', 'body': '本文', 'category': str(categories[1].id),
+            'tags': [str(tags[1].id), str(tags[2].id)]}
+    assert admin_client.post(f'/admin/posts/edit/{post.id}', data=data).status_code == 302
+    db.session.expire_all()
+    assert _tag_names(post) == ['tag1', 'tag2'] and post.category == categories[1]
+
+    del data['tags']
+    assert admin_client.post(f'/admin/posts/edit/{post.id}', data=data).status_code == 302
+    db.session.expire_all()
+    assert _tag_names(post) == []
+    _assert_counts_match()
+
+    data['tags'] = [str(tags[0].id), 'not-a-uuid']
+    html = admin_client.post(f'/admin/posts/edit/{post.id}', data=data).get_data(as_text=True)
+    assert '無効なタグIDです。' in html
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# tests/test_posts.py
+from app import db
+from app.models import Post
+
+
+def _create_post(author, body, **kwargs):
+    post = Post(title='テスト投稿', body=body, posted_by=author, is_published=True, **kwargs)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_render_body_html_caches_markdown(author):
+    """保存時に Markdown が HTML に変換されキャッシュされるかテスト"""
+    post = _create_post(author, '# 見出し\n\n```python\nx = 1\n```')
+    assert post.render_body_html() is True
+    db.session.commit()
+
+    assert '<h1>見出し</h1>' in post.body_html
+    assert 'codehilite' in post.body_html
+    assert post.body_hash is not None
+    # 本文が変わらなければ再変換しない
+    assert post.render_body_html() is False
+
+
+def test_render_body_html_invalidated_on_edit(author):
+    """本文を編集するとキャッシュが無効になり、再保存で更新されるかテスト"""
+    post = _create_post(author, '最初の本文')
+    post.render_body_html()
+    db.session.commit()
+
+    post.body = '**編集後**の本文'
+    assert post.body_rendered != post.body_html # 古いキャッシュは使われない
+    assert '<strong>編集後</strong>' in post.body_rendered
+    assert post.render_body_html() is True
+    assert '<strong>編集後</strong>' in post.body_html
+
+
+def test_post_detail_serves_cached_html(client, author, monkeypatch):
+    """投稿詳細ページがキャッシュ済み HTML を表示し、Markdown 変換を実行しないかテスト"""
+    post = _create_post(author, '*強調*')
+    post.render_body_html()
+    db.session.commit()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Markdown pipeline should not run on read')
+    monkeypatch.setattr('app.models.render_markdown', fail)
+
+    response = client.get(f'/post/{post.id}')
+    assert response.status_code == 200
+    assert '<em>強調</em>'.encode('utf-8') in response.data
+
+
+def test_render_markdown_cli_backfills(runner, author):
+    """flask init render-markdown が未変換の投稿を変換するかテスト"""
+    post = _create_post(author, '## バックフィル')
+    assert post.body_html is None
+
+    result = runner.invoke(args=['init', 'render-markdown'])
+    assert result.exit_code == 0, result.output
+
+    db.session.refresh(post)
+    assert '<h2>バックフィル</h2>' in post.body_html
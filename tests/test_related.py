@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# tests/test_related.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Category, Post, RelatedPost, Tag
+from app.related import refresh_related_posts
+
+
+@pytest.fixture
+def blog(author):
+    """
+    タグ4件・カテゴリ1件と公開済み投稿5件・下書き1件を作成するフィクスチャ
+    (posts[0] とのタグの一致度は posts[1] > posts[2] > posts[3]、posts[4] は何も共有しない)
+    """
+    tags = [Tag(name=f'tag{i}', slug=f'tag{i}', user_id=author.id) for i in range(4)]
+    category = Category(name='cat', slug='cat', user_id=author.id)
+    start = datetime(2025, 1, 1)
+    tag_sets = [[0, 1, 2], [0, 1, 2], [0, 1], [2, 3], [], [0, 1, 2]]
+    posts = [Post(title=f'投稿{i}', body='本文', posted_by=author, is_published=i < 5,
+                  created_at=start + timedelta(days=i), tags=[tags[t] for t in tag_set])
+             for i, tag_set in enumerate(tag_sets)]
+    db.session.add_all(tags + [category] + posts)
+    db.session.commit()
+    return posts, tags, category
+
+
+def _related(post):
+    return [row.related_post.title for row in
+            RelatedPost.query.filter_by(post_id=post.id).order_by(RelatedPost.rank)]
+
+
+def test_scores_by_jaccard_and_category(app, blog):
+    """タグの Jaccard 係数の高い順に並び、同じカテゴリなら加点され、下書きは含まないかテスト"""
+    posts, _, category = blog
+    assert refresh_related_posts() == {'recomputed': 5, 'removed': 0}
+    db.session.commit()
+    assert _related(posts[0]) == ['投稿1', '投稿2', '投稿3']
+    assert _related(posts[4]) == []
+
+    # タグを共有しない posts[4] もカテゴリが同じなら入り、同点 (0.25) なら新しい投稿が先になる
+    posts[0].category = posts[4].category = category
+    db.session.commit()
+    refresh_related_posts()
+    db.session.commit()
+    assert _related(posts[0]) == ['投稿1', '投稿2', '投稿4', '投稿3']
+    assert _related(posts[4]) == ['投稿0']
+
+
+def test_incremental_refresh_only_recomputes_affected_posts(app, blog):
+    """2回目以降は変更された投稿と影響を受ける投稿だけを計算し、非公開にした投稿の一覧を削除するかテスト"""
+    posts, tags, _ = blog
+    refresh_related_posts()
+    db.session.commit()
+    assert refresh_related_posts() == {'recomputed': 0, 'removed': 0}
+
+    posts[4].tags = [tags[3]]  # posts[3] とだけ tag3 を共有する
+    db.session.commit()
+    assert refresh_related_posts() == {'recomputed': 2, 'removed': 0}
+    db.session.commit()
+    assert _related(posts[4]) == ['投稿3']
+    assert _related(posts[3])[0] == '投稿4'  # 1/2 > 1/4
+
+    posts[1].is_published = False
+    db.session.commit()
+    result = refresh_related_posts()
+    db.session.commit()
+    assert result['removed'] == 1
+    assert _related(posts[1]) == []
+    assert '投稿1' not in _related(posts[0])
+
+    assert refresh_related_posts(full=True) == {'recomputed': 4, 'removed': 0}
+
+
+def test_post_detail_shows_related_posts(client, runner, blog, assert_max_queries):
+    """投稿詳細ページに関連記事が表示され、計算し直すと ETag が変わるかテスト"""
+    posts, _, _ = blog
+    url = f'/post/{posts[0].id}'
+    etag = client.get(url).headers['ETag']
+
+    result = runner.invoke(args=['init', 'related-posts'])
+    assert result.exit_code == 0, result.output
+    assert '5 件の投稿の関連記事を計算しました' in result.output
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert '関連記事' in html
+    assert html.index('投稿1') < html.index('投稿2') < html.index('投稿3')
+    assert f'/post/{posts[5].id}' not in html
+
+
+def test_post_detail_reads_related_posts_written_elsewhere(client, blog):
+    """別のプロセスが保存した関連記事も、次の描画でそのまま表示されるかテスト (プロセス内にキャッシュしない)"""
+    posts, _, _ = blog
+    refresh_related_posts()
+    db.session.commit()
+    url = f'/post/{posts[0].id}'
+    assert f'/post/{posts[4].id}"' not in client.get(url).get_data(as_text=True)
+
+    # flask init related-posts を別プロセスで実行した場合と同じく、キャッシュの破棄を経ずに行を書き換える
+    db.session.execute(RelatedPost.__table__.insert(),
+                       [{'post_id': posts[0].id, 'related_post_id': posts[4].id, 'rank': 99, 'score': 0.01}])
+    db.session.commit()
+    assert f'/post/{posts[4].id}"' in client.get(url).get_data(as_text=True)
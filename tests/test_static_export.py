@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# tests/test_static_export.py
+import json
+import os
+
+import pytest
+
+from app import db
+from app.models import Image, ImageVariant, Post, Tag
+from app.static_export import MANIFEST_FILENAME, rewrite_links
+
+
+@pytest.fixture
+def site(author):
+    """公開済み投稿12件 (ページ送りあり)・下書き1件・タグ1件を作成するフィクスチャ"""
+    tag = Tag(name='旅行', slug='travel', user_id=author.id)
+    posts = [Post(title=f'公開{i}', body='本文', posted_by=author, is_published=True, tags=[tag])
+             for i in range(12)]
+    draft = Post(title='下書き', body='本文', posted_by=author, is_published=False)
+    db.session.add_all(posts + [draft])
+    db.session.commit()
+    return posts, draft, tag
+
+
+def _export(runner, output, *args):
+    result = runner.invoke(args=['init', 'export-static', '--output', str(output), '--workers', '1', *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def _manifest(output):
+    with open(output / MANIFEST_FILENAME, encoding='utf-8') as f:
+        return json.load(f)['pages']
+
+
+def test_rewrite_links_uses_static_paths():
+    """?page=N のリンクを静的サイトのパスに書き換えるかテスト"""
+    html = ('<a href="/index?page=2">次</a><a href="/tag/abc?page=1">前</a>'
+            '<a href="/post/x">記事</a><a href="/index">ホーム</a><a href="https://example.com/?page=2">外部</a>')
+    assert rewrite_links(html) == ('<a href="/page/2/">次</a><a href="/tag/abc">前</a>'
+                                   '<a href="/post/x">記事</a><a href="/">ホーム</a>'
+                                   '<a href="https://example.com/?page=2">外部</a>')
+
+
+def test_export_static_writes_public_pages(runner, site, tmp_path):
+    """公開ページ・ページ送り・画像以外の静的ファイルを書き出し、下書きは含めないかテスト"""
+    posts, draft, tag = site
+    output = tmp_path / 'site'
+    out = _export(runner, output)
+
+    index = (output / 'index.html').read_text(encoding='utf-8')
+    assert '公開11' in index
+    assert 'href="/page/2/"' in index
+    assert '公開0' in (output / 'page' / '2' / 'index.html').read_text(encoding='utf-8')
+    assert (output / 'post' / str(posts[0].id) / 'index.html').exists()
+    assert (output / 'tag' / str(tag.id) / 'page' / '2' / 'index.html').exists()
+    assert not (output / 'post' / str(draft.id)).exists()
+    assert (output / 'tags' / 'index.html').exists()
+    assert (output / 'static' / 'css' / 'style.css').exists()
+    assert not (output / 'static' / 'uploads').exists()
+    assert '17 ページを描画しました' in out
+
+
+def test_export_static_is_incremental(runner, site, tmp_path):
+    """2回目は変更のあったページだけを描画し、非公開にした投稿のページを削除するかテスト"""
+    posts, _, tag = site
+    output = tmp_path / 'site'
+    _export(runner, output)
+    detail = os.path.join('post', str(posts[0].id), 'index.html')
+    assert detail in _manifest(output)
+
+    assert '0 ページを描画しました (変更なし: 17 ページ' in _export(runner, output)
+
+    # 最も古い投稿は2ページ目にのみ掲載される (詳細・トップ2ページ目・タグ2ページ目)
+    posts[0].title = '編集済み'
+    db.session.commit()
+    assert '3 ページを描画しました' in _export(runner, output)
+    assert '編集済み' in (output / 'page' / '2' / 'index.html').read_text(encoding='utf-8')
+
+    posts[1].is_published = False
+    db.session.commit()
+    out = _export(runner, output)
+    assert '削除: 1 ページ' in out
+    assert not os.path.exists(output / 'post' / str(posts[1].id))
+
+    assert '16 ページを描画しました' in _export(runner, output, '--force')
+
+
+def test_export_static_tracks_thumbnails_and_variants(runner, site, author, tmp_path):
+    """サムネイルの生成は掲載ページと詳細を、派生画像の追加は詳細だけを再描画するかテスト"""
+    posts, _, _ = site
+    image = Image(original_filename='a.jpg', unique_filename='a.jpg', filepath='uploads/images/a.jpg',
+                  user_id=author.id, thumbnail_status='pending')
+    posts[-1].main_image = image
+    db.session.add(image)
+    db.session.commit()
+    output = tmp_path / 'site'
+    _export(runner, output)
+
+    # 最新の投稿は詳細・トップ1ページ目・タグ1ページ目に掲載される
+    image.thumbnail_status = 'ready'
+    db.session.commit()
+    assert '3 ページを描画しました' in _export(runner, output)
+
+    db.session.add(ImageVariant(image_id=image.id, format='webp', width=480, height=360, filename='a-480.webp'))
+    db.session.commit()
+    assert '1 ページを描画しました' in _export(runner, output)
+
+
+def test_export_static_tracks_tag_names(runner, site, tmp_path):
+    """タグ名を変更すると、そのタグを表示する詳細・一覧のページが再描画されるかテスト"""
+    _, _, tag = site
+    output = tmp_path / 'site'
+    _export(runner, output)
+
+    tag.name = '旅'
+    db.session.commit()
+    # 詳細12件・トップ2ページ・タグ別2ページ・タグクラウド
+    assert '17 ページを描画しました' in _export(runner, output)
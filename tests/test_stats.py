@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# tests/test_stats.py
+import pytest
+
+from app import db
+from app.models import Post, Comment, Role, SiteStat, User
+from app.stats import count_live, count_statements, get_stats, recount_stats
+
+
+@pytest.fixture
+def site_stats(author):
+    """現在の件数で site_stat を作成するフィクスチャ"""
+    recount_stats(db.session.connection())
+    db.session.commit()
+    return author
+
+
+def _actual_counts():
+    return {name: db.session.execute(stmt).scalar() for name, stmt in count_statements().items()}
+
+
+def _stored_counts():
+    return dict(db.session.query(SiteStat.name, SiteStat.value))
+
+
+def test_counters_follow_inserts_updates_and_deletes(site_stats):
+    """投稿・コメントの追加・公開状態の変更・削除に合わせて集計値が増減するかテスト"""
+    author = site_stats
+    draft = Post(title='下書き', body='本文', posted_by=author, is_published=False)
+    published = Post(title='公開', body='本文', posted_by=author, is_published=True)
+    db.session.add_all([draft, published])
+    db.session.flush()
+    db.session.add(Comment(body='コメント', author_name='author', user_id=author.id, post_id=published.id))
+    db.session.commit()
+    assert _stored_counts() == _actual_counts()
+    assert _stored_counts()['published_posts'] == 1
+
+    draft.is_published = True
+    db.session.commit()
+    assert _stored_counts()['published_posts'] == 2
+
+    db.session.delete(published)  # コメントも cascade で削除される
+    db.session.commit()
+    assert _stored_counts() == _actual_counts() == {
+        'posts': 1, 'published_posts': 1, 'comments': 0, 'users': 1, 'admins': 0,
+    }
+
+
+def test_rollback_discards_counter_changes(site_stats):
+    """ロールバックされた変更は集計値に反映されないかテスト"""
+    db.session.add(Post(title='取り消し', body='本文', posted_by=site_stats, is_published=True))
+    db.session.flush()
+    db.session.rollback()
+    assert _stored_counts() == _actual_counts()
+
+
+def test_bulk_update_recounts(site_stats):
+    """Query.update() による一括変更の後は数え直されるかテスト"""
+    db.session.add_all([Post(title=f'投稿{i}', body='本文', posted_by=site_stats) for i in range(3)])
+    db.session.commit()
+    Post.query.update({'is_published': True}, synchronize_session=False)
+    db.session.commit()
+    assert _stored_counts()['published_posts'] == 3
+
+
+def test_admin_counter_and_last_admin_guard(site_stats):
+    """管理者ロールの付与・解除で管理者数が増減するかテスト"""
+    admin_role = Role(name='admin')
+    db.session.add(admin_role)
+    site_stats.roles.append(admin_role)
+    other = User(username='second', email='second@example.com', roles=[admin_role])
+    other.set_password('password123')
+    db.session.add(other)
+    db.session.commit()
+    assert _stored_counts()['admins'] == 2
+
+    other.roles.remove(admin_role)
+    db.session.commit()
+    assert _stored_counts()['admins'] == 1
+
+    other.roles.append(admin_role)
+    db.session.commit()
+    db.session.delete(other)
+    db.session.commit()
+    assert _stored_counts() == _actual_counts()
+    assert _stored_counts()['admins'] == 1
+
+
+def test_count_live_ignores_drifted_counter(site_stats):
+    """最後の管理者の確認に使う count_live は、ずれた site_stat ではなく実際の件数を返すかテスト"""
+    admin_role = Role(name='admin')
+    db.session.add(admin_role)
+    site_stats.roles.append(admin_role)
+    db.session.commit()
+    SiteStat.query.filter_by(name='admins').update({'value': 5})
+    db.session.commit()
+    assert get_stats()['admins'] == 5
+    assert count_live('admins') == 1
+
+
+def test_get_stats_reads_one_query(site_stats, assert_max_queries):
+    """ダッシュボードの集計値は site_stat を1回読むだけで取得できるかテスト"""
+    with assert_max_queries(1):
+        stats = get_stats()
+    assert stats['users'] == 1
+
+
+def test_recount_cli_repairs_drift(runner, site_stats):
+    """flask init recount がずれた集計値を修復するかテスト"""
+    db.session.get(SiteStat, 'users').value = 42
+    db.session.commit()
+
+    result = runner.invoke(args=['init', 'recount'])
+    assert result.exit_code == 0, result.output
+    assert 'users: 1' in result.output
+    db.session.expire_all()
+    assert _stored_counts() == _actual_counts()
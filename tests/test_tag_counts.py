@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# tests/test_tag_counts.py
+import pytest
+from sqlalchemy import update
+
+from app import db
+from app.models import Category, Post, Tag, post_tags
+from app.tag_counts import recount_post_counts, tag_cloud
+
+
+@pytest.fixture
+def taxonomy(author):
+    """タグ3件とカテゴリ2件を作成するフィクスチャ"""
+    tags = [Tag(name=f'tag{i}', slug=f'tag{i}', user_id=author.id) for i in range(3)]
+    categories = [Category(name=f'cat{i}', slug=f'cat{i}', user_id=author.id) for i in range(2)]
+    db.session.add_all(tags + categories)
+    db.session.commit()
+    return tags, categories
+
+
+def _stored():
+    return ({tag.name: tag.post_count for tag in Tag.query},
+            {category.name: category.post_count for category in Category.query})
+
+
+def _assert_counts_match():
+    """保存された値が数え直した結果と一致することを確認し、保存された値を返します。"""
+    db.session.expire_all()
+    stored = _stored()
+    assert recount_post_counts(db.session.connection()) == {'tags': 0, 'categories': 0}
+    return stored
+
+
+def test_counts_follow_post_changes(author, taxonomy):
+    """投稿の追加・公開・タグやカテゴリの付け替え・削除に合わせて件数が増減するかテスト"""
+    tags, categories = taxonomy
+    published = Post(title='公開', body='本文', posted_by=author, is_published=True,
+                     category=categories[0], tags=[tags[0], tags[1]])
+    draft = Post(title='下書き', body='本文', posted_by=author, is_published=False,
+                 category=categories[0], tags=[tags[0]])
+    db.session.add_all([published, draft])
+    db.session.commit()
+    assert _assert_counts_match() == ({'tag0': 1, 'tag1': 1, 'tag2': 0}, {'cat0': 1, 'cat1': 0})
+
+    draft.is_published = True
+    draft.tags.append(tags[2])
+    db.session.commit()
+    assert _assert_counts_match() == ({'tag0': 2, 'tag1': 1, 'tag2': 1}, {'cat0': 2, 'cat1': 0})
+
+    published.tags.remove(tags[0])
+    published.category = categories[1]
+    db.session.commit()
+    assert _assert_counts_match() == ({'tag0': 1, 'tag1': 1, 'tag2': 1}, {'cat0': 1, 'cat1': 1})
+
+    db.session.expire_all()  # 未読み込みの属性を変更しても変更前の値で減算する
+    draft.category_id = categories[1].id
+    draft.is_published = False
+    db.session.commit()
+    assert _assert_counts_match() == ({'tag0': 0, 'tag1': 1, 'tag2': 0}, {'cat0': 0, 'cat1': 1})
+
+    db.session.delete(published)
+    db.session.commit()
+    assert _assert_counts_match() == ({'tag0': 0, 'tag1': 0, 'tag2': 0}, {'cat0': 0, 'cat1': 0})
+
+
+def test_rollback_and_bulk_changes(author, taxonomy):
+    """ロールバックは件数に反映されず、一括変更の後は数え直されるかテスト"""
+    tags, categories = taxonomy
+    post = Post(title='公開', body='本文', posted_by=author, is_published=True, tags=[tags[0]])
+    db.session.add(post)
+    db.session.flush()
+    db.session.rollback()
+    assert _assert_counts_match()[0]['tag0'] == 0
+
+    post = Post(title='下書き', body='本文', posted_by=author, is_published=False, tags=[tags[0]])
+    db.session.add(post)
+    db.session.commit()
+    db.session.execute(update(Post).values(is_published=True))
+    db.session.execute(post_tags.insert(), [{'post_id': post.id, 'tag_id': tags[1].id}])
+    db.session.commit()
+    assert _assert_counts_match()[0] == {'tag0': 1, 'tag1': 1, 'tag2': 0}
+
+
+def test_recount_repairs_drift(runner, author, taxonomy):
+    """flask init recount-tags でずれた値を修復するかテスト"""
+    tags, _ = taxonomy
+    db.session.add(Post(title='公開', body='本文', posted_by=author, is_published=True, tags=[tags[0]]))
+    db.session.commit()
+    db.session.execute(Tag.__table__.update().values(post_count=7))
+    db.session.commit()
+
+    result = runner.invoke(args=['init', 'recount-tags'])
+    assert result.exit_code == 0, result.output
+    assert 'タグ 3 件' in result.output
+    db.session.expire_all()
+    assert _stored()[0] == {'tag0': 1, 'tag1': 0, 'tag2': 0}
+
+
+def test_tag_cloud_page(client, author, taxonomy, assert_max_queries):
+    """タグクラウドは件数の多いタグほど重みが大きく、件数0のタグは表示しないかテスト"""
+    tags, _ = taxonomy
+    db.session.add_all([Post(title=f'投稿{i}', body='本文', posted_by=author, is_published=True,
+                             tags=[tags[0]] + ([tags[1]] if i == 0 else [])) for i in range(8)])
+    db.session.commit()
+
+    assert [(tag.name, weight) for tag, weight in tag_cloud()] == [('tag0', 5), ('tag1', 1)]
+
+    client.get('/tags')
+    with assert_max_queries(2):  # 検証用の値 + タグの読み込み
+        response = client.get('/tags')
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'tag-weight-5' in html and '#tag1' in html and '#tag2' not in html
+
+    assert client.get('/tags', headers={'If-None-Match': response.headers['ETag']}).status_code == 304